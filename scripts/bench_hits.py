@@ -0,0 +1,84 @@
+# scripts/bench_hits.py
+# Query + prompt assembly at large k: lazy Hit objects vs. the old per-hit dict rebuilding
+
+from __future__ import annotations
+import time
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from rag.indexer import HnswIndex
+from rag.interfaces import Hit
+from rag.prompt import PromptOptions, build_prompts
+from scripts.bench_index import synthetic_corpus
+
+
+def rich_metas(n: int, text_chars: int = 600) -> List[Dict[str, Any]]:
+    body = ("Check for danger, check for a response, open the airway and check breathing. " * 20)[:text_chars]
+    return [
+        {
+            "id": f"{i:016x}", "source": f"module_{i % 40}.md", "title": f"Module {i % 40}",
+            "section": f"{i % 12}.{i % 7}", "page": i % 300, "year": 2021 + i % 4,
+            "tags": ["cpr", "aed", "adult"][: 1 + i % 3], "author": "ERC course team", "lang": "en",
+            "text": f"[{i}] {body}",
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_dicts(hits: List[Hit]) -> List[Dict[str, Any]]:
+    """What HnswIndex.query returned before Hit: a fresh dict per hit, full row decoded and copied."""
+    out = []
+    for h in hits:
+        m = h._rows[h._row]
+        out.append({"text": m["text"], "meta": {k: v for k, v in m.items() if k != "text"}, "score": h.score})
+    return out
+
+
+def _p50_ms(fn: Callable[[int], Any], n: int) -> float:
+    times = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - t0)
+    return float(np.percentile(times, 50) * 1e3)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark hit objects on the query path")
+    ap.add_argument("--n", type=int, default=20_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=50)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--max-context-chars", type=int, default=3000)
+    args = ap.parse_args()
+
+    corpus = synthetic_corpus(args.n, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+    opts = PromptOptions(max_context_chars=args.max_context_chars)
+    with tempfile.TemporaryDirectory() as d:
+        built = HnswIndex(initial_capacity=args.n)
+        built.build(dim=args.dim, space="cosine")
+        built.upsert_array(corpus, rich_metas(args.n))
+        built.save(d)
+        idx = HnswIndex()
+        idx.load(d)  # memory-mapped MetaStore, as in the server
+
+        q = lambda i: idx.query_array(queries[i], k=args.k)
+        cases = {
+            "query (Hit)": q,
+            "query (dicts)": lambda i: legacy_dicts(q(i)),
+            "query+prompt (Hit)": lambda i: build_prompts("What next?", q(i), opts),
+            "query+prompt (dicts)": lambda i: build_prompts("What next?", legacy_dicts(q(i)), opts),
+        }
+        print(f"n={args.n} dim={args.dim} k={args.k}")
+        print(f"{'case':>22} {'p50_ms':>8}")
+        for name, fn in cases.items():
+            fn(0)  # warm-up
+            print(f"{name:>22} {_p50_ms(fn, args.queries):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
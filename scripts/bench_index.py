@@ -0,0 +1,95 @@
+# scripts/bench_index.py
+# FlatIndex / Int8Index vs HnswIndex across corpus sizes: build time, latency, throughput, memory, recall@k
+
+from __future__ import annotations
+import time
+import argparse
+from typing import Any, Dict, List
+
+import numpy as np
+
+from rag.indexer import FlatIndex, HnswIndex, Int8Index
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Normalized vectors drawn around a few centroids (closer to real embeddings than pure noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _labels(hits: List[Dict[str, Any]]) -> List[int]:
+    return [h["meta"]["i"] for h in hits]
+
+
+def _memory_mb(idx: Any) -> float:
+    if isinstance(idx, HnswIndex):
+        return idx.index.index_file_size() / 1e6  # graph links + float32 vectors
+    return idx.memory_bytes() / 1e6
+
+
+def bench_one(n: int, dim: int, k: int, n_queries: int, ef: int, M: int) -> List[Dict[str, Any]]:
+    corpus = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(n_queries, dim, seed=1)
+    metas = [{"i": i, "text": ""} for i in range(n)]
+    rows: List[Dict[str, Any]] = []
+    exact = None
+    backends = (
+        ("flat", FlatIndex()),  # first: exact reference for recall
+        ("hnsw", HnswIndex(M=M, ef=ef, initial_capacity=n)),
+        ("int8", Int8Index(rerank=0)),
+        ("int8+rr4", Int8Index(rerank=4)),
+    )
+    for name, idx in backends:
+        t0 = time.perf_counter()
+        idx.build(dim=dim, space="cosine")
+        idx.upsert_array(corpus, metas)
+        build_s = time.perf_counter() - t0
+
+        lat = []
+        for q in queries:
+            t0 = time.perf_counter()
+            idx.query_array(q, k=k)
+            lat.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        batch = idx.query_batch(queries, k=k)
+        batch_s = time.perf_counter() - t0
+
+        got = [_labels(h) for h in batch]
+        if exact is None:
+            exact = got  # flat runs first and is exact
+        recall = np.mean([len(set(a) & set(b)) / float(k) for a, b in zip(exact, got)])
+        rows.append({
+            "n": n,
+            "backend": name,
+            "build_s": build_s,
+            "p50_ms": 1000 * float(np.percentile(lat, 50)),
+            "p95_ms": 1000 * float(np.percentile(lat, 95)),
+            "batch_qps": n_queries / batch_s if batch_s > 0 else 0.0,
+            "mem_mb": _memory_mb(idx),
+            f"recall@{k}": float(recall),
+        })
+    return rows
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark FlatIndex against HnswIndex")
+    ap.add_argument("--sizes", default="1000,5000,20000,50000,100000")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--ef", type=int, default=128)
+    ap.add_argument("--M", type=int, default=16)
+    args = ap.parse_args()
+
+    print(f"{'n':>8} {'backend':>8} {'build_s':>8} {'p50_ms':>7} {'p95_ms':>7} {'batch_qps':>10} {'mem_mb':>8} {'recall':>7}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        for r in bench_one(n, args.dim, args.k, args.queries, args.ef, args.M):
+            print(f"{r['n']:>8} {r['backend']:>8} {r['build_s']:>8.3f} {r['p50_ms']:>7.3f} {r['p95_ms']:>7.3f} "
+                  f"{r['batch_qps']:>10.0f} {r['mem_mb']:>8.2f} {r[f'recall@{args.k}']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
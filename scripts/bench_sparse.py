@@ -0,0 +1,47 @@
+# scripts/bench_sparse.py
+# BM25 side of hybrid retrieval: build time and per-query latency on a synthetic Zipf-distributed corpus
+
+from __future__ import annotations
+import time
+import argparse
+from typing import List
+
+import numpy as np
+
+from rag.sparse import SparseIndex, fuse
+
+
+def zipf_texts(n: int, words_per_chunk: int = 60, vocab: int = 30_000, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    ids = np.minimum(rng.zipf(1.1, size=(n, words_per_chunk)), vocab) - 1
+    return [" ".join(f"w{i}" for i in row) for row in ids]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the BM25 index")
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--terms", type=int, default=4)
+    ap.add_argument("--k", type=int, default=50)
+    args = ap.parse_args()
+
+    texts = zipf_texts(args.n)
+    t0 = time.perf_counter()
+    idx = SparseIndex.build(np.arange(args.n), texts)
+    print(f"n={args.n} terms={len(idx.terms)} postings={idx.docs.shape[0]} build_s={time.perf_counter() - t0:.2f}")
+
+    # keyword-style queries: mid-frequency terms, like "AED pad placement child"
+    rng = np.random.default_rng(1)
+    queries = [" ".join(f"w{i}" for i in rng.integers(10, 3000, size=args.terms)) for _ in range(args.queries)]
+    idx.search(queries[0], args.k)  # warm-up
+    times = []
+    for q in queries:
+        t = time.perf_counter()
+        labels, scores = idx.search(q, args.k)
+        fuse([(int(l), 0.0) for l in labels[::-1]], list(zip(labels.tolist(), scores.tolist())))
+        times.append(time.perf_counter() - t)
+    print(f"search+fuse p50_ms={np.percentile(times, 50) * 1e3:.3f} p99_ms={np.percentile(times, 99) * 1e3:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,374 @@
 from __future__ import annotations
-import os, json
-from typing import List, Dict, Any
+import os, json, time, shutil
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
 from rag.chunk import ParagraphChunker
 from rag.custom_chunk import CustomChunker
-from rag.embed import SBertEmbeddings
-from rag.indexer import HnswIndex
+from rag.embed import load_embedder, ProcessPoolEmbeddings
+from rag.embed_cache import EmbeddingCache, embed_cached
+from rag.indexer import (
+    HnswIndex, FlatIndex, Int8Index, ShardedIndex, FLAT_MAX_CHUNKS, choose_backend, chunk_label, open_index,
+)
+from rag.manifest import read_manifest
+from rag.projection import Projection, recall_at_k
+from rag.sparse import SparseIndex
+from rag.publish import current_version, prune_versions, publish_version, resolve_index_dir, stage_version
+from rag.ingest_state import (
+    DOC_SUFFIXES, chunk_hash, diff_chunks, doc_entry, load_state, save_state, scan_docs, text_sha1,
+)
 
 def read_docs(docs_dir: str) -> List[Dict[str, Any]]:
     items = []
     for name in os.listdir(docs_dir):
         p = os.path.join(docs_dir, name)
         if not os.path.isfile(p): continue
-        if not name.lower().endswith((".txt", ".md")): continue
+        if not name.lower().endswith(DOC_SUFFIXES): continue
         with open(p, "r", encoding="utf-8") as f:
             txt = f.read()
-        items.append({"source": name, "text": txt})
+        items.append({"source": name, "text": txt, "mtime": os.path.getmtime(p)})
     return items
 
+def chunk_doc(chunker, doc: Dict[str, Any], index_value: str):
+    """Chunks of one document as (metas, embedded texts, stable labels, {label: chunk_hash})."""
+    metas: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    labels: List[int] = []
+    hashes: Dict[int, str] = {}
+    for c in chunker.split(doc["text"], meta={"source": doc["source"]}):
+        label = chunk_label(c["id"], doc["source"])
+        if label in hashes:  # identical chunk repeated within the document: index it once
+            continue
+        hashes[label] = chunk_hash(c["text"], c[index_value])
+        metas.append({"id": c["id"], "source": doc["source"], "text": c["text"]})
+        texts.append(c[index_value])
+        labels.append(label)
+    return metas, texts, labels, hashes
+
 def build_erc_index(
     docs_dir: str = "data/docs",
     out_dir: str = "data/index",
     model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
     target_chars: int = 400,
     custom_chunker: bool = False, 
-) -> None:
+    cache_dir: Optional[str] = "data/embed_cache",
+    cache_max_entries: int = 500_000,
+    batch_size: int = 64,
+    workers: int = 1,
+    threads_per_worker: Optional[int] = None,
+    reduce_dim: Optional[int] = None,
+    reduce_method: str = "pca",
+    index_threads: int = -1,
+    index_backend: str = "auto",
+    flat_max_chunks: int = FLAT_MAX_CHUNKS,
+    incremental: bool = False,
+    shards: int = 1,
+    shard_by: str = "source",
+    publish: bool = False,
+    keep_versions: int = 3,
+    sparse: bool = True,
+) -> Dict[str, Any]:
+    if publish:
+        # build into a fresh out_dir/versions/<id>/ (incremental: hard-linked copy of the live
+        # version), then flip out_dir/CURRENT; a running server never sees a half-written index
+        version = stage_version(out_dir, base=resolve_index_dir(out_dir) if incremental else None)
+        try:
+            summary = build_erc_index(
+                docs_dir, version, model_name, target_chars=target_chars, custom_chunker=custom_chunker,
+                cache_dir=cache_dir, cache_max_entries=cache_max_entries, batch_size=batch_size, workers=workers,
+                threads_per_worker=threads_per_worker, reduce_dim=reduce_dim, reduce_method=reduce_method,
+                index_threads=index_threads, index_backend=index_backend, flat_max_chunks=flat_max_chunks,
+                incremental=incremental, shards=shards, shard_by=shard_by, sparse=sparse,
+            )
+        except BaseException:
+            shutil.rmtree(version, ignore_errors=True)
+            raise
+        if summary["mode"] == "incremental" and not (summary["chunks_upserted"] or summary["chunks_deleted"]):
+            shutil.rmtree(version, ignore_errors=True)  # nothing changed: keep serving the current version
+            return summary
+        publish_version(out_dir, version)
+        summary["published"] = os.path.basename(version)
+        summary["pruned_versions"] = len(prune_versions(out_dir, keep=keep_versions))
+        return summary
+
+    live = current_version(out_dir)
+    if live is not None:
+        # loaders follow CURRENT: a build written next to versions/ would never be served, and
+        # --incremental would find no manifest at the root and silently rebuild everything
+        raise ValueError(
+            f"{out_dir} is a published index root (CURRENT -> {live}); "
+            "pass --publish to build a new version, or a different --out"
+        )
+
     print(f"custom chunker: {custom_chunker}")
 
     os.makedirs(out_dir, exist_ok=True)
-    docs = read_docs(docs_dir)
     chunker = None
 
     if(custom_chunker):
         chunker = CustomChunker()        
     else:
         chunker = ParagraphChunker(target_chars=target_chars)
-        
+    chunker_info = {"type": "custom"} if custom_chunker else {"type": "paragraph", "target_chars": target_chars}
+
+    index_value = None
+    if custom_chunker:
+        index_value = "question"
+    else:
+        index_value = "text"
 
-    embedder = SBertEmbeddings(model_name=model_name)
-    dim_probe = len(embedder.embed_one("probe"))
+    def make_embedder():
+        if workers > 1:
+            # one model per worker process; batches are sharded across them
+            return ProcessPoolEmbeddings(model_name, workers=workers, threads_per_worker=threads_per_worker)
+        return load_embedder(model_name)
 
-    print(f"dim_probe: {dim_probe}")
-    
-    index = HnswIndex()
-    index.build(dim=dim_probe, space="cosine")
+    def make_cache():
+        # on-disk vector cache: unchanged chunks are not re-encoded on the next ingest
+        if cache_dir:
+            return EmbeddingCache(os.path.join(cache_dir, "embeddings.sqlite"), max_entries=cache_max_entries)
+        return None
 
-    vectors: List[List[float]] = []
-    metas: List[Dict[str, Any]] = []
+    if incremental:
+        reason = _incremental_blocker(
+            out_dir, model_name, chunker_info, reduce_dim, reduce_method, index_backend, shards, shard_by,
+        )
+        if reason is None:
+            return _update_index(
+                docs_dir, out_dir, model_name, chunker, index_value, make_embedder, make_cache, batch_size, sparse,
+            )
+        print(f"incremental ingest not possible ({reason}); rebuilding")
 
-    # Store index header in the first meta row for reload
-    header_written = False  
+    docs = read_docs(docs_dir)
+    cache = make_cache()
+    metas: List[Dict[str, Any]] = []
 
     print("="*20)
     print(len(docs), "documents to index")
     print("="*20)
 
-    index_value = None
-    if custom_chunker:
-        index_value = "question"
-    else:
-        index_value = "text"
+    # 1) chunk everything first: one bulk embedding stage across all documents
+    texts: List[str] = []
+    labels: List[int] = []
+    state_docs: Dict[str, Any] = {}
+    for d in docs:
+        d_metas, d_texts, d_labels, d_hashes = chunk_doc(chunker, d, index_value)
+        metas.extend(d_metas)
+        texts.extend(d_texts)
+        labels.extend(d_labels)
+        state_docs[d["source"]] = doc_entry(d["mtime"], text_sha1(d["text"]), d_hashes)
 
+    # 2) embed into a preallocated float32 matrix (cache hits + length-sorted batches for misses)
+    embedder = make_embedder()
+    try:
+        dim_probe = len(embedder.embed_one("probe"))
+        print(f"dim_probe: {dim_probe}")
+        vectors = np.empty((len(metas), dim_probe), dtype=np.float32)
+        t0 = time.perf_counter()
+        embed_cached(embedder, texts, cache, model_name, out=vectors, batch_size=batch_size)
+        embed_s = time.perf_counter() - t0
+    finally:
+        _close_embedder(embedder)  # before indexing, and on errors
 
-    for d in docs:
-        chunks = chunker.split(d["text"], meta={"source": d["source"]})
-        texts = [c[index_value] for c in chunks]
-        embs = embedder.embed(texts)
-        for c, v in zip(chunks, embs):
-            m = {"id": c["id"], "source": d["source"], "text": c["text"]}
-            if not header_written:
-                m["_index_header"] = {"dim": dim_probe, "space": "cosine"}
-                header_written = True
-            vectors.append(v)
-            metas.append(m)
-
-    
-
-    index.upsert(vectors, metas)
+    # 3) optional dimensionality reduction (PCA fitted on the corpus, or Matryoshka truncation)
+    projection = None
+    recall = None
+    if reduce_dim and reduce_dim < dim_probe and len(metas) > 0:
+        if reduce_method == "truncate":
+            projection = Projection.truncate(dim_probe, reduce_dim)
+        else:
+            projection = Projection.fit_pca(vectors, reduce_dim)
+        reduced = projection.apply(vectors)
+        recall = recall_at_k(vectors, reduced, k=10)
+        vectors = reduced
+    index_dim = projection.out_dim if projection else dim_probe
+
+    # dim/space/projection/embedder go to manifest.json (written by save) for reload
+    # small corpora: exact brute force beats building a graph (auto = flat up to flat_max_chunks)
+    backend = choose_backend(len(metas), index_backend, flat_max_chunks)
+    capacity = max(-(-len(metas) // max(shards, 1)), 1)  # per shard
+    if shards > 1:
+        # N sub-indexes built in parallel, saved/reloaded on their own (index_threads: per shard)
+        shard_kwargs = {"initial_capacity": capacity}
+        if backend == "hnsw" and index_threads != -1:
+            shard_kwargs["num_threads"] = index_threads
+        index = ShardedIndex(n_shards=shards, partition=shard_by, shard_backend=backend, shard_kwargs=shard_kwargs)
+    elif backend == "flat":
+        index = FlatIndex(initial_capacity=capacity)
+    elif backend == "int8":
+        # only on request: 4x smaller vectors for on-device targets, re-ranked with float32 from disk
+        index = Int8Index(initial_capacity=capacity)
+    else:
+        index = HnswIndex(num_threads=index_threads)
+    index.build(dim=index_dim, space="cosine")
+    index.projection = projection  # saved next to the vectors, applied to queries by Retriever
+    index.embedder_name = model_name
+    index.chunker = chunker_info
+    # stable labels (source + chunk id) let a later --incremental run replace/delete single chunks
+    index.upsert_array(vectors, metas, labels=labels)
+    sparse_s = _build_sparse(index) if sparse else None
     index.save(out_dir)
+    save_state(out_dir, {"docs": state_docs})
+
+    summary: Dict[str, Any] = {
+        "mode": "full",
+        "documents": len(docs),
+        "chunks": len(metas),
+        "batch_size": batch_size,
+        "workers": workers,
+        "embed_seconds": embed_s,
+        "chunks_per_s": (len(metas) / embed_s) if embed_s > 0 else 0.0,
+        "dim": index_dim,
+        "index_backend": backend,
+        "shards": shards,
+        "insert_seconds": index.last_insert.get("seconds", 0.0),
+        "insert_per_s": index.last_insert.get("items_per_s", 0.0),
+    }
+    if sparse_s is not None:
+        summary["sparse_seconds"] = sparse_s
+    if projection:
+        summary["projection"] = f"{projection.method} {dim_probe}->{projection.out_dim}"
+        summary["recall@10_vs_full_dim"] = recall
+    if cache is not None:
+        summary.update(cache.stats())
+        cache.close()
+    _print_summary(summary)
+    return summary
+
+def _close_embedder(embedder) -> None:
+    # embedding worker processes each hold a full model: free them as soon as encoding is done
+    if isinstance(embedder, ProcessPoolEmbeddings):
+        embedder.close()
+
+def _incremental_blocker(
+    out_dir: str,
+    model_name: str,
+    chunker_info: Dict[str, Any],
+    reduce_dim: Optional[int],
+    reduce_method: str,
+    index_backend: str = "auto",
+    shards: int = 1,
+    shard_by: str = "source",
+) -> Optional[str]:
+    """Why the previous build in out_dir cannot be updated in place (None if it can)."""
+    manifest = read_manifest(out_dir)
+    if manifest is None or load_state(out_dir) is None:
+        return "no previous build with ingest state"
+    if manifest.embedder != model_name:
+        return f"embedder changed ({manifest.embedder} -> {model_name})"
+    if manifest.chunker != chunker_info:
+        return "chunker settings changed"
+    prev = manifest.projection
+    if (prev is None) != (not reduce_dim) or (prev and (prev["out_dim"], prev["method"]) != (reduce_dim, reduce_method)):
+        return "dimensionality reduction changed"
+    if manifest.backend == "sharded":
+        built = (manifest.params["n_shards"], manifest.params["partition"])
+        if shards <= 1 or built != (shards, shard_by):
+            return f"sharding changed ({built[0]} shards by {built[1]} -> {shards})"
+        backend = manifest.params["shard_backend"]
+    elif shards > 1:
+        return f"sharding changed (1 shard -> {shards})"
+    else:
+        backend = manifest.backend
+    if index_backend != "auto" and backend != index_backend:  # auto: keep what the full build chose
+        return f"index backend changed ({backend} -> {index_backend})"
+    return None
+
+def _build_sparse(index) -> float:
+    """BM25 index over the stored chunk texts of `index` (saved with it, used by hybrid retrieval)."""
+    t0 = time.perf_counter()
+    index.sparse = SparseIndex.build(*index.chunk_texts())
+    return time.perf_counter() - t0
+
+def _update_index(docs_dir, out_dir, model_name, chunker, index_value, make_embedder, make_cache, batch_size, sparse=True) -> Dict[str, Any]:
+    """
+    Incremental ingest: diff docs_dir against ingest_state.json (mtime first,
+    content hash only for touched files) and embed/replace/delete only the
+    affected chunks. The index is not even loaded when nothing changed.
+    """
+    state = load_state(out_dir)
+    prev_docs: Dict[str, Any] = state["docs"]
+    new_docs: Dict[str, Any] = {}
+    delete: List[int] = []
+    metas: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    labels: List[int] = []
+    changed = kept = 0
+
+    scanned = scan_docs(docs_dir)
+    for source, mtime in sorted(scanned.items()):
+        prev = prev_docs.get(source)
+        if prev is not None and prev["mtime"] == mtime:
+            new_docs[source] = prev
+            kept += len(prev["chunks"])
+            continue
+        with open(os.path.join(docs_dir, source), "r", encoding="utf-8") as f:
+            text = f.read()
+        sha1 = text_sha1(text)
+        if prev is not None and prev["sha1"] == sha1:  # touched, not edited
+            new_docs[source] = dict(prev, mtime=mtime)
+            kept += len(prev["chunks"])
+            continue
+        changed += 1
+        d_metas, d_texts, d_labels, d_hashes = chunk_doc(chunker, {"source": source, "text": text}, index_value)
+        diff = diff_chunks(prev["chunks"] if prev else {}, d_hashes)
+        wanted = set(diff.upsert)
+        for m, t, label in zip(d_metas, d_texts, d_labels):
+            if label in wanted:
+                metas.append(m); texts.append(t); labels.append(label)
+        delete.extend(diff.delete)
+        kept += diff.kept
+        new_docs[source] = doc_entry(mtime, sha1, d_hashes)
+    removed = [s for s in prev_docs if s not in scanned]
+    for source in removed:
+        delete.extend(int(label) for label in prev_docs[source]["chunks"])
+
+    summary: Dict[str, Any] = {
+        "mode": "incremental",
+        "documents": len(scanned),
+        "documents_changed": changed,
+        "documents_removed": len(removed),
+        "chunks_kept": kept,
+        "chunks_upserted": len(labels),
+        "chunks_deleted": len(delete),
+    }
+    if labels or delete:
+        index = open_index(out_dir, embedder=model_name)
+        summary["chunks_replaced"] = sum(1 for label in labels if index.has_label(label))
+        index.mark_deleted(delete)
+        if labels:
+            embedder, cache = make_embedder(), make_cache()
+            try:
+                t0 = time.perf_counter()
+                vectors = embed_cached(embedder, texts, cache, model_name, batch_size=batch_size)
+                summary["embed_seconds"] = time.perf_counter() - t0
+            finally:
+                _close_embedder(embedder)
+            if index.projection is not None:
+                vectors = index.projection.apply(vectors)
+            index.upsert_array(vectors, metas, labels=labels)
+            if cache is not None:
+                summary.update(cache.stats())
+                cache.close()
+        if sparse:
+            # postings hold corpus-wide idf/length statistics: rebuilt from the stored texts, no re-embedding
+            summary["sparse_seconds"] = _build_sparse(index)
+        else:
+            index.sparse = None
+        index.save(out_dir)
+    save_state(out_dir, {"docs": new_docs})
+    _print_summary(summary)
+    return summary
+
+def _print_summary(summary: Dict[str, Any]) -> None:
+    print("="*20)
+    print("ingest summary")
+    for key, value in summary.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"  {key}: {value}")
+    print("="*20)
 
 if __name__ == "__main__":
     build_erc_index()
@@ -0,0 +1,149 @@
+# scripts/export_onnx.py
+# Export a sentence-transformers model to ONNX (+ dynamic int8 variant) and verify it against torch
+
+from __future__ import annotations
+import os
+import json
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag.embed import ONNX_INSTALL_HINT, OnnxEmbeddings
+
+SAMPLE_SENTENCES = [
+    "What should I do next for an unresponsive adult?",
+    "How deep are chest compressions for an adult?",
+    "Severe bleeding: apply a pressure bandage.",
+    "Call 112 and describe the situation.",
+    "Place the person in the recovery position if they are breathing normally.",
+    "Where do I put the AED pads on a child?",
+    "Give 30 compressions followed by 2 rescue breaths.",
+    "Check for danger before approaching the casualty.",
+]
+
+
+def export_onnx(
+    model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+    out_dir: str = "models/all-MiniLM-L6-v2-onnx",
+    quantize: bool = True,
+    opset: int = 17,
+) -> Dict[str, Any]:
+    """Write model.onnx, tokenizer.json and export.json (and model_int8.onnx) to out_dir."""
+    try:
+        import onnx  # noqa: F401  (torch.onnx.export serializes through it)
+        import onnxruntime  # noqa: F401  (int8 quantization and verification)
+    except ImportError as e:
+        raise ImportError(f"exporting to ONNX needs `onnx` and `onnxruntime`; {ONNX_INSTALL_HINT}") from e
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    max_length = int(st.max_seq_length or 256)
+
+    dummy = tokenizer(["a probe sentence"], return_tensors="pt", padding=True)
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "seq"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    class _Wrapper(torch.nn.Module):
+        # positional inputs -> last_hidden_state only (pooling happens in NumPy)
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, *args):
+            return self.m(**dict(zip(input_names, args))).last_hidden_state
+
+    model_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(dummy[n] for n in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,  # TorchScript exporter: no onnxscript dependency
+        )
+    tokenizer.save_pretrained(out_dir)  # fast tokenizers write tokenizer.json
+
+    info = {"source_model": model_name, "max_length": max_length, "pooling": "mean", "opset": opset}
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        info["quantized"] = "model_int8.onnx"
+    with open(os.path.join(out_dir, "export.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine between two embedding matrices (both L2-normalized)."""
+    cos = np.sum(reference * candidate, axis=1)
+    return {"min": float(cos.min()), "mean": float(cos.mean()), "p01": float(np.percentile(cos, 1))}
+
+
+def verify_onnx(
+    model_name: str,
+    out_dir: str,
+    sentences: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """Embed `sentences` with torch and with each ONNX variant; return cosine stats per variant."""
+    from rag.embed import SBertEmbeddings
+
+    sentences = sentences or SAMPLE_SENTENCES
+    ref = SBertEmbeddings(model_name=model_name).embed_array(sentences)
+    report: Dict[str, Dict[str, float]] = {}
+    for quantized in (False, True):
+        fname = "model_int8.onnx" if quantized else "model.onnx"
+        if not os.path.exists(os.path.join(out_dir, fname)):
+            continue
+        emb = OnnxEmbeddings(out_dir, quantized=quantized)
+        report[fname] = cosine_agreement(ref, emb.embed_array(sentences))
+    return report
+
+
+def _read_sentences(docs_dir: str, limit: int) -> List[str]:
+    from scripts.build_index import read_docs
+    from rag.chunk import ParagraphChunker
+
+    chunker = ParagraphChunker()
+    out: List[str] = []
+    for d in read_docs(docs_dir):
+        out.extend(c["text"] for c in chunker.split(d["text"]))
+        if len(out) >= limit:
+            break
+    return out[:limit]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export an embedding model to ONNX and verify it against torch")
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--out", default="models/all-MiniLM-L6-v2-onnx")
+    ap.add_argument("--no-quantize", action="store_true", help="skip the dynamic int8 variant")
+    ap.add_argument("--docs", default=None, help="verify on chunks from this folder instead of built-in sentences")
+    ap.add_argument("--limit", type=int, default=256)
+    ap.add_argument("--min-cosine", type=float, default=0.98, help="fail if any sentence agrees less than this")
+    args = ap.parse_args()
+
+    info = export_onnx(args.model, args.out, quantize=not args.no_quantize)
+    print(f"exported {info['source_model']} -> {args.out}")
+
+    sentences = _read_sentences(args.docs, args.limit) if args.docs else None
+    report = verify_onnx(args.model, args.out, sentences)
+    print("cosine agreement vs torch:")
+    ok = True
+    for fname, st in report.items():
+        print(f"  {fname:18s} min={st['min']:.5f} p01={st['p01']:.5f} mean={st['mean']:.5f}")
+        ok = ok and st["min"] >= args.min_cosine
+    if not ok:
+        raise SystemExit(f"cosine agreement below {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
 # src/rag/cli.py
 from __future__ import annotations
 import typer, json, os
+from dataclasses import asdict
+from typing import Optional
+# keep module-level imports light: llama_cpp / torch / onnxruntime are imported
+# by the backends on first use, so `rag --help` does not pay for them
 from rag.generator import simple_answer, load_llm_config, LocalLLM
-from rag.embed import SBertEmbeddings
-from rag.indexer import HnswIndex
+from rag.embed import load_embedder
+from rag.indexer import HnswIndex, INDEX_BACKENDS, FLAT_MAX_CHUNKS
 from rag.retriever import Retriever
+from rag.manifest import validate_manifest
+from rag.publish import resolve_index_dir
+from rag import tuning
 import time
-from scripts.build_index import build_erc_index
+
+
+def build_erc_index(**kwargs):
+    """Lazy entry point to scripts.build_index (only `ingest` needs the chunkers/cache)."""
+    from scripts.build_index import build_erc_index as _build_erc_index
+    return _build_erc_index(**kwargs)
+
+
+def _new_index(manifest):
+    """Empty index of the backend recorded in the manifest (HNSW for indexes without one)."""
+    backend = manifest.backend if manifest is not None else "hnsw"
+    return HnswIndex() if backend == "hnsw" else INDEX_BACKENDS[backend]()
 
 
 app = typer.Typer(help="RAG CLI")
 
+EMBED_MODEL_HELP = "sentence-transformers model name, or onnx:<dir> / onnx-int8:<dir> for an ONNX Runtime export"
+
 # ===============================
 # Commands for document retrieval
 # ===============================
@@ -19,29 +39,127 @@ app = typer.Typer(help="RAG CLI")
 def ingest(
     docs_dir: str = typer.Option("data/docs", "--docs", help="Folder with ERC .txt/.md"),
     out_dir: str  = typer.Option("data/index", "--out", help="Where to store HNSW index"),
-    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model"),
-    custom_chunker: bool = typer.Option(False, "--custom_chunker", help="uses custom data source format")
+    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model", help=EMBED_MODEL_HELP),
+    custom_chunker: bool = typer.Option(False, "--custom_chunker", help="uses custom data source format"),
+    cache_dir: str = typer.Option("data/embed_cache", "--cache-dir", help="Persistent embedding cache location"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse embeddings of unchanged chunks"),
+    batch_size: int = typer.Option(64, "--batch-size", help="Chunks per encode call (length-sorted batches)"),
+    workers: int = typer.Option(1, "--workers", help="Embedding worker processes (each loads the model once)"),
+    threads_per_worker: Optional[int] = typer.Option(None, "--threads-per-worker", help="Torch/ONNX threads per worker"),
+    reduce_dim: Optional[int] = typer.Option(None, "--reduce-dim", help="Store vectors with this many dimensions"),
+    reduce_method: str = typer.Option("pca", "--reduce-method", help="pca (fitted on the corpus) | truncate (Matryoshka models)"),
+    index_threads: int = typer.Option(-1, "--index-threads", help="Threads for HNSW bulk insert (-1 = all cores)"),
+    index_backend: str = typer.Option("auto", "--index-backend", help="auto | hnsw | flat (exact brute force) | int8 (quantized flat)"),
+    flat_max_chunks: int = typer.Option(FLAT_MAX_CHUNKS, "--flat-max-chunks", help="auto: use flat up to this many chunks"),
+    incremental: bool = typer.Option(False, "--incremental", help="Only re-embed chunks of added/changed/removed docs"),
+    shards: int = typer.Option(1, "--shards", help="Split the index into N shards (built and queried in parallel)"),
+    shard_by: str = typer.Option("source", "--shard-by", help="source (one document per shard) | hash (even sizes)"),
+    publish: bool = typer.Option(False, "--publish", help="Build into <out>/versions/<id> and switch <out>/CURRENT atomically"),
+    keep_versions: int = typer.Option(3, "--keep-versions", help="--publish: older versions to keep on disk"),
+    sparse: bool = typer.Option(True, "--sparse/--no-sparse", help="Also build the BM25 index for hybrid retrieval"),
 ):
-    build_erc_index(docs_dir=docs_dir, out_dir=out_dir, model_name=embed_model, custom_chunker=custom_chunker)
+    build_erc_index(
+        docs_dir=docs_dir,
+        out_dir=out_dir,
+        model_name=embed_model,
+        custom_chunker=custom_chunker,
+        cache_dir=cache_dir if use_cache else None,
+        batch_size=batch_size,
+        workers=workers,
+        threads_per_worker=threads_per_worker,
+        reduce_dim=reduce_dim,
+        reduce_method=reduce_method,
+        index_threads=index_threads,
+        index_backend=index_backend,
+        flat_max_chunks=flat_max_chunks,
+        incremental=incremental,
+        shards=shards,
+        shard_by=shard_by,
+        publish=publish,
+        keep_versions=keep_versions,
+        sparse=sparse,
+    )
     typer.echo(f"Index written to {out_dir}")
 
+@app.command("inspect-index")
+def inspect_index(
+    index_dir: str = typer.Option("data/index", "--index"),
+    verify: bool = typer.Option(False, "--verify", help="Re-hash every file against the manifest checksums"),
+):
+    """Print an index's manifest without loading the index."""
+    index_dir = resolve_index_dir(index_dir)
+    manifest = validate_manifest(index_dir, checksums=verify)
+    if manifest is None:
+        raise typer.BadParameter(f"{index_dir} has no manifest.json (built before manifests; re-ingest to add one)")
+    typer.echo(json.dumps(asdict(manifest), indent=2, ensure_ascii=False))
+    if verify:
+        typer.echo(f"checksums OK ({len(manifest.files)} files)")
+
+@app.command("tune-index")
+def tune_index(
+    index_dir: str = typer.Option("data/index", "--index"),
+    k: int = typer.Option(10, "--k", help="recall@k"),
+    target_recall: float = typer.Option(0.95, "--target-recall"),
+    efs: str = typer.Option(",".join(map(str, tuning.DEFAULT_EFS)), "--efs", help="ef values to sweep"),
+    ms: Optional[str] = typer.Option(None, "--M", help="Also sweep M (comma-separated; graph rebuilt in memory, report only)"),
+    n_queries: int = typer.Option(200, "--queries", help="Held-out chunks used as queries"),
+    questions_from: Optional[str] = typer.Option(None, "--questions-from", help="Docs in CustomChunker format: use their questions as queries"),
+    write: bool = typer.Option(True, "--write/--dry-run", help="Store the chosen ef in the index manifest"),
+):
+    """Pick the smallest HNSW ef that reaches a recall target (exact ground truth by brute force)."""
+    index_dir = resolve_index_dir(index_dir)
+    manifest = validate_manifest(index_dir)
+    if manifest is None or manifest.backend != "hnsw":
+        raise typer.BadParameter(f"{index_dir} is not an HNSW index with a manifest")
+    queries = None
+    if questions_from:
+        from rag.custom_chunk import CustomChunker
+        from rag.embed import embed_array
+        chunker, questions = CustomChunker(), []
+        for name in sorted(os.listdir(questions_from)):
+            with open(os.path.join(questions_from, name), "r", encoding="utf-8") as f:
+                questions.extend(c["question"] for c in chunker.split(f.read(), meta={"source": name}))
+        queries = embed_array(load_embedder(manifest.embedder), questions)
+        if manifest.projection:
+            from rag.projection import Projection
+            queries = Projection.load(index_dir, manifest.projection).apply(queries)
+    summary = tuning.tune_index(
+        index_dir, k=k, target_recall=target_recall, efs=[int(x) for x in efs.split(",")],
+        Ms=[int(x) for x in ms.split(",")] if ms else None, n_queries=n_queries, queries=queries, write=write,
+    )
+    typer.echo(f"{summary['queries']}, recall@{k} target {target_recall}")
+    typer.echo(tuning.format_table(summary["rows"], summary["chosen"]))
+    chosen = summary["chosen"]
+    if chosen is None:
+        typer.echo(f"no setting reached recall {target_recall}; try larger --efs")
+        return
+    if summary["ef"] is not None:
+        verb = "written to manifest" if summary.get("written") else "not written (--dry-run)"
+        typer.echo(f"ef {summary['ef_before']} -> {summary['ef']} for M={summary['M']}: {verb}")
+    if chosen.M != summary["M"]:
+        typer.echo(f"M={chosen.M} with ef={chosen.ef} is faster at this recall (needs a rebuild)")
+
 @app.command("get_retriever_format")
 def get_retriever_format(
     question: str = typer.Argument(..., help="User question"),
     config: str = typer.Option("configs/rag.yaml", "--config", "-c"),
     index_dir: str = typer.Option("data/index", "--index"),
-    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model"),
+    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model", help=EMBED_MODEL_HELP),
     k: int = typer.Option(2, "--k"),
 ):
+    # 0) Fail fast on an index built with another embedder (reads manifest.json only)
+    index_dir = resolve_index_dir(index_dir)  # versioned root (ingest --publish): the current version
+    manifest = validate_manifest(index_dir, embedder=embed_model)
+
     # 1) Load LLM
     llm_cfg = load_llm_config(config)
     llm = LocalLLM(llm_cfg)
 
     # 2) Load embedder + index
-    embedder = SBertEmbeddings(model_name=embed_model)
+    embedder = load_embedder(embed_model)
     # dim = len(embedder.embed_one("probe"))
-    index = HnswIndex()
-    index.load(index_dir)  # uses header stored during build
+    index = _new_index(manifest)
+    index.load(index_dir)  # uses manifest/header stored during build
 
     # 3) Retrieve
     retriever = Retriever(embedder, index, k=k)
@@ -54,18 +172,22 @@ def ask(
     question: str = typer.Argument(..., help="User question"),
     config: str = typer.Option("configs/rag.yaml", "--config", "-c"),
     index_dir: str = typer.Option("data/index", "--index"),
-    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model"),
+    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model", help=EMBED_MODEL_HELP),
     k: int = typer.Option(2, "--k"),
 ):
+    # 0) Fail fast on an index built with another embedder (reads manifest.json only)
+    index_dir = resolve_index_dir(index_dir)  # versioned root (ingest --publish): the current version
+    manifest = validate_manifest(index_dir, embedder=embed_model)
+
     # 1) Load LLM
     llm_cfg = load_llm_config(config)
     llm = LocalLLM(llm_cfg)
 
     # 2) Load embedder + index
-    embedder = SBertEmbeddings(model_name=embed_model)
+    embedder = load_embedder(embed_model)
     # dim = len(embedder.embed_one("probe"))
-    index = HnswIndex()
-    index.load(index_dir)  # uses header stored during build
+    index = _new_index(manifest)
+    index.load(index_dir)  # uses manifest/header stored during build
 
     # 3) Retrieve
     retriever = Retriever(embedder, index, k=k)
@@ -86,20 +208,23 @@ def llm_stream(
     question: str = typer.Argument(..., help="User question"),
     config: str = typer.Option("configs/rag.yaml", "--config", "-c"),
     index_dir: str = typer.Option("data/index", "--index"),
-    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model"),
+    embed_model: str = typer.Option("sentence-transformers/all-MiniLM-L6-v2", "--embed-model", help=EMBED_MODEL_HELP),
     k: int = typer.Option(2, "--k"),
 ):
-    
+    # 0) Fail fast on an index built with another embedder (reads manifest.json only)
+    index_dir = resolve_index_dir(index_dir)  # versioned root (ingest --publish): the current version
+    manifest = validate_manifest(index_dir, embedder=embed_model)
+
     # 1) Load LLM
     llm_cfg = load_llm_config(config)
     llm = LocalLLM(llm_cfg) 
 
     # 2) Load embedder + index
-    embedder = SBertEmbeddings(model_name=embed_model)
+    embedder = load_embedder(embed_model)
     dim = len(embedder.embed_one("probe"))
 
-    index = HnswIndex()
-    index.load(index_dir)  # uses header stored during build
+    index = _new_index(manifest)
+    index.load(index_dir)  # uses manifest/header stored during build
 
     # 3) Retrieve
     retriever = Retriever(embedder, index, k=k)
@@ -1,25 +1,422 @@
 # Load embedding model; encode chunks/questions -> vectors (np.ndarray)
 
 from __future__ import annotations
-from typing import List
-from rag.interfaces import Embedder
+import os
+import json
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import yaml
+from rag.interfaces import ArrayEmbedder, Embedder
 
-# sentence-transformers uses torch under the hood (already env)
-from sentence_transformers import SentenceTransformer
+# model specs that select the ONNX Runtime backend instead of sentence-transformers, e.g.
+#   onnx:models/all-MiniLM-L6-v2-onnx       (fp32 export)
+#   onnx-int8:models/all-MiniLM-L6-v2-onnx  (dynamic int8 quantized export)
+ONNX_PREFIX = "onnx:"
+ONNX_INT8_PREFIX = "onnx-int8:"
+ONNX_INSTALL_HINT = "install the `onnx` extra: poetry install -E onnx (pip install 'mr-first-aid-rag[onnx]')"
 
-class SBertEmbeddings(Embedder):
+class SBertEmbeddings(ArrayEmbedder):
     """
     Small, fast local embedding model. Good starters:
     - 'sentence-transformers/all-MiniLM-L6-v2' (384d)
     - 'nomic-ai/nomic-embed-text-v1.5' (768d, may require extra install)
     """
     
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = "cpu"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        device: str = "cpu",
+        max_encode_batch: int = 256,
+    ):
+        # sentence-transformers pulls in torch; only pay for it when this backend is used
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.max_encode_batch = max_encode_batch
         self.model = SentenceTransformer(model_name, device=device)
 
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        # one forward pass per call (capped): callers like embed_bulk already size the batches
+        batch_size = min(max(len(texts), 1), self.max_encode_batch)
+        embs = self.model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True
+        )
+        return np.ascontiguousarray(embs, dtype=np.float32)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Token counts after truncation (what the model will actually see)."""
+        enc = self.model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in enc["input_ids"]]
+
     def embed(self, texts: List[str]) -> List[List[float]]:
-        embs = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
-        return [e.tolist() for e in embs]
+        return self.embed_array(texts).tolist()
 
     def embed_one(self, text: str) -> List[float]:
-        return self.embed([text])[0]
+        return self.embed_array([text])[0].tolist()
+
+
+class OnnxEmbeddings(ArrayEmbedder):
+    """
+    Torch-free embedder: runs an exported transformer through ONNX Runtime and
+    does pooling + L2 normalization in NumPy (same output as SBertEmbeddings).
+
+    `model_dir` is written by scripts/export_onnx.py and contains:
+    - model.onnx / model_int8.onnx (dynamic int8 quantized variant)
+    - tokenizer.json (HF fast tokenizer)
+    - export.json (source model, max_length, pooling)
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, num_threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:  # optional backend
+            raise ImportError(f"ONNX backend needs `onnxruntime` and `tokenizers`; {ONNX_INSTALL_HINT}") from e
+
+        info_path = os.path.join(model_dir, "export.json")
+        info: Dict[str, Any] = {}
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        self.max_length = int(info.get("max_length", 256))
+        self.pooling = info.get("pooling", "mean")
+        self.source_model = info.get("source_model")
+        self.model_name = (ONNX_INT8_PREFIX if quantized else ONNX_PREFIX) + model_dir
+
+        model_file = os.path.join(model_dir, "model_int8.onnx" if quantized else "model.onnx")
+        assert os.path.exists(model_file), f"ONNX model not found: {model_file}"
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding()
+
+        opts = ort.SessionOptions()
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @classmethod
+    def from_spec(cls, spec: str, **kwargs: Any) -> "OnnxEmbeddings":
+        """Build from an `onnx:<dir>` / `onnx-int8:<dir>` model spec."""
+        if spec.startswith(ONNX_INT8_PREFIX):
+            return cls(spec[len(ONNX_INT8_PREFIX):], quantized=True, **kwargs)
+        assert spec.startswith(ONNX_PREFIX), f"not an ONNX model spec: {spec}"
+        return cls(spec[len(ONNX_PREFIX):], quantized=False, **kwargs)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        enc = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in enc], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in enc], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+        if self.pooling == "cls":
+            pooled = hidden[:, 0, :]
+        else:
+            pooled = mean_pool(hidden, mask)
+        return l2_normalize(pooled)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        return [int(sum(e.attention_mask)) for e in self.tokenizer.encode_batch(texts)]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Mask-aware mean over the token axis (sentence-transformers' default pooling)."""
+    m = mask[:, :, None].astype(np.float32)
+    summed = (hidden.astype(np.float32) * m).sum(axis=1)
+    return summed / np.clip(m.sum(axis=1), 1e-9, None)
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.ascontiguousarray(x / np.clip(norms, 1e-12, None), dtype=np.float32)
+
+
+def is_onnx_spec(model_name: str) -> bool:
+    return model_name.startswith((ONNX_PREFIX, ONNX_INT8_PREFIX))
+
+
+def load_embedder(model_name: str, device: Optional[str] = None) -> Embedder:
+    """
+    Embedder for a model spec: `onnx:`/`onnx-int8:` prefixes select OnnxEmbeddings,
+    anything else is a sentence-transformers model name. device=None keeps the backend default.
+    """
+    if is_onnx_spec(model_name):
+        return OnnxEmbeddings.from_spec(model_name)
+    if device is None:
+        return SBertEmbeddings(model_name=model_name)
+    return SBertEmbeddings(model_name=model_name, device=device)
+
+
+def embed_array(embedder: Embedder, texts: List[str]) -> np.ndarray:
+    """Float32 matrix for `texts`; uses the array path when the embedder has one."""
+    if hasattr(embedder, "embed_array"):
+        return np.ascontiguousarray(embedder.embed_array(texts), dtype=np.float32)
+    return np.asarray(embedder.embed(texts), dtype=np.float32).reshape(len(texts), -1)
+
+
+def token_lengths(embedder: Embedder, texts: List[str]) -> List[int]:
+    """Token counts from the embedder's tokenizer; whitespace word count as a fallback."""
+    if hasattr(embedder, "token_lengths"):
+        return list(embedder.token_lengths(texts))
+    return [len(t.split()) for t in texts]
+
+
+def embed_bulk(
+    embedder: Embedder,
+    texts: List[str],
+    batch_size: int = 64,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Bulk embedding stage for ingest:
+    - sort all texts by token length, so each batch holds similar lengths (little padding)
+    - encode in fixed-size batches of `batch_size`
+    - write rows back in the original order (into `out` if given)
+    """
+    assert batch_size >= 1, "batch_size must be >= 1"
+    if not texts:
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+    order = np.argsort(np.asarray(token_lengths(embedder, texts)), kind="stable")
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    batch_texts = ([texts[i] for i in idx] for idx in batches)
+    if hasattr(embedder, "embed_batches"):
+        # worker pools get all batches at once and return them in submission order
+        results = embedder.embed_batches(list(batch_texts))
+    else:
+        results = (embed_array(embedder, b) for b in batch_texts)
+    for idx, vecs in zip(batches, results):
+        if out is None:
+            out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+        out[idx] = vecs
+    return out
+
+
+
+# =========================
+# Config model
+# =========================
+
+@dataclass
+class EmbedderConfig:
+    model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
+    device: str = "cpu"
+    # micro-batching of concurrent embed_one calls (server); batch_max_size <= 1 disables it
+    batch_max_size: int = 32
+    batch_max_wait_ms: float = 2.0
+
+
+def load_embedder_config(path: str) -> EmbedderConfig:
+    """Read the `embedder:` section of the YAML config (all keys optional)."""
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    return EmbedderConfig(**(cfg.get("embedder") or {}))
+
+
+# =========================
+# Micro-batching front
+# =========================
+
+class BatchingEmbedder(ArrayEmbedder):
+    """
+    Merges concurrent `embed_one` calls into a single encode call.
+
+    Callers (e.g. FastAPI threadpool workers) put their text on a queue and block
+    on a Future. One background thread takes the first waiting text, collects more
+    for at most `max_wait_ms` or until `max_batch_size` texts are gathered, encodes
+    them in one batch and hands each caller its row. Bulk `embed`/`embed_array`
+    calls go straight to the wrapped embedder.
+    """
+
+    def __init__(self, inner: Embedder, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        assert max_batch_size >= 1, "max_batch_size must be >= 1"
+        self.inner = inner
+        self.model_name = getattr(inner, "model_name", None)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # one lock for "not closed + enqueue" and "closed + sentinel": nothing lands behind the sentinel
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+
+    # ----- Embedder interface -----
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        return embed_array(self.inner, texts)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.submit(text).result().tolist()
+
+    # ----- batching -----
+
+    def submit(self, text: str) -> Future:
+        """Queue one text; the Future resolves to its float32 vector. RuntimeError after close()."""
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BatchingEmbedder is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put((text, fut))
+        return fut
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:  # close() sentinel: finish this batch, then stop
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            texts = [t for t, _ in batch]
+            try:
+                vecs = embed_array(self.inner, texts)
+            except Exception as e:  # every waiting caller gets the error
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), v in zip(batch, vecs):
+                fut.set_result(v)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+        }
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is None:
+            return
+        thread.join(timeout=timeout)
+        # a worker that did not stop in time leaves queued callers behind: fail them instead of hanging
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("BatchingEmbedder closed before this text was encoded"))
+        self._thread = None
+
+
+
+# =========================
+# Multi-process pool (ingest)
+# =========================
+
+_WORKER_EMBEDDER: Optional[Embedder] = None
+
+
+def _pool_init(loader: Callable[..., Embedder], model_name: str, device: Optional[str], threads: Optional[int]) -> None:
+    """Runs once per worker process: pin thread count, then load the model."""
+    global _WORKER_EMBEDDER
+    if threads:
+        # must be set before torch / onnxruntime create their thread pools
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(threads)
+    _WORKER_EMBEDDER = loader(model_name, device)
+    if threads and not is_onnx_spec(model_name):
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+
+def _pool_embed(texts: List[str]) -> np.ndarray:
+    assert _WORKER_EMBEDDER is not None, "worker not initialized"
+    return embed_array(_WORKER_EMBEDDER, texts)
+
+
+class ProcessPoolEmbeddings(ArrayEmbedder):
+    """
+    Embeds on `workers` processes, each loading the model once (spawn context, so
+    torch/onnxruntime state is never forked). `embed_bulk` hands over all batches at
+    once via `embed_batches`; results come back in submission order, so the index
+    built from them does not depend on which worker finished first.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 2,
+        threads_per_worker: Optional[int] = None,
+        device: Optional[str] = None,
+        loader: Callable[..., Embedder] = load_embedder,
+    ):
+        assert workers >= 1, "workers must be >= 1"
+        self.model_name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_pool_init,
+            initargs=(loader, model_name, device, threads_per_worker),
+        )
+
+    def embed_batches(self, batches: Iterable[List[str]]) -> List[np.ndarray]:
+        return list(self._pool.map(_pool_embed, batches))
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # one contiguous shard per worker
+        shard = -(-len(texts) // self.workers)
+        parts = self.embed_batches([texts[i:i + shard] for i in range(0, len(texts), shard)])
+        return np.ascontiguousarray(np.vstack(parts), dtype=np.float32)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
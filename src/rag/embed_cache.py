@@ -0,0 +1,157 @@
+# src/rag/embed_cache.py
+# Persistent, content-addressed embedding cache used by ingest (skip re-encoding unchanged chunks)
+
+from __future__ import annotations
+import os
+import time
+import hashlib
+import sqlite3
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from rag.interfaces import Embedder
+from rag.embed import embed_bulk
+
+
+def content_key(model_name: str, text: str) -> str:
+    """
+    Cache key for one embedded text. Same sha1 scheme the chunkers use for chunk ids,
+    but over the *embedded* text (CustomChunker embeds the question, not the chunk text)
+    and salted with the model name so different embedders never share vectors.
+    """
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk vector cache backed by a single sqlite file.
+    - key: sha1(model name + embedded text), value: float32 bytes
+    - size-bounded: once more than `max_entries` rows exist, the least recently
+      used ones are evicted (checked after every `put_many`)
+    - keeps hit/miss counters for the ingest summary
+    """
+
+    def __init__(self, path: str = "data/embed_cache/embeddings.sqlite", max_entries: int = 500_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS emb ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS emb_last_used ON emb(last_used)")
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return one vector per text, None where the cache has no entry."""
+        keys = [content_key(model_name, t) for t in texts]
+        found = {}
+        # sqlite limits the number of bound parameters; query in slices
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            q = "SELECT key, vec FROM emb WHERE key IN (%s)" % ",".join("?" * len(part))
+            for key, blob in self._db.execute(q, part):
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        now = time.time()
+        if found:
+            self._db.executemany("UPDATE emb SET last_used=? WHERE key=?", [(now, k) for k in found])
+            self._db.commit()
+
+        out: List[Optional[np.ndarray]] = [found.get(k) for k in keys]
+        hit = sum(v is not None for v in out)
+        self.hits += hit
+        self.misses += len(out) - hit
+        return out
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: Sequence[Sequence[float]] | np.ndarray) -> None:
+        assert len(texts) == len(vectors), "texts/vectors length mismatch"
+        now = time.time()
+        rows = []
+        for t, v in zip(texts, vectors):
+            arr = np.asarray(v, dtype=np.float32)
+            rows.append((content_key(model_name, t), int(arr.shape[0]), arr.tobytes(), now))
+        self._db.executemany("INSERT OR REPLACE INTO emb(key, dim, vec, last_used) VALUES (?,?,?,?)", rows)
+        self._db.commit()
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used rows above max_entries; returns number of removed rows."""
+        over = len(self) - self.max_entries
+        if over <= 0:
+            return 0
+        self._db.execute(
+            "DELETE FROM emb WHERE key IN (SELECT key FROM emb ORDER BY last_used ASC LIMIT ?)", (over,)
+        )
+        self._db.commit()
+        self.evicted += over
+        return over
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": (self.hits / total) if total else 0.0,
+            "cache_evicted": self.evicted,
+        }
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def embed_cached(
+    embedder: Embedder,
+    texts: List[str],
+    cache: Optional[EmbeddingCache],
+    model_name: str,
+    out: Optional[np.ndarray] = None,
+    batch_size: int = 64,
+) -> np.ndarray:
+    """
+    Embed `texts` into a float32 matrix, serving what we can from `cache` and
+    encoding only the misses (length-sorted batches, see embed_bulk). Pass a
+    preallocated `out` (len(texts) x dim, e.g. the ingest matrix) to fill it in place.
+    """
+    if not texts:
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+    if cache is None:
+        return embed_bulk(embedder, texts, batch_size=batch_size, out=out)
+
+    cached = cache.get_many(model_name, texts)
+    miss_idx = [i for i, v in enumerate(cached) if v is None]
+    fresh = None
+    if miss_idx:
+        miss_texts = [texts[i] for i in miss_idx]
+        fresh = embed_bulk(embedder, miss_texts, batch_size=batch_size)
+        cache.put_many(model_name, miss_texts, fresh)
+
+    if out is None:
+        dim = fresh.shape[1] if fresh is not None else cached[0].shape[0]
+        out = np.empty((len(texts), dim), dtype=np.float32)
+    for i, v in enumerate(cached):
+        if v is not None:
+            out[i] = v
+    if fresh is not None:
+        out[miss_idx] = fresh
+    return out
@@ -0,0 +1,37 @@
+# src/rag/fsutil.py
+# Atomic file replacement shared by every index writer (tmp file + os.replace)
+
+from __future__ import annotations
+import os
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Iterator
+
+
+@contextmanager
+def replacing(path: str) -> Iterator[str]:
+    """
+    Yields "<path>.tmp" to write to; on success it replaces `path`. Readers that
+    still map the old file, and hard-linked older versions (see rag.publish),
+    keep the old inode instead of seeing it truncated. On error the tmp file is
+    removed and `path` is untouched.
+    """
+    tmp = path + ".tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def atomic_write(path: str, writer: Callable[[IO[Any]], Any], mode: str = "wb", fsync: bool = False) -> None:
+    """writer(f) into a tmp file that then replaces `path`; text modes are utf-8. fsync: durable before the rename."""
+    with replacing(path) as tmp:
+        with open(tmp, mode, encoding=None if "b" in mode else "utf-8") as f:
+            writer(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
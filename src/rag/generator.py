@@ -15,10 +15,20 @@ from dataclasses import dataclass
 from typing import Any, Dict, Iterable, List, Optional
 
 import yaml
-from llama_cpp import Llama
 
 from rag.interfaces import ChatModel
 
+# llama_cpp loads its native library on import (slow); resolved on first LocalLLM()
+Llama = None
+
+
+def _llama_class():
+    global Llama
+    if Llama is None:
+        from llama_cpp import Llama as _Llama
+        Llama = _Llama
+    return Llama
+
 
 # =========================
 # Config model
@@ -110,7 +120,7 @@ class LocalLLM(ChatModel):
         if cfg.use_mlock is not None:
             llama_kwargs["use_mlock"] = cfg.use_mlock
 
-        self.llama = Llama(**llama_kwargs)
+        self.llama = _llama_class()(**llama_kwargs)
         self.cfg = cfg
         self.stop = stops
         self.chat_format = mapping["chat_format"]
@@ -1,18 +1,234 @@
 # /src/rag/indexer.py
 # Build/save/load HNSW index; controls M/efConstruction/efSaerch
+# FlatIndex: exact brute-force backend for small corpora (picked automatically by ingest)
+# ShardedIndex: N sub-indexes of any backend, queried in parallel
 
 from __future__ import annotations
 import os
-import json
-from typing import List, Dict, Any
+import time
+import zlib
+import threading
+import heapq
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, FrozenSet, Optional, Sequence, Tuple
 import numpy as np
 import hnswlib   # pip install hnswlib
 
-from rag.interfaces import VectorIndex
+from rag.fsutil import atomic_write, replacing
+from rag.interfaces import ArrayVectorIndex, Hit
+from rag.projection import Projection
+from rag.meta_store import LEGACY_JSONL, MetaStore, convert_jsonl, read_jsonl
+from rag.manifest import IndexManifest, index_backend, validate_manifest, write_manifest
+from rag.publish import resolve_index_dir
+from rag.query_cache import LRUCache
+from rag.rwlock import RWLock
+from rag.sparse import SparseIndex, load_sparse, save_sparse
+
+LABELS_FILE = "labels.npy"
+FLAT_FILE = "vectors.npy"
+INT8_FILE = "vectors_int8.npy"
+INT8_SCALES_FILE = "int8_scales.npy"
+SHARDS_DIR = "shards"
+DEFAULT_EF = 128
+# filters come from request bodies: bound what is precomputed per distinct filter / per field
+FILTER_CACHE_SIZE = 256
+FILTER_FIELDS_CACHED = 16
+_FILTER_SCALARS = (str, int, float, bool)
+
+
+def chunk_label(chunk_id: str, source: str = "") -> int:
+    """Stable 63-bit index label for a chunk: the same (source, chunk id) maps to the same label in every build."""
+    h = hashlib.sha1(f"{source}\0{chunk_id}".encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "big") >> 1  # fits int64 as well as hnswlib's uint64
+
+
+def _filter_key(filter: Dict[str, Any]) -> Tuple:
+    """
+    Hashable form of a filter dict (cache key for its precomputed row/label sets).
+    Raises ValueError unless every value is a scalar or a list of scalars.
+    """
+    def norm(field: Any, v: Any) -> Any:
+        if not isinstance(field, str):
+            raise ValueError(f"filter field names must be strings, got {field!r}")
+        items = v if isinstance(v, (list, tuple, set, frozenset)) else (v,)
+        if not all(isinstance(x, _FILTER_SCALARS) for x in items):
+            raise ValueError(f"filter[{field!r}] must be a scalar or a list of scalars, got {v!r}")
+        return tuple(sorted(v, key=repr)) if items is v else v
+    return tuple(sorted((k, norm(k, v)) for k, v in filter.items()))
+
+
+def meta_matches(meta: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """One metadata dict against a filter, with the semantics of _RowMap.filter_rows."""
+    for field, want in filter.items():
+        values = want if isinstance(want, (list, tuple, set, frozenset)) else (want,)
+        have = meta.get(field)
+        if have is None or not any(v in values for v in (have if isinstance(have, list) else (have,))):
+            return False
+    return True
+
+
+def _column(meta: Sequence[Dict[str, Any]], field: str) -> List[Any]:
+    if isinstance(meta, MetaStore):
+        return meta.column(field)  # skips text decoding
+    return [m.get(field) for m in meta]
+
+
+def _insert_stats(items: int, seconds: float, **extra: Any) -> Dict[str, Any]:
+    """`last_insert` of every backend: throughput of its most recent upsert (reported by ingest)."""
+    return {"items": int(items), "seconds": seconds, "items_per_s": (items / seconds) if seconds > 0 else 0.0, **extra}
+
+
+def _save_npy(path: str, name: str, arr: np.ndarray) -> None:
+    atomic_write(os.path.join(path, name), lambda f: np.save(f, arr))  # a loaded copy may still map the old file
+
+
+class _RowMap:
+    """
+    Metadata rows and the label <-> row mapping shared by both backends.
+    Labels are what the vector structure stores: row numbers by default, or
+    stable chunk_label() values so a re-ingest can replace and delete chunks.
+    A replaced or deleted chunk leaves a tombstone row (label -1) that the
+    next save drops.
+    """
+
+    def _init_rows(self) -> None:
+        # aligned with ID -> metadata+text; a list while building, a mmapped MetaStore after load
+        self.meta: Sequence[Dict[str, Any]] = []
+        self.row_labels: List[int] = []        # row -> label (-1 = tombstone)
+        self.label_rows: Dict[int, int] = {}   # label -> row of its current metadata
+        self._invalidate_filters()
+
+    def _invalidate_filters(self) -> None:
+        # precomputed per field value / per filter; rebuilt lazily after any add/delete
+        self._groups = LRUCache(FILTER_FIELDS_CACHED)     # field -> {value: rows}
+        self._filter_cache = LRUCache(FILTER_CACHE_SIZE)  # _filter_key() -> labels / row mask
+
+    def _sync_rows(self) -> None:
+        # rows put into self.meta directly (e.g. a header row) are positional
+        for r in range(len(self.row_labels), len(self.meta)):
+            self.row_labels.append(r)
+            self.label_rows.setdefault(r, r)
+
+    def _next_labels(self, n: int) -> np.ndarray:
+        # past every live label, not just past the rows: save() compacts tombstones, so after
+        # delete -> save -> load len(self.meta) can be the label of a live chunk
+        self._sync_rows()
+        start = max(len(self.meta), max(self.label_rows, default=-1) + 1)
+        assert start + n < 2 ** 63, "index uses stable chunk labels: pass labels to upsert"
+        return np.arange(start, start + n)
+
+    def _add_rows(self, labels: Sequence[int], metas: List[Dict[str, Any]]) -> List[int]:
+        """Append metadata for `labels`; returns the rows they replaced (now tombstones)."""
+        self._sync_rows()
+        self._invalidate_filters()
+        replaced: List[int] = []
+        start = len(self.meta)
+        self.meta.extend(metas)
+        for i, label in enumerate(int(l) for l in labels):
+            old = self.label_rows.get(label)
+            if old is not None:
+                self.row_labels[old] = -1
+                replaced.append(old)
+            self.row_labels.append(label)
+            self.label_rows[label] = start + i
+        return replaced
+
+    def _drop_labels(self, labels: Sequence[int]) -> List[int]:
+        """Forget `labels`; returns the tombstoned rows (unknown labels are ignored)."""
+        self._sync_rows()
+        self._invalidate_filters()
+        rows: List[int] = []
+        for label in labels:
+            row = self.label_rows.pop(int(label), None)
+            if row is not None:
+                self.row_labels[row] = -1
+                rows.append(row)
+        return rows
+
+    def _field_groups(self, field: str) -> Dict[Any, np.ndarray]:
+        """value -> sorted live rows with meta[field] == value (list values count for each item)."""
+        groups = self._groups.get(field)
+        if groups is None:
+            self._sync_rows()
+            buckets: Dict[Any, List[int]] = defaultdict(list)
+            for r, v in enumerate(_column(self.meta, field)):
+                if v is None or self.row_labels[r] == -1:
+                    continue
+                for item in (v if isinstance(v, list) else (v,)):
+                    try:
+                        buckets[item].append(r)
+                    except TypeError:  # unhashable (e.g. dict) values are not filterable
+                        pass
+            groups = {v: np.asarray(rs, dtype=np.int64) for v, rs in buckets.items()}
+            self._groups.put(field, groups)
+        return groups
+
+    def filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """
+        Sorted live rows matching `filter`: every key must match; a list/tuple/set
+        value matches any of its items, e.g. {"source": ["bls.md", "als.md"]}.
+        """
+        rows: Optional[np.ndarray] = None
+        for field, want in filter.items():
+            groups = self._field_groups(field)
+            values = want if isinstance(want, (list, tuple, set, frozenset)) else (want,)
+            parts = [groups[v] for v in values if v in groups]
+            r = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            rows = r if rows is None else np.intersect1d(rows, r, assume_unique=True)
+        if rows is None:  # empty filter: everything live
+            rows = np.asarray(self._live_rows(), dtype=np.int64)
+        return rows
+
+    def has_label(self, label: int) -> bool:
+        return int(label) in self.label_rows
+
+    def hits_for(self, labels: Sequence[int], scores: Sequence[float]) -> List[Hit]:
+        """Hits for labels found elsewhere (e.g. by the sparse index); labels no longer here are skipped."""
+        rows = [self.label_rows.get(int(l)) for l in labels]
+        return [Hit(int(l), float(s), self.meta, r) for l, s, r in zip(labels, scores, rows) if r is not None]
+
+    def chunk_texts(self) -> Tuple[List[int], List[str]]:
+        """(labels, texts) of the live chunks: what the sparse index is built from."""
+        live = self._live_rows()
+        text = getattr(self.meta, "text", None)  # MetaStore: decode only the text
+        texts = [text(r) if text is not None else self.meta[r]["text"] for r in live]
+        return [self.row_labels[r] for r in live], texts
+
+    def _live_rows(self) -> List[int]:
+        self._sync_rows()
+        return [r for r, label in enumerate(self.row_labels) if label != -1]
+
+    def _save_rows(self, path: str, live: List[int]) -> None:
+        if len(live) == len(self.meta):
+            MetaStore.write(path, self.meta)
+        else:
+            MetaStore.write(path, (self.meta[r] for r in live))
+        _save_npy(path, LABELS_FILE, np.asarray([self.row_labels[r] for r in live], dtype=np.int64))
+
+    def _load_rows(self, path: str) -> None:
+        self.meta = _load_meta(path)
+        lp = os.path.join(path, LABELS_FILE)
+        # indexes saved before stable labels: label == row
+        labels = np.load(lp).tolist() if os.path.exists(lp) else list(range(len(self.meta)))
+        assert len(labels) == len(self.meta), f"{LABELS_FILE} does not match the metadata rows"
+        self.row_labels = labels
+        self.label_rows = {label: r for r, label in enumerate(labels)}
+        self._invalidate_filters()
+
 
 # Hierarchical Navigable Small World (HNSW) Index
-class HnswIndex(VectorIndex):
-    def __init__(self, ef_construction: int = 200, M: int = 16, ef: int = 128):
+class HnswIndex(_RowMap, ArrayVectorIndex):
+    def __init__(
+        self,
+        ef_construction: int = 200,
+        M: int = 16,
+        ef: Optional[int] = None,
+        initial_capacity: int = 10_000,
+        growth: float = 2.0,
+        num_threads: int = -1,
+    ):
 
         # Placeholder for the HNSW objects
         self.index = None
@@ -30,57 +246,855 @@ class HnswIndex(VectorIndex):
         self.M = M
 
         # exploration factor at query time: higher -> more neighbors are searched, better recall, slower and more memory intensive
-        self.ef = ef
-        self.meta: List[Dict[str, Any]] = []  # aligned with ID -> metadata+text
+        # None: DEFAULT_EF, or the value `rag tune-index` recorded in the manifest when loading
+        self.ef = DEFAULT_EF if ef is None else ef
+        self._ef_from_manifest = ef is None
+        self._init_rows()
+
+        # optional dimensionality reduction; queries must be projected the same way (Retriever does it)
+        self.projection: Optional[Projection] = None
+
+        # optional BM25 index over the chunk texts (built by ingest, used by the hybrid Retriever)
+        self.sparse: Optional[SparseIndex] = None
+
+        # capacity management: start small, grow geometrically (resize_index) when an upsert needs more
+        self.initial_capacity = initial_capacity
+        self.growth = growth
+
+        # threads used by hnswlib for add_items/knn_query; -1 = all cores
+        self.num_threads = num_threads
+
+        # throughput of the most recent upsert (reported by ingest)
+        self.last_insert: Dict[str, Any] = {}
+
+        # provenance recorded in manifest.json (set by ingest, read back by load)
+        self.embedder_name: Optional[str] = None
+        self.chunker: Dict[str, Any] = {}
+
+        # live upserts while serving: queries share _rw, writers are serialized by _writer and take
+        # _rw exclusively only to resize and publish metadata; add_items then runs alongside queries
+        # (hnswlib locks per element). _pending: labels published but not yet in the graph
+        self._rw = RWLock()
+        self._writer = threading.Lock()
+        self._pending: FrozenSet[int] = frozenset()
 
     def build(self, dim: int, space: str = "cosine") -> None:
         self.dim = dim
         self.space = space
         self.index = hnswlib.Index(space=space, dim=dim)
-        # heuristic: capacity grows as we add; start with 10k
-        self.index.init_index(max_elements=10_000, ef_construction=self.ef_construction, M=self.M)
+        # capacity grows as we add (see _reserve); start with initial_capacity
+        self.index.init_index(max_elements=self.initial_capacity, ef_construction=self.ef_construction, M=self.M)
         self.index.set_ef(self.ef)
 
-    def upsert(self, vectors: List[List[float]], metas: List[Dict[str, Any]]) -> None:
+    def set_ef(self, ef: int) -> None:
+        with self._rw.write():
+            self.ef = ef
+            if self.index is not None:
+                self.index.set_ef(ef)
+
+    def _reserve(self, n_new: int) -> None:
+        """Make room for n_new more elements, growing capacity geometrically."""
+        needed = self.index.get_current_count() + n_new
+        capacity = self.index.get_max_elements()
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, int(capacity * self.growth))
+        self.index.resize_index(new_capacity)
+
+    def upsert(self, vectors: List[List[float]], metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        self.upsert_array(np.asarray(vectors, dtype=np.float32), metas, labels)
+
+    def upsert_array(self, vectors: np.ndarray, metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        """Add vectors; with stable `labels` (see chunk_label) an existing label is replaced in place."""
         assert self.index is not None, "Index not built"
-        arr = np.asarray(vectors, dtype=np.float32)
-        start_id = len(self.meta)
-        ids = np.arange(start_id, start_id + arr.shape[0])
-        self.index.add_items(arr, ids)
-        self.meta.extend(metas)
+        arr = np.ascontiguousarray(vectors, dtype=np.float32)  # no copy if already float32/C-order
+        with self._writer:
+            ids = self._next_labels(arr.shape[0]) if labels is None else np.asarray(labels, dtype=np.uint64)
+            assert len(ids) == arr.shape[0] == len(metas), "vectors/metas/labels length mismatch"
+            t0 = time.perf_counter()
+            with self._rw.write():
+                new = frozenset(int(l) for l in ids if int(l) not in self.label_rows)
+                # replaced labels reuse their slot; deleted ones re-added may too (overestimate is fine)
+                self._reserve(len(new))
+                # metadata first: a label a query can get back from the graph always resolves
+                self._add_rows(ids, metas)
+                self._pending = new
+            try:
+                self.index.add_items(arr, ids, num_threads=self.num_threads)
+            finally:
+                with self._rw.write():
+                    self._pending = frozenset()
+            seconds = time.perf_counter() - t0
+        self.last_insert = _insert_stats(arr.shape[0], seconds, capacity=self.index.get_max_elements())
+
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.query_array(np.asarray(vector, dtype=np.float32), k=k, filter=filter)
+
+    def query_array(self, vector: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        q = np.ascontiguousarray(vector, dtype=np.float32).reshape(1, -1)
+        return self.query_batch(q, k=k, filter=filter)[0]
 
-    def query(self, vector: List[float], k: int = 5) -> List[Dict[str, Any]]:
+    def query_batch(self, vectors: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        """One knn_query over a (n, dim) matrix, parallel over num_threads; one hit list per row."""
         assert self.index is not None, "Index not built/loaded"
-        q = np.asarray([vector], dtype=np.float32)
-        labels, dists = self.index.knn_query(q, k=k)
-        out: List[Dict[str, Any]] = []
-        for idx, dist in zip(labels[0], dists[0]):
-            m = self.meta[int(idx)]
-            out.append({"text": m["text"], "meta": {k:v for k,v in m.items() if k != "text"}, "score": float(dist)})
-        return out
+        q = np.ascontiguousarray(vectors, dtype=np.float32)
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        if q.shape[0] == 0:
+            return []
+        with self._rw.read():
+            if filter:
+                return self._query_filtered(q, k, filter)
+            # hnswlib raises when asked for more than it holds
+            k = min(k, len(self.label_rows) - len(self._pending))
+            if k <= 0:
+                return [[] for _ in range(q.shape[0])]
+            labels, dists = self.index.knn_query(q, k=k, num_threads=self.num_threads if q.shape[0] > 1 else 1)
+            return [self._hits(l, d) for l, d in zip(labels, dists)]
+
+    def allowed_labels(self, filter: Dict[str, Any]) -> FrozenSet[int]:
+        """Labels matching `filter`, precomputed once per distinct filter until the next add/delete."""
+        key = _filter_key(filter)
+        allowed = self._filter_cache.get(key)
+        if allowed is None:
+            allowed = frozenset(self.row_labels[r] for r in self.filter_rows(filter))
+            self._filter_cache.put(key, allowed)
+        return allowed
+
+    def _query_filtered(self, q: np.ndarray, k: int, filter: Dict[str, Any]) -> List[List[Hit]]:
+        allowed = self.allowed_labels(filter)
+        if self._pending:
+            allowed = allowed - self._pending  # not in the graph yet
+        k = min(k, len(allowed))
+        if k == 0:
+            return [[] for _ in range(q.shape[0])]
+        if len(allowed) > self.ef:
+            try:
+                # filter runs inside the graph traversal; a Python callback needs the GIL, so one thread
+                labels, dists = self.index.knn_query(q, k=k, num_threads=1, filter=allowed.__contains__)
+                return [self._hits(l, d) for l, d in zip(labels, dists)]
+            except RuntimeError:
+                pass  # traversal found fewer than k matches (very selective filter): go exact
+        return self._exact(q, np.fromiter(allowed, dtype=np.uint64, count=len(allowed)), k)
+
+    def _exact(self, q: np.ndarray, labels: np.ndarray, k: int) -> List[List[Hit]]:
+        """Brute force over a small label set (vectors read back from the graph)."""
+        vecs = np.asarray(self.index.get_items(labels), dtype=np.float32)
+        if self.space == "l2":
+            d = (q * q).sum(1)[:, None] - 2.0 * (q @ vecs.T) + (vecs * vecs).sum(1)[None, :]
+        else:
+            qn = q / np.clip(np.linalg.norm(q, axis=1, keepdims=True), 1e-12, None) if self.space == "cosine" else q
+            d = 1.0 - qn @ vecs.T  # hnswlib stores cosine vectors normalized
+        order = np.argsort(d, axis=1, kind="stable")[:, :k]
+        return [self._hits(labels[o], d[i, o]) for i, o in enumerate(order)]
+
+    def _hits(self, labels: np.ndarray, dists: np.ndarray) -> List[Hit]:
+        labels = labels.tolist()
+        rows = [self.label_rows.get(l, l) for l in labels]
+        return _hits(self.meta, rows, dists, labels)
+
+    def hits_for(self, labels: Sequence[int], scores: Sequence[float]) -> List[Hit]:
+        with self._rw.read():
+            if self._pending:  # published metadata, vectors not in the graph yet
+                keep = [i for i, l in enumerate(labels) if int(l) not in self._pending]
+                labels, scores = [labels[i] for i in keep], [scores[i] for i in keep]
+            return super().hits_for(labels, scores)
+
+    def get_vectors(self, labels: Sequence[int]) -> np.ndarray:
+        """(n, dim) stored vectors of `labels` (cosine: normalized), e.g. for MMR."""
+        assert self.index is not None, "Index not built/loaded"
+        if len(labels) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        with self._rw.read():
+            return np.asarray(self.index.get_items([int(l) for l in labels]), dtype=np.float32)
+
+    def mark_deleted(self, labels: Sequence[int]) -> int:
+        """Hide `labels` from queries (hnswlib keeps the slot; re-adding a label reuses it)."""
+        assert self.index is not None, "Index not built/loaded"
+        dropped = 0
+        with self._writer, self._rw.write():
+            for label in labels:
+                if self._drop_labels([label]):
+                    self.index.mark_deleted(int(label))
+                    dropped += 1
+        return dropped
 
     def save(self, path: str) -> None:
         assert self.index is not None, "Index not built"
         os.makedirs(path, exist_ok=True)
-        self.index.save_index(os.path.join(path, "hnsw.bin"))
-        with open(os.path.join(path, "meta.jsonl"), "w", encoding="utf-8") as f:
-            for m in self.meta:
-                f.write(json.dumps(m, ensure_ascii=False) + "\n")
-
-    def load(self, path: str) -> None:
-        # you must know dim/space; store it in meta header or infer by re-embedding one
-        # for simplicity, store it inside meta.jsonl first line
-        meta_path = os.path.join(path, "meta.jsonl")
-        assert os.path.exists(meta_path), "meta.jsonl missing"
-        self.meta = []
-        with open(meta_path, "r", encoding="utf-8") as f:
-            for line in f:
-                self.meta.append(json.loads(line))
-        assert len(self.meta) > 0, "no metadata found"
-        header = self.meta[0].get("_index_header")
-        assert header, "missing _index_header in first meta"
+        with self._writer:  # a consistent snapshot; queries keep running
+            # replace, never overwrite: a reader (or a hard-linked older version, see rag.publish) may hold the old file
+            with replacing(os.path.join(path, "hnsw.bin")) as tmp:
+                self.index.save_index(tmp)
+            self._save_rows(path, self._live_rows())
+            if self.projection is not None:
+                self.projection.save(path)
+            save_sparse(path, self.sparse)
+            write_manifest(path, self.manifest())
+
+    def manifest(self) -> IndexManifest:
+        assert self.index is not None, "Index not built"
+        return IndexManifest(
+            dim=self.dim,
+            space=self.space,
+            M=self.M,
+            ef_construction=self.ef_construction,
+            count=len(self._live_rows()),
+            # the graph keeps mark_deleted elements until a full rebuild; count is live rows, as for flat
+            params={"ef": self.ef, "elements": self.index.get_current_count()},
+            embedder=self.embedder_name,
+            chunker=dict(self.chunker),
+            projection=self.projection.header() if self.projection is not None else None,
+        )
+
+    def load(self, path: str, embedder: Optional[str] = None) -> None:
+        """Load an index dir; with `embedder`, refuse (ValueError) an index built by a different model."""
+        # manifest first: small file, validated before hnsw.bin/metadata are touched
+        manifest = validate_manifest(path, embedder=embedder)
+        if manifest is not None:
+            assert manifest.backend == "hnsw", f"{path} is a {manifest.backend} index (use open_index)"
+        self._load_rows(path)
+        if manifest is not None:
+            header = {"dim": manifest.dim, "space": manifest.space, "projection": manifest.projection}
+            self.M, self.ef_construction = manifest.M, manifest.ef_construction
+            if self._ef_from_manifest:
+                self.ef = manifest.params.get("ef", self.ef)
+            self.embedder_name, self.chunker = manifest.embedder, manifest.chunker
+        else:
+            # older indexes: dim/space live in the header stored as the first metadata row
+            assert len(self.meta) > 0, "no metadata found"
+            header = self.meta[0].get("_index_header")
+            assert header, "missing _index_header in first meta"
         self.dim = header["dim"]; self.space = header["space"]
+        self.projection = Projection.load(path, header["projection"]) if header.get("projection") else None
+        self.sparse = load_sparse(path)
         self.index = hnswlib.Index(space=self.space, dim=self.dim)
         self.index.load_index(os.path.join(path, "hnsw.bin"))
         self.index.set_ef(self.ef)
+        if manifest is not None:
+            elements = manifest.params.get("elements", manifest.count)  # older manifests: count was the graph total
+            if self.index.get_current_count() != elements:
+                raise ValueError(f"index {path}: {self.index.get_current_count()} elements, manifest says {elements}")
+
+
+
+def _hits(meta: Sequence[Dict[str, Any]], rows: Sequence[int], dists: np.ndarray, labels: Optional[Sequence[int]] = None) -> List[Hit]:
+    # text/meta stay in the store until a caller reads them (see Hit)
+    rows = np.asarray(rows).tolist()
+    labels = rows if labels is None else np.asarray(labels).tolist()
+    return [Hit(l, d, meta, r) for l, r, d in zip(labels, rows, np.asarray(dists, dtype=np.float64).tolist())]
+
+
+def _load_meta(path: str) -> Sequence[Dict[str, Any]]:
+    if MetaStore.exists(path):
+        return MetaStore.open(path)
+    legacy = os.path.join(path, LEGACY_JSONL)
+    assert os.path.exists(legacy), "index metadata missing (no meta/ and no meta.jsonl)"
+    # index written before the columnar store: convert once, next load is mmapped
+    try:
+        convert_jsonl(path)
+    except OSError:
+        return read_jsonl(legacy)  # read-only index dir: keep the old in-memory rows
+    return MetaStore.open(path)
+
+
+# Exact (brute-force) index: one matrix product per query batch
+class FlatIndex(_RowMap, ArrayVectorIndex):
+    """
+    All vectors in one float32 (n, dim) matrix; queries are a matrix product
+    plus np.argpartition top-k. Exact, no build cost, and faster than HNSW for
+    a few thousand chunks (see scripts/bench_index.py). Distances match
+    hnswlib's: cosine/ip -> 1 - dot, l2 -> squared euclidean.
+    Saved as vectors.npy, loaded memory-mapped.
+    """
+
+    BACKEND = "flat"
+
+    def __init__(self, initial_capacity: int = 1_024, growth: float = 2.0):
+        self.dim = None
+        self.space = "cosine"
+        self._init_rows()  # matrix row i <-> metadata row i
+        self._dead: List[int] = []  # tombstoned rows, masked out of queries until save compacts them
+        self.projection: Optional[Projection] = None
+        self.sparse: Optional[SparseIndex] = None
+        self.embedder_name: Optional[str] = None
+        self.chunker: Dict[str, Any] = {}
+        self.last_insert: Dict[str, Any] = {}
+        self.initial_capacity = initial_capacity
+        self.growth = growth
+        # rows [0, count) of _buf are live; the buffer grows geometrically like HnswIndex capacity
+        self._buf: Optional[np.ndarray] = None
+        self.count = 0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        assert self._buf is not None, "Index not built/loaded"
+        return self._buf[: self.count]
+
+    def build(self, dim: int, space: str = "cosine") -> None:
+        assert space in ("cosine", "ip", "l2"), f"unsupported space: {space}"
+        self.dim = dim
+        self.space = space
+        self._allocate(self.initial_capacity)
+        self.count = 0
+
+    def _allocate(self, capacity: int) -> None:
+        self._buf = np.empty((capacity, self.dim), dtype=np.float32)
+
+    def _grown(self, buf: np.ndarray, n_new: int) -> np.ndarray:
+        """`buf` if it has room for n_new more rows, else a larger writable copy of its live rows."""
+        needed = self.count + n_new
+        capacity = buf.shape[0]
+        if needed <= capacity and buf.flags.writeable:
+            return buf
+        new_buf = np.empty((max(needed, int(capacity * self.growth)),) + buf.shape[1:], dtype=buf.dtype)
+        new_buf[: self.count] = buf[: self.count]  # also detaches a loaded (read-only) memmap
+        return new_buf
+
+    def _reserve(self, n_new: int) -> None:
+        self._buf = self._grown(self._buf, n_new)
+
+    def _write_rows(self, start: int, arr: np.ndarray) -> None:
+        self._buf[start : start + arr.shape[0]] = arr
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        arr = np.ascontiguousarray(vectors, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if self.space == "cosine":
+            arr = arr / np.clip(np.linalg.norm(arr, axis=1, keepdims=True), 1e-12, None)
+        return arr
+
+    def upsert(self, vectors: List[List[float]], metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        self.upsert_array(np.asarray(vectors, dtype=np.float32), metas, labels)
+
+    def upsert_array(self, vectors: np.ndarray, metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        """Append rows; a label that already exists has its old row tombstoned (replaced)."""
+        assert self._buf is not None, "Index not built"
+        arr = self._prepare(vectors)
+        assert arr.shape[1] == self.dim, f"expected dim {self.dim}, got {arr.shape[1]}"
+        assert self.count == len(self.meta), "FlatIndex metadata rows must stay aligned with vectors"
+        ids = self._next_labels(arr.shape[0]) if labels is None else labels
+        assert len(ids) == arr.shape[0] == len(metas), "vectors/metas/labels length mismatch"
+        t0 = time.perf_counter()
+        self._reserve(arr.shape[0])
+        self._write_rows(self.count, arr)
+        self.count += arr.shape[0]
+        seconds = time.perf_counter() - t0
+        self._dead.extend(self._add_rows(ids, metas))
+        self.last_insert = _insert_stats(arr.shape[0], seconds, capacity=int(self._buf.shape[0]))
+
+    def mark_deleted(self, labels: Sequence[int]) -> int:
+        """Hide `labels` from queries; their rows are dropped on the next save."""
+        rows = self._drop_labels(labels)
+        self._dead.extend(rows)
+        return len(rows)
+
+    def _distances(self, q: np.ndarray) -> np.ndarray:
+        """(n_queries, count) distances to every stored row."""
+        mat = self.vectors
+        if self.space == "l2":
+            # |q - v|^2 = |q|^2 - 2 q.v + |v|^2
+            return (q * q).sum(1)[:, None] - 2.0 * (q @ mat.T) + (mat * mat).sum(1)[None, :]
+        return 1.0 - q @ mat.T
+
+    def _float_rows(self) -> np.ndarray:
+        return self.vectors
+
+    def get_vectors(self, labels: Sequence[int]) -> np.ndarray:
+        """(n, dim) stored vectors of `labels` (cosine: normalized), e.g. for MMR."""
+        rows = np.asarray([self.label_rows[int(l)] for l in labels], dtype=np.int64)
+        return np.asarray(self._float_rows()[rows], dtype=np.float32).reshape(len(rows), self.dim)
+
+    def allowed_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Bitset (bool per row) of rows matching `filter`, precomputed once per distinct filter."""
+        key = _filter_key(filter)
+        mask = self._filter_cache.get(key)
+        if mask is None:
+            mask = np.zeros(self.count, dtype=bool)
+            mask[self.filter_rows(filter)] = True
+            self._filter_cache.put(key, mask)
+        return mask
+
+    def _search(self, q: np.ndarray, k: int, allowed: Optional[np.ndarray] = None):
+        """(rows, distances) for each query row, nearest first; `allowed` restricts to a row bitset."""
+        d = self._distances(q)
+        if allowed is not None:
+            k = min(k, int(allowed.sum()))  # tombstones are never in the bitset
+            d[:, ~allowed] = np.inf
+        else:
+            k = min(k, self.count - len(self._dead))
+            if self._dead:
+                d[:, self._dead] = np.inf
+        if k < self.count:
+            part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(self.count), d.shape)
+        pd = np.take_along_axis(d, part, axis=1)
+        order = np.argsort(pd, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(pd, order, axis=1)
+
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.query_array(np.asarray(vector, dtype=np.float32), k=k, filter=filter)
+
+    def query_array(self, vector: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.query_batch(vector, k=k, filter=filter)[0]
+
+    def query_batch(self, vectors: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        assert self._buf is not None, "Index not built/loaded"
+        q = self._prepare(vectors)
+        if q.shape[0] == 0:
+            return []
+        rows, dists = self._search(q, k, self.allowed_mask(filter) if filter else None)
+        return [_hits(self.meta, r, d, [self.row_labels[i] for i in r.tolist()]) for r, d in zip(rows, dists)]
+
+    def save(self, path: str) -> None:
+        assert self._buf is not None, "Index not built"
+        os.makedirs(path, exist_ok=True)
+        live = self._live_rows()
+        self._save_arrays(path, live)
+        self._save_rows(path, live)
+        if self.projection is not None:
+            self.projection.save(path)
+        save_sparse(path, self.sparse)
+        write_manifest(path, self.manifest())
+
+    def _params(self) -> Dict[str, Any]:
+        return {}
+
+    def memory_bytes(self) -> int:
+        """Bytes of vector data scored per query."""
+        return self.count * self.dim * 4
+
+    def _save_arrays(self, path: str, live: List[int]) -> None:
+        _save_npy(path, FLAT_FILE, self.vectors[live] if self._dead else self.vectors)  # compacts tombstones
+
+    def _load_arrays(self, path: str, params: Dict[str, Any]) -> None:
+        self._buf = np.load(os.path.join(path, FLAT_FILE), mmap_mode="r")
+
+    def manifest(self) -> IndexManifest:
+        return IndexManifest(
+            dim=self.dim,
+            space=self.space,
+            M=None,
+            ef_construction=None,
+            count=self.count - len(self._dead),
+            backend=self.BACKEND,
+            params=self._params(),
+            embedder=self.embedder_name,
+            chunker=dict(self.chunker),
+            projection=self.projection.header() if self.projection is not None else None,
+        )
+
+    def load(self, path: str, embedder: Optional[str] = None) -> None:
+        manifest = validate_manifest(path, embedder=embedder)
+        assert manifest is not None and manifest.backend == self.BACKEND, f"{path} is not a {self.BACKEND} index"
+        self._load_rows(path)
+        self._dead = []
+        self.dim, self.space = manifest.dim, manifest.space
+        self.embedder_name, self.chunker = manifest.embedder, manifest.chunker
+        self.projection = Projection.load(path, manifest.projection) if manifest.projection else None
+        self.sparse = load_sparse(path)
+        self._load_arrays(path, manifest.params)
+        self.count = self._buf.shape[0]
+        if self.count != manifest.count:
+            raise ValueError(f"index {path}: {self.count} vectors, manifest says {manifest.count}")
+
+
+
+# Scalar-quantized flat index: int8 codes in memory, float32 only on disk for re-ranking
+class Int8Index(FlatIndex):
+    """
+    FlatIndex with vectors stored as int8 codes (1 byte per dimension instead
+    of 4) and symmetric scales learned from the first upsert:
+      - "dimension": one scale per dimension, max |x_j| / 127 over the build vectors
+      - "vector":    one scale per row, max |x_i| / 127 (nothing to fit)
+    Queries are quantized the same way and scored with int32 dot products over
+    row blocks. With rerank > 0 the best k * rerank candidates are re-scored
+    against the float32 vectors, which after load stay on disk (memory-mapped
+    vectors.npy), so only those candidate rows are paged in. cosine/ip only.
+    """
+
+    BACKEND = "int8"
+
+    def __init__(
+        self,
+        scale_mode: str = "dimension",
+        rerank: int = 4,
+        initial_capacity: int = 1_024,
+        growth: float = 2.0,
+        block_rows: int = 2_048,
+    ):
+        super().__init__(initial_capacity=initial_capacity, growth=growth)
+        assert scale_mode in ("dimension", "vector"), f"unknown scale mode: {scale_mode}"
+        self.scale_mode = scale_mode
+        self.rerank = rerank
+        self.block_rows = block_rows          # bounds the int32 temporaries of one scoring pass
+        self.scales: Optional[np.ndarray] = None   # (dim,) for "dimension" mode
+        self._row_scales: Optional[np.ndarray] = None  # (capacity,) for "vector" mode
+        self._fp32: Optional[np.ndarray] = None   # full-precision rows for re-ranking
+
+    def build(self, dim: int, space: str = "cosine") -> None:
+        assert space in ("cosine", "ip"), "Int8Index scores dot products: space must be cosine or ip"
+        self.scales = None
+        super().build(dim, space)
+
+    def _allocate(self, capacity: int) -> None:
+        self._buf = np.empty((capacity, self.dim), dtype=np.int8)
+        self._fp32 = np.empty((capacity, self.dim), dtype=np.float32)
+        self._row_scales = np.empty(capacity, dtype=np.float32)
+
+    def _reserve(self, n_new: int) -> None:
+        self._buf = self._grown(self._buf, n_new)
+        self._fp32 = self._grown(self._fp32, n_new)
+        self._row_scales = self._grown(self._row_scales, n_new)
+
+    def _quantize(self, x: np.ndarray):
+        """(int8 codes, per-row scales or None) for float rows x."""
+        if self.scale_mode == "dimension":
+            return np.clip(np.rint(x / self.scales), -127, 127).astype(np.int8), None
+        s = np.clip(np.abs(x).max(axis=1), 1e-12, None) / 127.0
+        return np.clip(np.rint(x / s[:, None]), -127, 127).astype(np.int8), s.astype(np.float32)
+
+    def _write_rows(self, start: int, arr: np.ndarray) -> None:
+        if self.scale_mode == "dimension" and self.scales is None:
+            # later upserts reuse these scales; values beyond the fitted range are clipped
+            self.scales = (np.clip(np.abs(arr).max(axis=0), 1e-12, None) / 127.0).astype(np.float32)
+        codes, row_scales = self._quantize(arr)
+        end = start + arr.shape[0]
+        self._buf[start:end] = codes
+        if row_scales is not None:
+            self._row_scales[start:end] = row_scales
+        self._fp32[start:end] = arr
+
+    def _distances(self, q: np.ndarray) -> np.ndarray:
+        # fold the per-dimension scales into the query, then quantize it per row
+        qf = q * self.scales if self.scale_mode == "dimension" else q
+        qs = np.clip(np.abs(qf).max(axis=1), 1e-12, None) / 127.0
+        qc = np.clip(np.rint(qf / qs[:, None]), -127, 127).astype(np.int8).T
+        # int8 x int8 sums stay below 2**24 up to dim 1040, so float32 BLAS computes the integer
+        # dot product exactly (and ~3x faster than NumPy's non-BLAS int32 matmul)
+        exact_in_fp32 = self.dim * 127 * 127 < 2 ** 24
+        qm = qc.astype(np.float32) if exact_in_fp32 else qc
+        scores = np.empty((q.shape[0], self.count), dtype=np.float32)
+        for b in range(0, self.count, self.block_rows):
+            block = self._buf[b : min(b + self.block_rows, self.count)]
+            if exact_in_fp32:
+                ip = block.astype(np.float32) @ qm
+            else:
+                ip = np.matmul(block, qm, dtype=np.int32)
+            scores[:, b : b + block.shape[0]] = ip.T
+        scores *= qs[:, None]
+        if self.scale_mode == "vector":
+            scores *= self._row_scales[: self.count][None, :]
+        return 1.0 - scores
+
+    def _search(self, q: np.ndarray, k: int, allowed: Optional[np.ndarray] = None):
+        if self.rerank <= 0:
+            return super()._search(q, k, allowed)
+        cand, _ = super()._search(q, k * self.rerank, allowed)
+        k = min(k, cand.shape[1])
+        rows = np.empty((q.shape[0], k), dtype=np.int64)
+        dists = np.empty((q.shape[0], k), dtype=np.float32)
+        for i in range(q.shape[0]):
+            c = np.sort(cand[i])  # ascending rows: sequential reads from the memory-mapped file
+            d = 1.0 - self._fp32[c] @ q[i]
+            order = np.argsort(d, kind="stable")[:k]
+            rows[i], dists[i] = c[order], d[order]
+        return rows, dists
+
+    def _float_rows(self) -> np.ndarray:
+        return self._fp32[: self.count]  # the float32 copy, not the int8 codes
+
+    def _params(self) -> Dict[str, Any]:
+        return {"scale_mode": self.scale_mode}
+
+    def _save_arrays(self, path: str, live: List[int]) -> None:
+        n = self.count
+        take = (lambda a: a[live]) if self._dead else (lambda a: a)
+        _save_npy(path, INT8_FILE, take(self._buf[:n]))
+        _save_npy(path, FLAT_FILE, take(self._fp32[:n]))
+        scales = self.scales if self.scale_mode == "dimension" else take(self._row_scales[:n])
+        _save_npy(path, INT8_SCALES_FILE, np.zeros(0, np.float32) if scales is None else scales)
+
+    def _load_arrays(self, path: str, params: Dict[str, Any]) -> None:
+        self.scale_mode = params.get("scale_mode", "dimension")
+        self._buf = np.load(os.path.join(path, INT8_FILE), mmap_mode="r")
+        self._fp32 = np.load(os.path.join(path, FLAT_FILE), mmap_mode="r")  # not resident; re-rank reads rows
+        scales = np.load(os.path.join(path, INT8_SCALES_FILE))
+        if self.scale_mode == "dimension":
+            self.scales = scales if scales.size else None
+            self._row_scales = np.empty(self._buf.shape[0], dtype=np.float32)
+        else:
+            self._row_scales = scales
+
+    def memory_bytes(self) -> int:
+        """Bytes scored in memory per query (codes + scales); the float32 copy stays on disk."""
+        n = self.count * self.dim
+        return n + (self.dim if self.scale_mode == "dimension" else self.count) * 4
+
+
+# Sharded index: N independent sub-indexes (own dir, own manifest) behind one VectorIndex
+class ShardedIndex(ArrayVectorIndex):
+    """
+    Chunks are partitioned over `n_shards` sub-indexes of `shard_backend`:
+      - "source": by document (crc32 of meta["source"]) - a document lives in one
+        shard, so re-ingesting it rewrites one shard and source filters skip the rest
+      - "hash":   by chunk label - evenly sized shards
+    Upserts, queries (per-shard top-k merged by score), save and load fan out over a
+    thread pool (hnswlib and numpy release the GIL). Each shard is a complete index
+    under <path>/shards/shard_NNN/; save() only rewrites shards changed since the
+    last save/load.
+    """
+
+    BACKEND = "sharded"
+
+    def __init__(
+        self,
+        n_shards: int = 4,
+        partition: str = "source",
+        shard_backend: str = "hnsw",
+        shard_kwargs: Optional[Dict[str, Any]] = None,
+        max_workers: Optional[int] = None,
+    ):
+        assert n_shards >= 1, "n_shards must be >= 1"
+        assert partition in ("source", "hash"), f"unknown partition: {partition}"
+        assert shard_backend in INDEX_BACKENDS and shard_backend != self.BACKEND, f"bad shard backend: {shard_backend}"
+        self.n_shards = n_shards
+        self.partition = partition
+        self.shard_backend = shard_backend
+        self.shard_kwargs = dict(shard_kwargs or {})
+        self.max_workers = max_workers or n_shards
+        self.shards: List[ArrayVectorIndex] = []
+        self.dim = None
+        self.space = "cosine"
+        self.projection: Optional[Projection] = None
+        self.sparse: Optional[SparseIndex] = None  # one BM25 index over all shards
+        self.embedder_name: Optional[str] = None
+        self.chunker: Dict[str, Any] = {}
+        self.last_insert: Dict[str, Any] = {}
+        self._next = 0
+        self._dirty: set = set()
+        self._path: Optional[str] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()  # concurrent first queries create one pool
+
+    def _map(self, fn, items) -> list:
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(x) for x in items]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard")
+            pool = self._pool
+        return list(pool.map(fn, items))
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _new_shard(self) -> ArrayVectorIndex:
+        kwargs = dict(self.shard_kwargs)
+        if self.shard_backend == "hnsw":
+            # shards already run concurrently: split the cores instead of oversubscribing them
+            kwargs.setdefault("num_threads", max(1, (os.cpu_count() or 1) // self.n_shards))
+        return INDEX_BACKENDS[self.shard_backend](**kwargs)
+
+    @staticmethod
+    def shard_dir(path: str, i: int) -> str:
+        return os.path.join(path, SHARDS_DIR, f"shard_{i:03d}")
+
+    def shard_of(self, label: int, meta: Dict[str, Any]) -> int:
+        if self.partition == "source":
+            return zlib.crc32(str(meta.get("source", "")).encode("utf-8")) % self.n_shards
+        return int(label) % self.n_shards
+
+    def build(self, dim: int, space: str = "cosine") -> None:
+        self.dim, self.space = dim, space
+        self.shards = [self._new_shard() for _ in range(self.n_shards)]
+        for shard in self.shards:
+            shard.build(dim=dim, space=space)
+        self._dirty = set(range(self.n_shards))
+
+    def upsert(self, vectors: List[List[float]], metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        self.upsert_array(np.asarray(vectors, dtype=np.float32), metas, labels)
+
+    def upsert_array(self, vectors: np.ndarray, metas: List[Dict[str, Any]], labels: Optional[Sequence[int]] = None) -> None:
+        """Route rows to their shards and add them in parallel; a label that moved shards is removed from the old one."""
+        assert self.shards, "Index not built"
+        arr = np.ascontiguousarray(vectors, dtype=np.float32)
+        if labels is None:
+            labels = range(self._next, self._next + arr.shape[0])
+        ids = [int(l) for l in labels]
+        assert len(ids) == arr.shape[0] == len(metas), "vectors/metas/labels length mismatch"
+        self._next = max([self._next] + [l + 1 for l in ids])
+        parts: Dict[int, List[int]] = defaultdict(list)
+        for row, (label, meta) in enumerate(zip(ids, metas)):
+            parts[self.shard_of(label, meta)].append(row)
+        if self.partition == "source":  # a chunk whose source changed moves to another shard
+            for s, rows in parts.items():
+                moved = [ids[r] for r in rows if not self.shards[s].has_label(ids[r])]
+                for o, other in enumerate(self.shards):
+                    if o != s and moved and other.mark_deleted(moved):
+                        self._dirty.add(o)
+
+        def add(item):
+            s, rows = item
+            self.shards[s].upsert_array(arr[rows], [metas[r] for r in rows], labels=[ids[r] for r in rows])
+
+        t0 = time.perf_counter()
+        self._map(add, parts.items())
+        seconds = time.perf_counter() - t0
+        self._dirty.update(parts)
+        self.last_insert = _insert_stats(arr.shape[0], seconds, shards=len(parts))
+
+    def mark_deleted(self, labels: Sequence[int]) -> int:
+        labels = [int(l) for l in labels]
+        dropped = 0
+        for s, shard in enumerate(self.shards):
+            n = shard.mark_deleted(labels)
+            if n:
+                self._dirty.add(s)
+                dropped += n
+        return dropped
+
+    def has_label(self, label: int) -> bool:
+        return any(shard.has_label(label) for shard in self.shards)
+
+    def hits_for(self, labels: Sequence[int], scores: Sequence[float]) -> List[Hit]:
+        found = {h.label: h for shard in self.shards for h in shard.hits_for(labels, scores)}
+        return [found[int(l)] for l in labels if int(l) in found]
+
+    def get_vectors(self, labels: Sequence[int]) -> np.ndarray:
+        labels = [int(l) for l in labels]
+        out = np.empty((len(labels), self.dim), dtype=np.float32)
+        found = 0
+        for shard in self.shards:
+            idx = [i for i, l in enumerate(labels) if shard.has_label(l)]
+            if idx:
+                out[idx] = shard.get_vectors([labels[i] for i in idx])
+                found += len(idx)
+        assert found == len(labels), "get_vectors: unknown labels"
+        return out
+
+    def chunk_texts(self) -> Tuple[List[int], List[str]]:
+        labels: List[int] = []
+        texts: List[str] = []
+        for shard in self.shards:
+            l, t = shard.chunk_texts()
+            labels.extend(l)
+            texts.extend(t)
+        return labels, texts
+
+    def _shards_for(self, filter: Optional[Dict[str, Any]]) -> List[int]:
+        """Shards that can hold matches (all of them unless partitioned by a filtered source)."""
+        if filter and self.partition == "source" and "source" in filter:
+            want = filter["source"]
+            values = want if isinstance(want, (list, tuple, set, frozenset)) else (want,)
+            return sorted({self.shard_of(0, {"source": v}) for v in values})
+        return list(range(len(self.shards)))
+
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.query_array(np.asarray(vector, dtype=np.float32), k=k, filter=filter)
+
+    def query_array(self, vector: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.query_batch(np.asarray(vector, dtype=np.float32).reshape(1, -1), k=k, filter=filter)[0]
+
+    def query_batch(self, vectors: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        assert self.shards, "Index not built/loaded"
+        q = np.ascontiguousarray(vectors, dtype=np.float32)
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        if q.shape[0] == 0:
+            return []
+        kw = {"filter": filter} if filter else {}
+        per_shard = self._map(lambda s: self.shards[s].query_batch(q, k, **kw), self._shards_for(filter))
+        # every shard returns its exact/approximate top-k; the global top-k is among them
+        return [heapq.nsmallest(k, (h for hits in per_shard for h in hits[i]), key=lambda h: h.score)
+                for i in range(q.shape[0])]
+
+    def save(self, path: str) -> None:
+        assert self.shards, "Index not built"
+        os.makedirs(path, exist_ok=True)
+        todo = range(self.n_shards) if path != self._path else sorted(self._dirty)
+        self._map(lambda s: self.save_shard(path, s, manifest=False), todo)
+        if self.projection is not None:
+            self.projection.save(path)
+        save_sparse(path, self.sparse)
+        write_manifest(path, self.manifest())
+        self._path = path
+
+    def save_shard(self, path: str, i: int, manifest: bool = True) -> None:
+        """Write one shard (and, by default, refresh the top-level manifest)."""
+        shard = self.shards[i]
+        shard.embedder_name, shard.chunker = self.embedder_name, self.chunker  # provenance in each shard manifest
+        shard.save(self.shard_dir(path, i))
+        self._dirty.discard(i)
+        if manifest:
+            write_manifest(path, self.manifest())
+
+    def manifest(self) -> IndexManifest:
+        return IndexManifest(
+            dim=self.dim,
+            space=self.space,
+            M=None,
+            ef_construction=None,
+            count=sum(shard.manifest().count for shard in self.shards),
+            backend=self.BACKEND,
+            params={"n_shards": self.n_shards, "partition": self.partition, "shard_backend": self.shard_backend},
+            embedder=self.embedder_name,
+            chunker=dict(self.chunker),
+            projection=self.projection.header() if self.projection is not None else None,
+        )
+
+    def load(self, path: str, embedder: Optional[str] = None) -> None:
+        manifest = validate_manifest(path, embedder=embedder)
+        assert manifest is not None and manifest.backend == self.BACKEND, f"{path} is not a {self.BACKEND} index"
+        self.n_shards = manifest.params["n_shards"]
+        self.partition = manifest.params["partition"]
+        self.shard_backend = manifest.params["shard_backend"]
+        self.dim, self.space = manifest.dim, manifest.space
+        self.embedder_name, self.chunker = manifest.embedder, manifest.chunker
+        self.projection = Projection.load(path, manifest.projection) if manifest.projection else None
+        self.sparse = load_sparse(path)
+        self.shards = [None] * self.n_shards
+        self._map(lambda s: self.load_shard(path, s), range(self.n_shards))
+        # unlabeled upserts continue past every stored label instead of overwriting chunk 0, 1, ...
+        self._next = max((max(shard.label_rows, default=-1) + 1 for shard in self.shards), default=0)
+        self._dirty = set()
+        self._path = path
+        count = sum(shard.manifest().count for shard in self.shards)
+        if count != manifest.count:
+            raise ValueError(f"index {path}: {count} vectors in shards, manifest says {manifest.count}")
+
+    def load_shard(self, path: str, i: int) -> None:
+        """(Re)load one shard from disk, e.g. after it was rebuilt on its own."""
+        shard = self._new_shard()
+        shard.load(self.shard_dir(path, i), embedder=self.embedder_name)
+        self.shards[i] = shard
+        self._dirty.discard(i)
+
+
+INDEX_BACKENDS = {"hnsw": HnswIndex, "flat": FlatIndex, "int8": Int8Index, "sharded": ShardedIndex}
+
+# ingest picks the flat backend up to this many chunks. scripts/bench_index.py (384-d):
+# flat p50 ~0.35 ms at 5k, ~0.7 ms at 10k, vs ~0.2 ms for HNSW, but exact and with no
+# graph build (seconds); past ~10k the linear scan starts to show in per-query latency
+FLAT_MAX_CHUNKS = 10_000
+
+
+def choose_backend(n_chunks: int, backend: str = "auto", flat_max_chunks: int = FLAT_MAX_CHUNKS) -> str:
+    if backend != "auto":
+        assert backend in INDEX_BACKENDS, f"unknown index backend: {backend}"
+        return backend
+    return "flat" if n_chunks <= flat_max_chunks else "hnsw"
+
 
+def open_index(path: str, embedder: Optional[str] = None, **kwargs: Any) -> ArrayVectorIndex:
+    """Load an index dir (or the current version of a published root) with the backend in its manifest."""
+    path = resolve_index_dir(path)
+    index = INDEX_BACKENDS[index_backend(path)](**kwargs)
+    index.load(path, embedder=embedder)
+    return index
@@ -0,0 +1,71 @@
+# src/rag/ingest_state.py
+# ingest_state.json next to an index: per-document mtime/hash and chunk labels, so re-ingest only touches what changed
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from rag.fsutil import atomic_write
+
+INGEST_STATE = "ingest_state.json"
+DOC_SUFFIXES = (".txt", ".md")
+
+
+def text_sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_hash(stored_text: str, embedded_text: str) -> str:
+    """Content of one chunk as the index sees it (CustomChunker embeds the question, stores the answer)."""
+    return text_sha1(embedded_text + "\0" + stored_text)
+
+
+def scan_docs(docs_dir: str) -> Dict[str, float]:
+    """source name -> mtime for every document read_docs would pick up."""
+    out: Dict[str, float] = {}
+    for name in os.listdir(docs_dir):
+        p = os.path.join(docs_dir, name)
+        if os.path.isfile(p) and name.lower().endswith(DOC_SUFFIXES):
+            out[name] = os.path.getmtime(p)
+    return out
+
+
+def load_state(index_dir: str) -> Optional[Dict[str, Any]]:
+    p = os.path.join(index_dir, INGEST_STATE)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(index_dir: str, state: Dict[str, Any]) -> None:
+    atomic_write(os.path.join(index_dir, INGEST_STATE), lambda f: json.dump(state, f, ensure_ascii=False), mode="w")
+
+
+def doc_entry(mtime: float, sha1: str, chunks: Dict[int, str]) -> Dict[str, Any]:
+    """State of one document: chunks maps index label -> chunk_hash (JSON keys are strings)."""
+    return {"mtime": mtime, "sha1": sha1, "chunks": {str(label): h for label, h in chunks.items()}}
+
+
+@dataclass
+class ChunkDiff:
+    """What an incremental ingest has to do to the index for one or more documents."""
+    delete: List[int] = field(default_factory=list)    # labels to mark deleted
+    upsert: List[int] = field(default_factory=list)    # new or changed labels (embed + add/replace)
+    kept: int = 0                                      # chunks left untouched
+
+
+def diff_chunks(old: Dict[str, str], new: Dict[int, str]) -> ChunkDiff:
+    """Compare a document's previous chunks (state entry) with its fresh chunking."""
+    d = ChunkDiff()
+    old_int = {int(label): h for label, h in old.items()}
+    for label, h in new.items():
+        if old_int.get(label) == h:
+            d.kept += 1
+        else:
+            d.upsert.append(label)
+    d.delete = [label for label in old_int if label not in new]
+    return d
@@ -1,6 +1,9 @@
 # src/rag/interfaces.py
 from __future__ import annotations
-from typing import Dict, List, Iterable, Optional, Protocol, Any
+from collections.abc import Mapping
+from typing import Dict, List, Iterable, Iterator, Optional, Protocol, Any, Sequence
+
+import numpy as np
 
 
 # Protocol:
@@ -51,11 +54,100 @@ class Embedder(Protocol):
     def embed_one(self, text: str) -> List[float]:
         ...
 
+class Hit(Mapping):
+    """
+    One search result: label and score, with text/meta read from the index's
+    metadata row on first access (most hits of a large k never need them).
+    It is a read-only Mapping, so code written for the old
+    {'text': ..., 'meta': {...}, 'score': float} dicts keeps working, and
+    `dict(hit)` gives exactly that dict.
+    """
+
+    __slots__ = ("label", "score", "_rows", "_row", "_text", "_meta")
+    _KEYS = ("text", "meta", "score")
+
+    def __init__(
+        self,
+        label: int,
+        score: float,
+        rows: Optional[Sequence[Dict[str, Any]]] = None,
+        row: int = -1,
+        text: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ):
+        self.label = label
+        self.score = score
+        self._rows = rows     # index metadata (list or MetaStore); row `row` belongs to this hit
+        self._row = row
+        self._text = text
+        self._meta = meta
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            text = getattr(self._rows, "text", None)  # MetaStore: decode only the text
+            self._text = text(self._row) if text is not None else self._rows[self._row]["text"]
+        return self._text
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        if self._meta is None:
+            meta = getattr(self._rows, "meta", None)
+            if meta is not None:
+                self._meta = meta(self._row)
+            else:
+                self._meta = {k: v for k, v in self._rows[self._row].items() if k != "text"}
+        return self._meta
+
+    def rescored(self, score: float) -> "Hit":
+        """Same chunk with another score (e.g. after fusion); text/meta already read are kept."""
+        return Hit(self.label, score, self._rows, self._row, self._text, self._meta)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "text":
+            return self.text
+        if key == "meta":
+            return self.meta
+        if key == "score":
+            return self.score
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return 3
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
 class VectorIndex(Protocol):
     def build(self, dim: int, space: str = "cosine") -> None: ...
     def upsert(self, vectors: List[List[float]], metas: List[Dict[str, Any]]) -> None: ...
-    def query(self, vector: List[float], k: int = 5) -> List[Dict[str, Any]]:
-        """Return docs with distances: [{'text': ..., 'meta': {...}, 'score': float}]"""
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Return hits nearest first; each reads as {'text': ..., 'meta': {...}, 'score': float}
+        `filter` restricts hits to chunks whose metadata matches, e.g. {"source": "bls.md"}."""
         ... 
     def save(self, path: str) -> None: ...
     def load(self, path: str) -> None: ...
+
+
+# Array-first variants: vectors travel as contiguous float32 ndarrays end to end
+# (no per-vector Python lists between embedder and index)
+
+class ArrayEmbedder(Embedder, Protocol):
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Return a C-contiguous float32 matrix of shape (len(texts), dim)."""
+        ...
+
+class ArrayVectorIndex(VectorIndex, Protocol):
+    def upsert_array(self, vectors: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+        """`vectors` is a float32 matrix of shape (len(metas), dim)."""
+        ...
+    def query_array(self, vector: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Same result shape as `query`, for a float32 vector of shape (dim,)."""
+        ...
+    def query_batch(self, vectors: np.ndarray, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        """One hit list (shape as `query`) per row of a (n, dim) float32 matrix."""
+        ...
@@ -0,0 +1,148 @@
+# src/rag/manifest.py
+# manifest.json next to an index: build parameters, counts, embedder and file checksums (read without loading the index)
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from rag.fsutil import atomic_write
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# bookkeeping that may change without the index changing (ingest_state: see rag.ingest_state)
+UNTRACKED_FILES = {MANIFEST_FILE, "ingest_state.json", "CURRENT"}
+
+
+@dataclass
+class IndexManifest:
+    dim: int
+    space: str
+    M: Optional[int]                            # HNSW build parameters (None for the flat backend)
+    ef_construction: Optional[int]
+    count: int                                  # stored vectors (== metadata rows)
+    backend: str = "hnsw"                       # "hnsw" (hnsw.bin), "flat" (vectors.npy) or "int8"
+    params: Dict[str, Any] = field(default_factory=dict)  # backend-specific build parameters
+    embedder: Optional[str] = None              # model name/spec used at ingest; queries must use the same
+    chunker: Dict[str, Any] = field(default_factory=dict)
+    projection: Optional[Dict[str, Any]] = None
+    files: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # relative path -> {"size", "mtime_ns", "sha256"}
+    created_at: Optional[str] = None
+    version: int = MANIFEST_VERSION
+
+
+def file_sha256(path: str, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def index_files(path: str) -> List[str]:
+    """Relative paths of every data file in an index dir (manifest, ingest state and temp files excluded)."""
+    out: List[str] = []
+    for root, dirs, names in os.walk(path):
+        if root == path:  # published versions are indexes of their own (rag.publish)
+            dirs[:] = [d for d in dirs if d != "versions"]
+        for n in names:
+            if n in UNTRACKED_FILES or n.endswith(".tmp"):
+                continue
+            out.append(os.path.relpath(os.path.join(root, n), path).replace(os.sep, "/"))
+    return sorted(out)
+
+
+def _known_checksums(path: str) -> Dict[str, Dict[str, Any]]:
+    # entries of the previous manifest that can be trusted without re-hashing: files written at
+    # least one clock tick before it (a same-tick rewrite could keep size and mtime, as in git)
+    try:
+        prev = read_manifest(path)
+        written = os.stat(os.path.join(path, MANIFEST_FILE)).st_mtime_ns
+    except (OSError, ValueError):
+        return {}
+    if prev is None:
+        return {}
+    return {rel: info for rel, info in prev.files.items() if info.get("mtime_ns", written) < written}
+
+
+def write_manifest(path: str, manifest: IndexManifest) -> IndexManifest:
+    """
+    Checksum the index files under `path` and write manifest.json (last, so it
+    marks a complete index). Files whose size and mtime match the previous
+    manifest keep its checksum: a save that rewrote one shard hashes that shard.
+    """
+    known = _known_checksums(path)
+    files: Dict[str, Dict[str, Any]] = {}
+    for rel in index_files(path):
+        st = os.stat(os.path.join(path, rel))
+        prev = known.get(rel)
+        if prev is not None and (prev["size"], prev.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+            files[rel] = prev
+        else:
+            files[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(os.path.join(path, rel))}
+    manifest.files = files
+    manifest.created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _dump(path, manifest)
+    return manifest
+
+
+def _dump(path: str, manifest: IndexManifest) -> None:
+    atomic_write(
+        os.path.join(path, MANIFEST_FILE),
+        lambda f: json.dump(asdict(manifest), f, indent=2, ensure_ascii=False), mode="w",
+    )
+
+
+def update_params(path: str, **params: Any) -> IndexManifest:
+    """Merge query-time settings (e.g. a tuned ef) into params; index files and checksums are untouched."""
+    manifest = read_manifest(path)
+    assert manifest is not None, f"{path} has no {MANIFEST_FILE}"
+    manifest.params = {**manifest.params, **params}
+    _dump(path, manifest)
+    return manifest
+
+
+def read_manifest(path: str) -> Optional[IndexManifest]:
+    """The manifest of an index dir, or None for indexes written before manifests existed."""
+    p = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{p}: unsupported manifest version {data.get('version')}")
+    return IndexManifest(**data)
+
+
+def index_backend(path: str) -> str:
+    """Backend recorded for an index dir; indexes without a manifest are HNSW."""
+    manifest = read_manifest(path)
+    return manifest.backend if manifest is not None else "hnsw"
+
+
+def validate_manifest(path: str, embedder: Optional[str] = None, checksums: bool = False) -> Optional[IndexManifest]:
+    """
+    Cheap pre-load checks: every listed file exists with the recorded size and
+    the index was built with `embedder` (when given). `checksums=True` also
+    re-hashes the files (reads everything; meant for tooling, not startup).
+    Raises ValueError on any mismatch; returns None if the index has no manifest.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    if embedder is not None and manifest.embedder is not None and embedder != manifest.embedder:
+        raise ValueError(
+            f"index {path} was built with embedder {manifest.embedder!r}, refusing to query it with {embedder!r}"
+        )
+    for rel, info in manifest.files.items():
+        fp = os.path.join(path, rel)
+        if not os.path.exists(fp):
+            raise ValueError(f"index {path}: {rel} listed in manifest but missing")
+        if os.path.getsize(fp) != info["size"]:
+            raise ValueError(f"index {path}: {rel} has size {os.path.getsize(fp)}, manifest says {info['size']}")
+        if checksums and file_sha256(fp) != info["sha256"]:
+            raise ValueError(f"index {path}: checksum mismatch for {rel}")
+    return manifest
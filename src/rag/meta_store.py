@@ -0,0 +1,196 @@
+# src/rag/meta_store.py
+# Columnar, memory-mapped chunk metadata (replaces meta.jsonl; rows decoded only for query hits)
+
+from __future__ import annotations
+import os
+import sys
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from rag.fsutil import atomic_write
+
+META_DIR = "meta"
+LEGACY_JSONL = "meta.jsonl"
+FORMAT_VERSION = 1
+
+# columns stored as fixed-width utf-8 arrays when the value is a string
+FIXED_COLUMNS = ("id", "source")
+
+
+def _pack(chunks: List[bytes]) -> tuple:
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    if chunks:
+        np.cumsum([len(c) for c in chunks], out=offsets[1:])
+    return b"".join(chunks), offsets
+
+
+def _map_blob(path: str) -> np.ndarray:
+    if os.path.getsize(path) == 0:  # np.memmap refuses empty files
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class MetaStore:
+    """
+    Chunk metadata laid out as columns under <index>/meta/:
+      text.bin + text_offsets.npy    utf-8 texts back to back, row i = bytes[off[i]:off[i+1]]
+      id.npy, source.npy             fixed-width utf-8 ("S<n>") columns
+      flags.npy                      uint8 bitmask: which fixed columns the row actually has
+      extra.bin + extra_offsets.npy  JSON of any other keys ("" when there are none)
+    Everything is opened with mmap, so load cost is O(1) in the corpus size and
+    `store[i]` decodes a single row. Rows appended with `extend` live in memory
+    until the next `write`.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._n = 0
+        self._tail: List[Dict[str, Any]] = []
+        if path is not None:
+            d = os.path.join(path, META_DIR)
+            with open(os.path.join(d, "info.json"), "r", encoding="utf-8") as f:
+                info = json.load(f)
+            assert info.get("format") == FORMAT_VERSION, f"unsupported meta format: {info.get('format')}"
+            self._n = int(info["rows"])
+            self._text = _map_blob(os.path.join(d, "text.bin"))
+            self._text_off = np.load(os.path.join(d, "text_offsets.npy"), mmap_mode="r")
+            self._extra = _map_blob(os.path.join(d, "extra.bin"))
+            self._extra_off = np.load(os.path.join(d, "extra_offsets.npy"), mmap_mode="r")
+            self._flags = np.load(os.path.join(d, "flags.npy"), mmap_mode="r")
+            self._fixed = {c: np.load(os.path.join(d, f"{c}.npy"), mmap_mode="r") for c in FIXED_COLUMNS}
+
+    @classmethod
+    def open(cls, path: str) -> "MetaStore":
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, META_DIR, "info.json"))
+
+    # ----- read -----
+
+    def __len__(self) -> int:
+        return self._n + len(self._tail)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i >= self._n:
+            return self._tail[i - self._n]
+        row = self.meta(i)
+        row["text"] = self.text(i)
+        return row
+
+    def meta(self, i: int) -> Dict[str, Any]:
+        """Row `i` without its text (what a search hit exposes as "meta")."""
+        if i >= self._n:
+            return {k: v for k, v in self._tail[i - self._n].items() if k != "text"}
+        a, b = int(self._extra_off[i]), int(self._extra_off[i + 1])
+        row: Dict[str, Any] = json.loads(bytes(self._extra[a:b])) if b > a else {}
+        flags = int(self._flags[i])
+        for bit, c in enumerate(FIXED_COLUMNS):
+            if flags & (1 << bit):
+                row[c] = self._fixed[c][i].decode("utf-8")
+        return row
+
+    def text(self, i: int) -> str:
+        if i >= self._n:
+            return self._tail[i - self._n].get("text", "")
+        a, b = int(self._text_off[i]), int(self._text_off[i + 1])
+        return bytes(self._text[a:b]).decode("utf-8")
+
+    def column(self, field: str) -> List[Any]:
+        """`field` of every row (None where missing) without decoding the texts."""
+        out: List[Any] = []
+        if self._n:
+            bit = 1 << FIXED_COLUMNS.index(field) if field in FIXED_COLUMNS else 0
+            fixed = self._fixed[field].tolist() if bit else None
+            flags = self._flags.tolist()
+            for i in range(self._n):
+                if bit and flags[i] & bit:
+                    out.append(fixed[i].decode("utf-8"))
+                    continue
+                a, b = int(self._extra_off[i]), int(self._extra_off[i + 1])
+                out.append(json.loads(bytes(self._extra[a:b])).get(field) if b > a else None)
+        out.extend(row.get(field) for row in self._tail)
+        return out
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    # ----- write -----
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        self._tail.extend(rows)
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self._tail.append(row)
+
+    @staticmethod
+    def write(path: str, rows: Iterable[Dict[str, Any]]) -> None:
+        """Write `rows` (dicts with at least "text") as a columnar store under path/meta/."""
+        texts: List[bytes] = []
+        extras: List[bytes] = []
+        fixed: Dict[str, List[bytes]] = {c: [] for c in FIXED_COLUMNS}
+        flags: List[int] = []
+        for row in rows:
+            texts.append(str(row.get("text", "")).encode("utf-8"))
+            rest = {k: v for k, v in row.items() if k != "text"}
+            f = 0
+            for bit, c in enumerate(FIXED_COLUMNS):
+                v = rest.get(c)
+                if isinstance(v, str):  # non-string ids (e.g. ints) keep their type via the JSON column
+                    f |= 1 << bit
+                    fixed[c].append(rest.pop(c).encode("utf-8"))
+                else:
+                    fixed[c].append(b"")
+            flags.append(f)
+            extras.append(json.dumps(rest, ensure_ascii=False).encode("utf-8") if rest else b"")
+
+        d = os.path.join(path, META_DIR)
+        os.makedirs(d, exist_ok=True)
+        text_blob, text_off = _pack(texts)
+        extra_blob, extra_off = _pack(extras)
+        atomic_write(os.path.join(d, "text.bin"), lambda f: f.write(text_blob))
+        atomic_write(os.path.join(d, "text_offsets.npy"), lambda f: np.save(f, text_off))
+        atomic_write(os.path.join(d, "extra.bin"), lambda f: f.write(extra_blob))
+        atomic_write(os.path.join(d, "extra_offsets.npy"), lambda f: np.save(f, extra_off))
+        atomic_write(os.path.join(d, "flags.npy"), lambda f: np.save(f, np.asarray(flags, dtype=np.uint8)))
+        for c, vals in fixed.items():
+            width = max([len(v) for v in vals] + [1])
+            atomic_write(os.path.join(d, f"{c}.npy"), lambda f: np.save(f, np.asarray(vals, dtype=f"S{width}")))
+        # info.json last: its presence marks a complete store
+        info = {"format": FORMAT_VERSION, "rows": len(texts), "fixed_columns": list(FIXED_COLUMNS)}
+        atomic_write(os.path.join(d, "info.json"), lambda f: f.write(json.dumps(info).encode("utf-8")))
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+    return rows
+
+
+def convert_jsonl(path: str) -> int:
+    """Write the columnar store for an index dir that only has the old meta.jsonl; returns row count."""
+    rows = read_jsonl(os.path.join(path, LEGACY_JSONL))
+    MetaStore.write(path, rows)
+    return len(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    # python -m rag.meta_store data/index [more/index ...]
+    for path in (argv if argv is not None else sys.argv[1:]) or ["data/index"]:
+        n = convert_jsonl(path)
+        print(f"{path}: converted {n} rows to {os.path.join(path, META_DIR)}/")
+
+
+if __name__ == "__main__":
+    main()
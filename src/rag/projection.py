@@ -0,0 +1,112 @@
+# src/rag/projection.py
+# Dimensionality reduction for stored vectors (PCA or Matryoshka truncation), persisted next to hnsw.bin
+
+from __future__ import annotations
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from rag.fsutil import atomic_write
+
+PROJECTION_FILE = "projection.npz"
+
+
+class Projection:
+    """
+    Linear map applied to corpus vectors at ingest and to query vectors at search:
+        y = normalize((x - mean) @ components.T)
+    - "pca":      components/mean fitted on the corpus
+    - "truncate": keep the first out_dim dimensions (Matryoshka-trained models)
+    Rows are re-normalized so cosine distance stays meaningful.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        in_dim: int,
+        out_dim: int,
+        components: Optional[np.ndarray] = None,
+        mean: Optional[np.ndarray] = None,
+    ):
+        assert method in ("pca", "truncate"), f"unknown projection method: {method}"
+        assert 0 < out_dim <= in_dim, "out_dim must be in (0, in_dim]"
+        self.method = method
+        self.in_dim = in_dim
+        self.out_dim = out_dim
+        self.components = None if components is None else np.ascontiguousarray(components, dtype=np.float32)
+        self.mean = None if mean is None else np.ascontiguousarray(mean, dtype=np.float32)
+
+    @classmethod
+    def fit_pca(cls, vectors: np.ndarray, out_dim: int, max_samples: int = 50_000, seed: int = 0) -> "Projection":
+        x = np.asarray(vectors, dtype=np.float32)
+        if x.shape[0] > max_samples:  # the principal axes settle long before the full corpus
+            x = x[np.random.default_rng(seed).choice(x.shape[0], max_samples, replace=False)]
+        mean = x.mean(axis=0)
+        # rows of vt are the principal axes, sorted by explained variance
+        _, _, vt = np.linalg.svd(x - mean, full_matrices=False)
+        assert out_dim <= vt.shape[0], f"PCA needs at least {out_dim} vectors (got {x.shape[0]})"
+        return cls("pca", x.shape[1], out_dim, components=vt[:out_dim], mean=mean)
+
+    @classmethod
+    def truncate(cls, in_dim: int, out_dim: int) -> "Projection":
+        return cls("truncate", in_dim, out_dim)
+
+    def apply(self, x: np.ndarray) -> np.ndarray:
+        """Project a vector (dim,) or matrix (n, dim); returns float32 of the same rank."""
+        arr = np.asarray(x, dtype=np.float32)
+        single = arr.ndim == 1
+        if single:
+            arr = arr[None, :]
+        assert arr.shape[1] == self.in_dim, f"expected dim {self.in_dim}, got {arr.shape[1]}"
+        if self.method == "truncate":
+            y = arr[:, : self.out_dim]
+        else:
+            y = (arr - self.mean) @ self.components.T
+        norms = np.linalg.norm(y, axis=1, keepdims=True)
+        y = np.ascontiguousarray(y / np.clip(norms, 1e-12, None), dtype=np.float32)
+        return y[0] if single else y
+
+    # ----- persistence -----
+
+    def header(self) -> Dict[str, Any]:
+        """Entry for the index header."""
+        return {"method": self.method, "in_dim": self.in_dim, "out_dim": self.out_dim, "file": PROJECTION_FILE}
+
+    def save(self, path: str) -> None:
+        arrays: Dict[str, np.ndarray] = {}
+        if self.components is not None:
+            arrays["components"] = self.components
+            arrays["mean"] = self.mean
+        # file object: np.savez would append ".npz" to a path
+        atomic_write(os.path.join(path, PROJECTION_FILE), lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, path: str, header: Dict[str, Any]) -> "Projection":
+        components = mean = None
+        if header["method"] == "pca":
+            with np.load(os.path.join(path, header.get("file", PROJECTION_FILE))) as data:
+                components, mean = data["components"], data["mean"]
+        return cls(header["method"], header["in_dim"], header["out_dim"], components=components, mean=mean)
+
+
+def recall_at_k(full: np.ndarray, reduced: np.ndarray, k: int = 10, n_queries: int = 200, seed: int = 0) -> float:
+    """
+    How many of the exact full-dimension top-k neighbours survive the reduction.
+    Queries are corpus vectors (held out from their own result list); both sides
+    are exact (brute force), so this isolates the projection loss from HNSW's.
+    """
+    n = full.shape[0]
+    if n < 2:
+        return 1.0
+    k = min(k, n - 1)
+    q = np.random.default_rng(seed).choice(n, min(n_queries, n), replace=False)
+
+    def topk(mat: np.ndarray) -> np.ndarray:
+        sims = mat[q] @ mat.T
+        sims[np.arange(len(q)), q] = -np.inf  # drop the query itself
+        return np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+    exact, approx = topk(full), topk(reduced)
+    hits = sum(len(np.intersect1d(a, b)) for a, b in zip(exact, approx))
+    return hits / float(len(q) * k)
@@ -3,8 +3,13 @@ from __future__ import annotations
 from dataclasses import dataclass, replace
 from typing import Iterable, List, Dict, Tuple, Literal, Optional
 import re
+import logging
 import textwrap
 
+from rag.interfaces import Hit
+
+log = logging.getLogger(__name__)
+
 # ----------------------------
 # Public API (you use this)
 # ----------------------------
@@ -47,7 +52,7 @@ def build_prompts(
 ) -> Tuple[str, str]:
     """
     Returns (system, user) strings. `hits` are the retriever documents:
-    [{'text': str, 'meta': {...}, 'score': float}, ...]
+    Hit objects or plain dicts [{'text': str, 'meta': {...}, 'score': float}, ...]
     """
 
       # 1) Context + bibliography
@@ -105,13 +110,13 @@ def _build_context_and_bib(hits: List[Dict], max_chars: int) -> Tuple[str, str]:
     """
     Trims context to a character budget and builds a short bibliography.
     """
-    print("-"*80)
-    print(f"\n\nhits: \n\n{hits}\n\n")
+    # lazy %-args: hits are only rendered when debug logging is on
+    log.debug("hits: %s", hits)
 
     cleaned = []
     total = 0
     for i, h in enumerate(hits, start=1):    
-        txt = _squash(h.get("text", ""), hard_trim=1200)
+        txt = _squash(h.text if isinstance(h, Hit) else h.get("text", ""), hard_trim=1200)
         # print(f"iteration {i}, txt: {txt}")
         entry = f"[{i}] {txt}"
         if total + len(entry) > max_chars:
@@ -120,13 +125,13 @@ def _build_context_and_bib(hits: List[Dict], max_chars: int) -> Tuple[str, str]:
         total += len(entry)
     context = "\n\n".join(cleaned)
 
-    print(f"\n\ncontext: \n\n{context}\n\n")
+    log.debug("context: %s", context)
 
     # print(f"\n\ncontext in _build_context: {context}\n\n")
 
     bib_lines = []
     for i, h in enumerate(hits, start=1):
-        m = h.get("meta", {}) or {}
+        m = (h.meta if isinstance(h, Hit) else h.get("meta", {})) or {}
         title = m.get("title") or m.get("doc") or m.get("source") or "Unknown"
         sec = m.get("section") or m.get("page") or ""
         year = m.get("year") or ""
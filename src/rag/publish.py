@@ -0,0 +1,92 @@
+# src/rag/publish.py
+# Versioned index dirs: ingest builds into <root>/versions/<id>/ and flips <root>/CURRENT atomically
+
+from __future__ import annotations
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from rag.fsutil import atomic_write
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+
+def current_version(root: str) -> Optional[str]:
+    """Name of the published version, or None if `root` is a plain (unversioned) index dir."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def resolve_index_dir(root: str) -> str:
+    """The directory to load: the current version of a versioned root, else `root` itself."""
+    name = current_version(root)
+    return os.path.join(root, VERSIONS_DIR, name) if name else root
+
+
+def _link_tree(src: str, dst: str) -> None:
+    # hard links: unchanged files cost nothing. Safe because every index writer
+    # replaces files (rag.fsutil.atomic_write) instead of writing into them.
+    for dirpath, dirnames, filenames in os.walk(src):
+        rel = os.path.relpath(dirpath, src)
+        if rel == ".":
+            # a plain root that already has versions/ next to its files
+            dirnames[:] = [d for d in dirnames if d != VERSIONS_DIR]
+        os.makedirs(os.path.join(dst, rel), exist_ok=True)
+        for name in filenames:
+            if (rel == "." and name == CURRENT_FILE) or name.endswith(".tmp"):
+                continue
+            s, d = os.path.join(dirpath, name), os.path.join(dst, rel, name)
+            try:
+                os.link(s, d)
+            except OSError:  # other filesystem / no hard links
+                shutil.copy2(s, d)
+
+
+def stage_version(root: str, base: Optional[str] = None) -> str:
+    """
+    New, unpublished version dir under <root>/versions/. With `base` (an index
+    dir, e.g. resolve_index_dir(root)) it starts as a hard-linked copy of it,
+    so an incremental ingest only writes what changed.
+    """
+    versions = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    for n in range(1000):
+        path = os.path.join(versions, stamp if n == 0 else f"{stamp}-{n}")
+        try:
+            os.mkdir(path)
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise RuntimeError(f"could not create a version dir under {versions}")
+    if base is not None and os.path.isdir(base):
+        _link_tree(base, path)
+    return path
+
+
+def publish_version(root: str, version_dir: str) -> None:
+    """Point <root>/CURRENT at `version_dir` (a complete index); readers see the old or the new one, never a mix."""
+    name = os.path.basename(os.path.normpath(version_dir))
+    assert os.path.isdir(os.path.join(root, VERSIONS_DIR, name)), f"{version_dir} is not a version of {root}"
+    atomic_write(os.path.join(root, CURRENT_FILE), lambda f: f.write(name + "\n"), mode="w", fsync=True)
+
+
+def prune_versions(root: str, keep: int = 3) -> List[str]:
+    """Delete all but the newest `keep` versions (never the current one); returns the removed names."""
+    versions = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions):
+        return []
+    current = current_version(root)
+    names = sorted(n for n in os.listdir(versions) if os.path.isdir(os.path.join(versions, n)))
+    removed = [n for n in names[:-keep] if n != current] if keep > 0 else [n for n in names if n != current]
+    for n in removed:
+        # a server may still have files of an old version mapped: POSIX keeps them alive until unmapped
+        shutil.rmtree(os.path.join(versions, n), ignore_errors=True)
+    return removed
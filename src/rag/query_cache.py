@@ -0,0 +1,124 @@
+# src/rag/query_cache.py
+# Bounded LRU/TTL cache of query vectors (repeated trainee questions skip the transformer)
+
+from __future__ import annotations
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def normalize_query(text: str) -> str:
+    """
+    Cache key form of a query: trimmed, inner whitespace collapsed. Case is kept:
+    cased models embed "CPR" and "cpr" differently, and keys cover any embedder.
+    """
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def embedder_id(embedder: Any) -> str:
+    """Stable identity of an embedder for cache keys (model name if it has one)."""
+    name = getattr(embedder, "model_name", None)
+    if name:
+        return str(name)
+    return f"{type(embedder).__name__}@{id(embedder):x}"
+
+
+class QueryVectorCache:
+    """
+    Thread-safe LRU cache: (embedder id, normalized query) -> query vector.
+    - max_size: number of vectors kept; least recently used are dropped first
+    - ttl: optional lifetime in seconds; None keeps entries until evicted
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        assert max_size > 0, "max_size must be > 0"
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, model: str, query: str) -> Optional[Any]:
+        key = (model, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and now - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, model: str, query: str, vector: Any) -> None:
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._data[key] = (time.monotonic(), vector)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, model: str, query: str, compute: Callable[[], Any]) -> Any:
+        vec = self.get(model, query)
+        if vec is None:
+            # computed outside the lock: concurrent misses may embed twice, never block each other
+            vec = compute()
+            self.put(model, query, vec)
+        return vec
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class LRUCache:
+    """Minimal thread-safe LRU map (bounded: keys may come from clients)."""
+
+    def __init__(self, max_size: int):
+        assert max_size > 0, "max_size must be > 0"
+        self.max_size = max_size
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key: Any, value: Any) -> None:
+        # caller holds _lock
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
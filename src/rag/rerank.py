@@ -0,0 +1,138 @@
+# src/rag/rerank.py
+# Optional second stage: a small cross-encoder re-scores the retriever's over-fetched candidates
+
+from __future__ import annotations
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.query_cache import LRUCache, normalize_query
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_key(hit: Any) -> Hashable:
+    """Stable chunk identity: the index label (chunk_label of source + chunk id), else the text."""
+    label = getattr(hit, "label", None)
+    if label is not None:
+        return label
+    return hashlib.sha1(hit["text"].encode("utf-8")).hexdigest()[:16]
+
+
+class PairScoreCache(LRUCache):
+    """Thread-safe LRU: (query hash, chunk key) -> cross-encoder score."""
+
+    def __init__(self, max_size: int = 4096):
+        super().__init__(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[Tuple[str, Hashable]]) -> List[Optional[float]]:
+        out: List[Optional[float]] = []
+        with self._lock:
+            for key in keys:
+                score = self._data.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                out.append(score)
+        return out
+
+    def put_many(self, items: Sequence[Tuple[Tuple[str, Hashable], float]]) -> None:
+        with self._lock:
+            for key, score in items:
+                self._store(key, score)
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk text) pairs with a sentence-transformers CrossEncoder,
+    all uncached pairs of a query in one predict() call. Keeps a running
+    estimate of the cost per pair so callers can skip reranking when the
+    uncached pairs would not finish before their deadline.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANK_MODEL,
+        device: str = "cpu",
+        cache_size: int = 4096,
+        max_length: int = 512,
+        model: Any = None,
+    ):
+        self.model_name = model_name
+        if model is None:
+            # sentence-transformers pulls in torch; only pay for it when reranking is enabled
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, device=device, max_length=max_length)
+        self.model = model
+        self.cache = PairScoreCache(cache_size) if cache_size > 0 else None
+        self.ms_per_pair: Optional[float] = None  # EWMA; None until the first predict() call
+        self.reranked = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def estimate_ms(self, n_pairs: int) -> float:
+        return 0.0 if self.ms_per_pair is None else self.ms_per_pair * n_pairs
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        t0 = time.perf_counter()
+        scores = np.asarray(
+            self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False), dtype=np.float32
+        ).reshape(-1)
+        ms = (time.perf_counter() - t0) * 1e3 / len(pairs)
+        with self._lock:
+            self.ms_per_pair = ms if self.ms_per_pair is None else 0.7 * self.ms_per_pair + 0.3 * ms
+        return scores
+
+    def warm_up(self, n_pairs: int = 8) -> None:
+        """Load kernels and seed the per-pair cost estimate (e.g. at server start)."""
+        self._predict([("warm up", "warm up the cross-encoder")] * n_pairs)
+
+    def rerank(self, query: str, hits: Sequence[Any], k: int, deadline: Optional[float] = None) -> List[Any]:
+        """
+        Top-k of `hits` by cross-encoder score (Hit.score = -score: lower is
+        better, as for distances). `deadline` is a time.monotonic() value: if
+        scoring the uncached pairs is expected to end after it, the first-stage
+        order is kept and the first k hits are returned unchanged.
+        """
+        if len(hits) <= 1:
+            return list(hits[:k])
+        qh = query_hash(query)
+        keys = [(qh, chunk_key(h)) for h in hits]
+        scores = self.cache.get_many(keys) if self.cache is not None else [None] * len(hits)
+        miss = [i for i, s in enumerate(scores) if s is None]
+        if miss:
+            if deadline is not None and time.monotonic() + self.estimate_ms(len(miss)) / 1e3 > deadline:
+                self.skipped += 1
+                return list(hits[:k])
+            fresh = self._predict([(query, hits[i]["text"]) for i in miss]).tolist()
+            for i, s in zip(miss, fresh):
+                scores[i] = s
+            if self.cache is not None:
+                self.cache.put_many([(keys[i], s) for i, s in zip(miss, fresh)])
+        self.reranked += 1
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")[:k]
+        return [_rescored(hits[i], -scores[i]) for i in order.tolist()]
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"reranked": self.reranked, "skipped": self.skipped, "ms_per_pair": self.ms_per_pair}
+        if self.cache is not None:
+            total = self.cache.hits + self.cache.misses
+            out.update(cache_hits=self.cache.hits, cache_misses=self.cache.misses,
+                       cache_hit_rate=(self.cache.hits / total) if total else 0.0)
+        return out
+
+
+def _rescored(hit: Any, score: float) -> Any:
+    rescored = getattr(hit, "rescored", None)
+    return rescored(score) if rescored is not None else dict(hit, score=score)
@@ -2,8 +2,19 @@
 # TODO: Interface + Abstaction
 
 from __future__ import annotations
-from typing import List, Dict, Any
-from rag.interfaces import Embedder, VectorIndex
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+from rag.interfaces import Embedder, Hit, VectorIndex
+from rag.embed import embed_array
+from rag.query_cache import QueryVectorCache, embedder_id
+from rag.indexer import meta_matches
+from rag.sparse import fuse
+from rag.rerank import DEFAULT_RERANK_MODEL, CrossEncoderReranker
 from dataclasses import dataclass
 
 import yaml
@@ -11,9 +22,56 @@ import yaml
 @dataclass
 class RetrieverConfig:
     k: int
+    # "hybrid": BM25 over the chunk texts (index.sparse, built by ingest) + vectors, fused;
+    # falls back to dense for indexes built without the sparse side
+    mode: str = "dense"
+    fusion: str = "rrf"           # "rrf" (reciprocal rank) | "weighted" (min-max normalized scores)
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+    rrf_k: int = 60
+    candidates: int = 50          # hits taken from each side before fusion
+    # optional cross-encoder stage (rag.rerank): fetch rerank_candidates, re-score them, keep k
+    rerank: bool = False
+    rerank_model: str = DEFAULT_RERANK_MODEL
+    rerank_candidates: int = 20
+    rerank_budget_ms: float = 0.0  # reranking must end this long after search() started, else skipped; 0 = no limit
+    rerank_cache_size: int = 4096
+    # Maximal Marginal Relevance: fetch mmr_fetch times as many hits, keep a diverse subset
+    # (near-duplicate chunks, e.g. CustomChunker questions sharing one task text, count once)
+    mmr: bool = False
+    mmr_lambda: float = 0.5       # 1.0 = relevance only, 0.0 = diversity only
+    mmr_fetch: int = 4
 
 yaml_path = "configs/rag.yaml"
 
+
+def mmr_select(query: np.ndarray, vectors: np.ndarray, k: int, lambda_: float = 0.5) -> List[int]:
+    """
+    Row indices of `vectors` picked greedily by Maximal Marginal Relevance:
+        argmax  lambda * cos(query, v) - (1 - lambda) * max cos(v, picked)
+    All similarities come from one matrix product; each of the k steps is an
+    O(n) vector update (running max similarity to the picked rows).
+    """
+    v = np.asarray(vectors, dtype=np.float32)
+    v = v / np.clip(np.linalg.norm(v, axis=1, keepdims=True), 1e-12, None)
+    q = np.asarray(query, dtype=np.float32).reshape(-1)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    n = v.shape[0]
+    k = min(k, n)
+    rel = v @ q
+    sim = v @ v.T
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    picked = np.zeros(n, dtype=bool)
+    out: List[int] = []
+    for step in range(k):
+        score = rel if step == 0 else lambda_ * rel - (1.0 - lambda_) * redundancy
+        j = int(np.argmax(np.where(picked, -np.inf, score)))  # ties: the earlier (better-ranked) candidate
+        out.append(j)
+        picked[j] = True
+        np.maximum(redundancy, sim[j], out=redundancy)
+    return out
+
+
 def load_retriever_config(path: str) -> RetrieverConfig:
     with open(path, "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f)
@@ -22,16 +80,188 @@ def load_retriever_config(path: str) -> RetrieverConfig:
 
 
 class Retriever:
-    def __init__(self, embedder: Embedder, index: VectorIndex, k: int = 5):
+    def __init__(
+        self,
+        embedder: Embedder,
+        index: VectorIndex,
+        k: int = 5,
+        query_cache_size: int = 256,
+        query_cache_ttl: Optional[float] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+    ):
+        self.query_cache = QueryVectorCache(query_cache_size, query_cache_ttl) if query_cache_size > 0 else None
         self.embedder = embedder
         self.index = index
         self.k = k
+        # sparse side of hybrid searches; workers only start on the first submit
+        self._pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="bm25")
+        self.reranker = reranker  # loaded on first use when the config enables reranking
+        self._reranker_lock = threading.Lock()
+
+    @property
+    def embedder(self) -> Embedder:
+        return self._embedder
+
+    @embedder.setter
+    def embedder(self, embedder: Embedder) -> None:
+        # vectors of the old model are useless for the new one
+        self._embedder = embedder
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def embed_query(self, query: str):
+        if self.query_cache is None:
+            qv = self.embedder.embed_one(query)
+        else:
+            qv = self.query_cache.get_or_compute(
+                embedder_id(self.embedder), query, lambda: self.embedder.embed_one(query)
+            )
+        return self._project(qv)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Query matrix for many questions: cache hits + one encode call for all misses."""
+        model = embedder_id(self.embedder)
+        cached = [self.query_cache.get(model, q) for q in queries] if self.query_cache else [None] * len(queries)
+        miss = [i for i, v in enumerate(cached) if v is None]
+        if miss:
+            # duplicates inside the batch are encoded once
+            uniq = list(dict.fromkeys(queries[i] for i in miss))
+            fresh = dict(zip(uniq, embed_array(self.embedder, uniq)))
+            for i in miss:
+                cached[i] = fresh[queries[i]]
+            if self.query_cache is not None:
+                for q, v in fresh.items():
+                    self.query_cache.put(model, q, v)
+        mat = np.asarray([np.asarray(v, dtype=np.float32) for v in cached], dtype=np.float32)
+        return self._project(mat)
 
-    def search(self, query: str) -> List[Dict[str, Any]]:
+    def _project(self, qv):
+        # indexes built with reduced dimensions carry their projection; queries need it too
+        projection = getattr(self.index, "projection", None)
+        if projection is not None:
+            qv = projection.apply(qv)
+        return qv
 
+    def search(
+        self, query: str, filter: Optional[Dict[str, Any]] = None, deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        `filter` restricts hits by chunk metadata, e.g. {"source": "bls.md"} for one training module.
+        `deadline` (time.monotonic()) bounds the optional rerank stage, like rerank_budget_ms.
+        """
+        start = time.monotonic()
         cfg = load_retriever_config(yaml_path)
-        k = cfg.k
-        qv = self.embedder.embed_one(query)
-        #return self.index.query(qv, k=self.k)
-        return self.index.query(qv, k)
+        reranker = self._reranker(cfg)
+        n = max(cfg.k, cfg.rerank_candidates) if reranker is not None else cfg.k
+        k = n * cfg.mmr_fetch if cfg.mmr else n
+        if self._sparse(cfg) is not None:
+            out, qm = self._hybrid([query], cfg, filter, k)
+            hits, qv = out[0], qm[0]
+        else:
+            qv = self.embed_query(query)
+            #return self.index.query(qv, k=self.k)
+            if filter:
+                hits = self.index.query(qv, k, filter=filter)
+            else:
+                hits = self.index.query(qv, k)
+        if cfg.mmr:
+            hits = self._mmr(qv, hits, n, cfg)
+        if reranker is not None:
+            hits = reranker.rerank(query, hits, cfg.k, self._deadline(cfg, start, deadline))
+        return hits
+
+    def search_many(
+        self, queries: List[str], filter: Optional[Dict[str, Any]] = None, deadline: Optional[float] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Batched `search`: one encode call and one index query for all questions."""
+        if not queries:
+            return []
+        start = time.monotonic()
+        cfg = load_retriever_config(yaml_path)
+        reranker = self._reranker(cfg)
+        n = max(cfg.k, cfg.rerank_candidates) if reranker is not None else cfg.k
+        k = n * cfg.mmr_fetch if cfg.mmr else n
+        if self._sparse(cfg) is not None:
+            out, qm = self._hybrid(queries, cfg, filter, k)
+        else:
+            qm = self.embed_queries(queries)
+            kw = {"filter": filter} if filter else {}
+            if hasattr(self.index, "query_batch"):
+                out = self.index.query_batch(qm, k, **kw)
+            else:
+                out = [self.index.query(v, k, **kw) for v in qm]
+        if cfg.mmr:
+            out = [self._mmr(qv, hits, n, cfg) for qv, hits in zip(qm, out)]
+        if reranker is not None:
+            # one shared deadline: later queries fall back to first-stage order once it is spent
+            until = self._deadline(cfg, start, deadline)
+            out = [reranker.rerank(q, hits, cfg.k, until) for q, hits in zip(queries, out)]
+        return out
+
+    def _reranker(self, cfg: RetrieverConfig) -> Optional[CrossEncoderReranker]:
+        if not cfg.rerank:
+            return None
+        if self.reranker is None or self.reranker.model_name != cfg.rerank_model:
+            with self._reranker_lock:  # concurrent first requests load the model once
+                if self.reranker is None or self.reranker.model_name != cfg.rerank_model:
+                    self.reranker = CrossEncoderReranker(cfg.rerank_model, cache_size=cfg.rerank_cache_size)
+        return self.reranker
+
+    @staticmethod
+    def _deadline(cfg: RetrieverConfig, start: float, deadline: Optional[float]) -> Optional[float]:
+        if cfg.rerank_budget_ms > 0:
+            budget = start + cfg.rerank_budget_ms / 1e3
+            deadline = budget if deadline is None else min(deadline, budget)
+        return deadline
+
+    def _mmr(self, qv, hits: List[Any], n: int, cfg: RetrieverConfig) -> List[Any]:
+        """Diverse n of the candidates (stored vectors from the index); plain top-n if it cannot return them."""
+        get_vectors = getattr(self.index, "get_vectors", None)
+        if len(hits) <= n or get_vectors is None or not all(isinstance(h, Hit) for h in hits):
+            return list(hits[:n])
+        vectors = get_vectors([h.label for h in hits])
+        return [hits[i] for i in mmr_select(qv, vectors, n, cfg.mmr_lambda)]
+
+    def warm_up(self) -> None:
+        """Load the reranker (if the config enables it) and seed its latency estimate before the first request."""
+        reranker = self._reranker(load_retriever_config(yaml_path))
+        if reranker is not None:
+            reranker.warm_up()
+
+    def _sparse(self, cfg: RetrieverConfig):
+        return getattr(self.index, "sparse", None) if cfg.mode == "hybrid" else None
+
+    def _hybrid(self, queries: List[str], cfg: RetrieverConfig, filter: Optional[Dict[str, Any]], k: int):
+        """
+        BM25 runs on a worker thread while the queries are embedded and the vector
+        index is searched; both candidate lists are then fused (see rag.sparse.fuse).
+        Hit.score of a fused hit is -fused score: lower is better, as for distances.
+        Returns (hits per query, query matrix).
+        """
+        sparse = self._sparse(cfg)
+        depth = max(k, cfg.candidates)
+        sparse_future = self._pool.submit(lambda: [sparse.search(q, depth) for q in queries])
+        qm = self.embed_queries(queries)
+        kw = {"filter": filter} if filter else {}
+        if hasattr(self.index, "query_batch"):
+            dense = self.index.query_batch(qm, depth, **kw)
+        else:
+            dense = [self.index.query(v, depth, **kw) for v in qm]
 
+        out = []
+        for d_hits, (s_labels, s_scores) in zip(dense, sparse_future.result()):
+            by_label = {h.label: h for h in d_hits}
+            s_items: List[Tuple[int, float]] = list(zip(s_labels.tolist(), s_scores.tolist()))
+            missing = [(l, s) for l, s in s_items if l not in by_label]
+            if missing:
+                found = self.index.hits_for([l for l, _ in missing], [s for _, s in missing])
+                if filter:
+                    found = [h for h in found if meta_matches(h.meta, filter)]
+                by_label.update((h.label, h) for h in found)
+                s_items = [(l, s) for l, s in s_items if l in by_label]  # deleted / filtered out
+            fused = fuse(
+                [(h.label, h.score) for h in d_hits], s_items, method=cfg.fusion,
+                dense_weight=cfg.dense_weight, sparse_weight=cfg.sparse_weight, rrf_k=cfg.rrf_k,
+            )
+            out.append([by_label[l].rescored(-score) for l, score in fused[:k]])
+        return out, qm
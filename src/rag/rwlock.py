@@ -0,0 +1,50 @@
+# src/rag/rwlock.py
+# Readers-writer lock for indexes that take live upserts while serving queries
+
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class RWLock:
+    """
+    Any number of readers at once, or one writer. Writer-preferring: once a
+    writer waits, new readers queue behind it, so a steady query load cannot
+    starve ingest. Not reentrant - take it once per public call.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
@@ -1,17 +1,23 @@
 # src/rag/server.py
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Iterable
 import yaml
 from contextlib import asynccontextmanager
 import logging, gc
-from pydantic import BaseModel
-from typing import Optional
+import os
+import hmac
+import threading
+from pydantic import BaseModel, StrictBool, StrictFloat, StrictInt, StrictStr
+from typing import Any, Dict, List, Optional, Union
 
 from rag.generator import LocalLLM, LLMConfig
-from rag.embed import SBertEmbeddings
-from rag.indexer import HnswIndex
+from rag.embed import SBertEmbeddings, OnnxEmbeddings, BatchingEmbedder, load_embedder_config, is_onnx_spec
+from rag.interfaces import Embedder, ArrayVectorIndex
+from rag.indexer import HnswIndex, INDEX_BACKENDS
+from rag.manifest import validate_manifest
+from rag.publish import current_version, resolve_index_dir
 from rag.retriever import Retriever
 from rag.prompt import build_prompts, postprocess_answer, PromptOptions, PromptOptionsOverride, merge_prompt_options
 from rag.settings import get_settings
@@ -21,19 +27,35 @@ log = logging.getLogger(__name__)
 # --- Global state container (simple singleton) ---
 class State:
     llm: LocalLLM | None = None
-    embedder: SBertEmbeddings | None = None
-    index: HnswIndex | None = None
+    embedder: Embedder | None = None
+    index: ArrayVectorIndex | None = None
     retriever: Retriever | None = None
+    index_path: str | None = None        # dir the live index was loaded from (a version dir when published)
+    embedder_name: str | None = None
+
+# metadata filter values: a scalar or a list of scalars (anything else is a 422, not a 500)
+FilterValue = Union[StrictStr, StrictInt, StrictFloat, StrictBool]
 
 class RagRequest(BaseModel):
     q: str
     options: Optional[PromptOptionsOverride] = None 
+    filter: Optional[Dict[str, Union[FilterValue, List[FilterValue]]]] = None  # chunk metadata match, e.g. {"source": "bls.md"}
 
 def get_prompt_defaults():
     return get_settings().prompt
 
 S = State()
 yaml_path = "configs/rag.yaml"
+INDEX_DIR = "data/index"
+# poll INDEX_DIR/CURRENT (see rag.publish) this often and hot-swap a newly published index; 0 = off
+INDEX_WATCH_SECONDS = 2.0
+# an old index is closed this long after a swap (requests that already picked it up finish first)
+INDEX_RETIRE_SECONDS = 30.0
+# /admin/* is off unless this environment variable holds a token (sent as the X-Admin-Token header)
+ADMIN_TOKEN_ENV = "RAG_ADMIN_TOKEN"
+
+_reload_lock = threading.Lock()
+_watch_stop = threading.Event()
 
 
 def load_llm_config(path: str) -> LLMConfig:
@@ -49,24 +71,54 @@ def load_llm_config(path: str) -> LLMConfig:
 async def lifespan(app: FastAPI):
     try:
         # --- Startup: initialize services ---
+        emb_cfg = load_embedder_config(yaml_path)
+        S.embedder_name = emb_cfg.model_name
+        # refuse an index built by another embedder before paying for the LLM load
+        index_path = resolve_index_dir(INDEX_DIR)
+        manifest = validate_manifest(index_path, embedder=emb_cfg.model_name)
         cfg = load_llm_config(yaml_path)
         S.llm = LocalLLM(cfg)
-        S.embedder = SBertEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            device="cpu",  # use "mps" only if stable on your machine
-        )
-        S.index = HnswIndex()
-        S.index.load("data/index")
+        if is_onnx_spec(emb_cfg.model_name):
+            # torch-free backend: onnx:<dir> or onnx-int8:<dir>
+            S.embedder = OnnxEmbeddings.from_spec(emb_cfg.model_name)
+        else:
+            S.embedder = SBertEmbeddings(
+                model_name=emb_cfg.model_name,
+                device=emb_cfg.device,  # use "mps" only if stable on your machine
+            )
+        if emb_cfg.batch_max_size > 1:
+            # concurrent requests share one encode call instead of contending on the model
+            S.embedder = BatchingEmbedder(
+                S.embedder,
+                max_batch_size=emb_cfg.batch_max_size,
+                max_wait_ms=emb_cfg.batch_max_wait_ms,
+            )
+        S.index = _load_index(index_path, manifest)
+        S.index_path = index_path
         S.retriever = Retriever(S.embedder, S.index, k=5)
+        warm_up = getattr(S.retriever, "warm_up", None)
+        if warm_up is not None:
+            warm_up()  # loads the cross-encoder (if reranking is on) now, not during the first request
+        watcher = None
+        if INDEX_WATCH_SECONDS > 0:
+            _watch_stop.clear()
+            watcher = threading.Thread(target=_watch_index, args=(INDEX_WATCH_SECONDS,), name="index-watch", daemon=True)
+            watcher.start()
         log.info("Warmup complete, server ready.")
         yield  # <-- server runs between startup and shutdown
     finally:
+        _watch_stop.set()
         # --- Shutdown: release resources cleanly ---
         try:
             if getattr(S.llm, "close", None):
                 S.llm.close()  # e.g., HTTP sessions, background threads
         except Exception:
             log.exception("LLM close failed")
+        try:
+            if getattr(S.embedder, "close", None):
+                S.embedder.close()  # stops the micro-batching thread
+        except Exception:
+            log.exception("Embedder close failed")
         try:
             if getattr(S.index, "close", None):
                 S.index.close()  # e.g., memory-mapped index files
@@ -75,12 +127,73 @@ async def lifespan(app: FastAPI):
         # Drop references so GC can free memory (important on reloads/workers)
         S.retriever = None
         S.index = None
+        S.index_path = None
         S.embedder = None
         S.llm = None
         gc.collect()  # force GC – optional, helps with memory fragmentation
         log.info("Teardown complete.")
 
 
+def _load_index(path: str, manifest) -> ArrayVectorIndex:
+    backend = manifest.backend if manifest is not None else "hnsw"
+    index = HnswIndex() if backend == "hnsw" else INDEX_BACKENDS[backend]()
+    index.load(path)
+    return index
+
+
+def _retire(index) -> None:
+    if getattr(index, "close", None):
+        try:
+            index.close()
+        except Exception:
+            log.exception("Index close failed")
+
+
+def reload_index() -> Dict[str, Any]:
+    """
+    Load the currently published index next to the live one and swap
+    S.index/S.retriever. Requests already running keep the retriever they
+    started with; new ones get the new index. On any error the old index stays.
+    """
+    with _reload_lock:  # one reload at a time (watcher + admin endpoint)
+        path = resolve_index_dir(INDEX_DIR)
+        if path == S.index_path:
+            return {"reloaded": False, "index": path}
+        manifest = validate_manifest(path, embedder=S.embedder_name)
+        index = _load_index(path, manifest)
+        retriever = Retriever(S.embedder, index, k=5)
+        old_cache = getattr(S.retriever, "query_cache", None)
+        if old_cache is not None:
+            retriever.query_cache = old_cache  # same embedder: cached query vectors stay valid
+        reranker = getattr(S.retriever, "reranker", None)
+        if reranker is not None:
+            if reranker.cache is not None:
+                reranker.cache.clear()  # a label may now hold an edited chunk
+            retriever.reranker = reranker
+        old = S.index
+        S.index, S.retriever, S.index_path = index, retriever, path
+    if old is not None and old is not index:
+        t = threading.Timer(INDEX_RETIRE_SECONDS, _retire, args=(old,))
+        t.daemon = True
+        t.start()
+    log.info("Index reloaded from %s", path)
+    return {"reloaded": True, "index": path}
+
+
+def _watch_index(interval: float) -> None:
+    seen = current_version(INDEX_DIR)
+    while not _watch_stop.wait(interval):
+        version = current_version(INDEX_DIR)
+        if version == seen:
+            continue
+        try:
+            reload_index()
+            seen = version
+        except Exception:
+            # e.g. a version pruned before we got to it; retried on the next change or tick
+            log.exception("Index reload failed; keeping %s", S.index_path)
+
+
 # --- FastAPI app ---
 app = FastAPI(lifespan=lifespan)
 
@@ -101,6 +214,26 @@ app.add_middleware(
     expose_headers=["Content-Type"],       # optional; bei Streaming/Debug hilfreich
 )
 
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    # CORS lets local web pages call the API: state-changing endpoints need a shared secret
+    token = os.environ.get(ADMIN_TOKEN_ENV)
+    if not token:
+        raise HTTPException(404, f"admin endpoints are disabled (set {ADMIN_TOKEN_ENV})")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(401, "missing or wrong X-Admin-Token")
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+def admin_reload():
+    """Swap in the currently published index if it changed (runs in the threadpool; other requests keep being served)."""
+    if not S.retriever:
+        raise HTTPException(503, "Service not ready")
+    try:
+        return reload_index()
+    except (AssertionError, ValueError, OSError, RuntimeError) as e:
+        raise HTTPException(409, f"reload failed, still serving {S.index_path}: {e}")
+
+
 @app.get("/health")
 def health():
     """Simple health check endpoint."""
@@ -120,7 +253,7 @@ def rag_ui(req: RagRequest):
     # print("3")
 
     # 1) Retrieve
-    hits = S.retriever.search(q)
+    hits = S.retriever.search(q, filter=req.filter)
 
     print(f"hits: {len(hits)}")
 
@@ -167,7 +300,7 @@ def rag_po(req: RagRequest, defaults: PromptOptions = Depends(get_prompt_default
     q = req.q
 
     # 1) Retrieve
-    hits = S.retriever.search(q)
+    hits = S.retriever.search(q, filter=req.filter)
 
     print(f"count hits: {len(hits)}")
 
@@ -0,0 +1,206 @@
+# src/rag/sparse.py
+# BM25 inverted index over the chunk texts (built at ingest, stored in <index>/sparse/) + rank fusion with dense hits
+
+from __future__ import annotations
+import os
+import re
+import json
+import math
+import shutil
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.fsutil import atomic_write
+
+SPARSE_DIR = "sparse"
+_ARRAYS = ("indptr", "docs", "weights", "labels")
+
+_TOKEN = re.compile(r"\w+")
+# very common words only: their posting lists are the long ones, and BM25 gives them ~0 weight anyway
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i if in is it of on or so that the their them "
+    "then there they this to was what when where which who why will with you your "
+    "der die das und oder ein eine einen einer ist sind im in zu mit von den dem des auf fuer für wie was "
+    "wenn bei nicht sich es".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class SparseIndex:
+    """
+    Okapi BM25 with precomputed impacts: posting j of term t stores
+        idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+    so a query only sums a few array slices. CSR layout, one .npy each:
+      indptr  (n_terms + 1,) int64    postings of term t: [indptr[t], indptr[t+1])
+      docs    (nnz,)         int32    doc number, sorted within a term
+      weights (nnz,)         float32  impact
+      labels  (n_docs,)      int64    doc number -> index label
+    plus vocab.json (sorted terms; term id = position) and info.json.
+    Arrays are memory-mapped on load.
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        indptr: np.ndarray,
+        docs: np.ndarray,
+        weights: np.ndarray,
+        labels: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.terms = list(terms)
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.labels = labels
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self) -> int:
+        return int(self.labels.shape[0])
+
+    @classmethod
+    def build(cls, labels: Sequence[int], texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "SparseIndex":
+        counts = [Counter(tokenize(t)) for t in texts]
+        labels = np.asarray(labels, dtype=np.int64)
+        assert len(counts) == labels.shape[0], "labels/texts length mismatch"
+        terms = sorted({t for c in counts for t in c})
+        vocab = {t: i for i, t in enumerate(terms)}
+        n_docs = len(counts)
+
+        nnz = sum(len(c) for c in counts)
+        t_ids = np.empty(nnz, dtype=np.int64)
+        d_ids = np.empty(nnz, dtype=np.int32)
+        tfs = np.empty(nnz, dtype=np.float32)
+        doc_len = np.empty(n_docs, dtype=np.float32)
+        j = 0
+        for d, c in enumerate(counts):
+            n = len(c)
+            t_ids[j:j + n] = [vocab[t] for t in c]
+            d_ids[j:j + n] = d
+            tfs[j:j + n] = list(c.values())
+            doc_len[d] = sum(c.values())
+            j += n
+
+        order = np.lexsort((d_ids, t_ids))  # by term, then doc
+        t_ids, d_ids, tfs = t_ids[order], d_ids[order], tfs[order]
+        df = np.bincount(t_ids, minlength=len(terms))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        # Lucene's idf: never negative, even for terms in most chunks
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = float(doc_len.mean()) if n_docs and doc_len.mean() > 0 else 1.0
+        norm = k1 * (1.0 - b + b * doc_len[d_ids] / avg_len)
+        weights = (idf[t_ids] * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32)
+        return cls(terms, indptr, d_ids, weights, labels, k1=k1, b=b)
+
+    def search(self, query: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """(labels, BM25 scores) of the top-k chunks containing any query term, best first."""
+        ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+        if not ids or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(ids) == 1:
+            lo, hi = self.indptr[ids[0]], self.indptr[ids[0] + 1]
+            cand, scores = np.asarray(self.docs[lo:hi]), np.asarray(self.weights[lo:hi])
+        else:
+            docs = np.concatenate([self.docs[self.indptr[t]:self.indptr[t + 1]] for t in ids])
+            weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in ids])
+            # only touched docs: cost follows the posting lengths, not the corpus size
+            cand, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights, minlength=cand.shape[0]).astype(np.float32)
+        if cand.shape[0] > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            cand, scores = cand[top], scores[top]
+        order = np.lexsort((cand, -scores))  # ties: lower doc number first
+        return np.asarray(self.labels)[cand[order]], scores[order]
+
+    # ----- persistence -----
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, SPARSE_DIR, "info.json"))
+
+    @staticmethod
+    def remove(path: str) -> None:
+        shutil.rmtree(os.path.join(path, SPARSE_DIR), ignore_errors=True)
+
+    def save(self, path: str) -> None:
+        out = os.path.join(path, SPARSE_DIR)
+        os.makedirs(out, exist_ok=True)
+        files: Dict[str, Any] = {name + ".npy": getattr(self, name) for name in _ARRAYS}
+        files["vocab.json"] = self.terms
+        files["info.json"] = {"k1": self.k1, "b": self.b, "n_docs": len(self), "n_terms": len(self.terms)}
+        for name, value in files.items():  # replace, never overwrite: a loaded copy may map the old file
+            if name.endswith(".npy"):
+                atomic_write(os.path.join(out, name), lambda f, v=value: np.save(f, v))
+            else:
+                atomic_write(os.path.join(out, name), lambda f, v=value: json.dump(v, f, ensure_ascii=False), mode="w")
+
+    @classmethod
+    def load(cls, path: str) -> "SparseIndex":
+        d = os.path.join(path, SPARSE_DIR)
+        with open(os.path.join(d, "info.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        with open(os.path.join(d, "vocab.json"), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        arrays = {name: np.load(os.path.join(d, name + ".npy"), mmap_mode="r") for name in _ARRAYS}
+        assert arrays["indptr"].shape[0] == len(terms) + 1, f"{d}: vocab.json does not match indptr.npy"
+        return cls(terms, k1=info["k1"], b=info["b"], **arrays)
+
+
+def save_sparse(path: str, sparse: Optional[SparseIndex]) -> None:
+    """Write (or, for None, drop a stale copy of) the sparse index of an index dir."""
+    if sparse is None:
+        SparseIndex.remove(path)
+    else:
+        sparse.save(path)
+
+
+def load_sparse(path: str) -> Optional[SparseIndex]:
+    return SparseIndex.load(path) if SparseIndex.exists(path) else None
+
+
+def fuse(
+    dense: Sequence[Tuple[int, float]],
+    sparse: Sequence[Tuple[int, float]],
+    method: str = "rrf",
+    dense_weight: float = 1.0,
+    sparse_weight: float = 1.0,
+    rrf_k: int = 60,
+) -> List[Tuple[int, float]]:
+    """
+    Merge (label, score) lists - dense: distance, lower is better; sparse: BM25,
+    higher is better - into (label, fused score), best first.
+      "rrf":      sum of weight / (rrf_k + rank)           (scale-free)
+      "weighted": sum of weight * min-max normalized score (0..1 per side)
+    """
+    assert method in ("rrf", "weighted"), f"unknown fusion method: {method}"
+    fused: Dict[int, float] = {}
+
+    def add(items: Sequence[Tuple[int, float]], weight: float, rel: Sequence[float]) -> None:
+        for (label, _), r in zip(items, rel):
+            fused[label] = fused.get(label, 0.0) + weight * r
+
+    for items, weight, higher_better in ((dense, dense_weight, False), (sparse, sparse_weight, True)):
+        if not items or weight == 0:
+            continue
+        if method == "rrf":
+            rel = [1.0 / (rrf_k + rank) for rank in range(1, len(items) + 1)]
+        else:
+            s = [float(v) for _, v in items]
+            lo, hi = min(s), max(s)
+            span = hi - lo
+            if span <= 0 or math.isnan(span):
+                rel = [1.0] * len(s)
+            else:
+                rel = [(v - lo) / span if higher_better else (hi - v) / span for v in s]
+        add(items, weight, rel)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,162 @@
+# src/rag/tuning.py
+# `rag tune-index`: exact ground truth by brute force, recall@k and latency per ef (and M), smallest ef meeting a target
+
+from __future__ import annotations
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import hnswlib
+
+from rag.indexer import HnswIndex
+from rag.manifest import update_params
+
+DEFAULT_EFS = (16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512)
+
+
+@dataclass
+class TuneRow:
+    M: int
+    ef: int
+    recall: float      # recall@k against the exact top-k
+    p50_ms: float      # single-query, single-thread latency
+    p99_ms: float
+
+
+def _distances(space: str, q: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Same distances hnswlib reports (cosine vectors are stored normalized)."""
+    if space == "l2":
+        return (q * q).sum(1)[:, None] - 2.0 * (q @ vectors.T) + (vectors * vectors).sum(1)[None, :]
+    if space == "cosine":
+        q = q / np.clip(np.linalg.norm(q, axis=1, keepdims=True), 1e-12, None)
+    return 1.0 - q @ vectors.T
+
+
+def exact_topk(
+    space: str,
+    vectors: np.ndarray,
+    labels: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    exclude: Optional[np.ndarray] = None,
+    block: int = 256,
+) -> np.ndarray:
+    """(n_queries, k) labels of the true nearest neighbours; `exclude[i]` = row left out for query i."""
+    out = np.empty((queries.shape[0], k), dtype=np.int64)
+    for b in range(0, queries.shape[0], block):
+        d = _distances(space, queries[b:b + block], vectors)
+        if exclude is not None:
+            d[np.arange(d.shape[0]), exclude[b:b + block]] = np.inf
+        top = np.argpartition(d, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(d, top, axis=1).argsort(axis=1, kind="stable")
+        out[b:b + block] = labels[np.take_along_axis(top, order, axis=1)]
+    return out
+
+
+def measure(
+    graph: hnswlib.Index,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    ef: int,
+    exclude: Optional[np.ndarray] = None,
+) -> tuple:
+    """(recall@k, p50 ms, p99 ms) of one query at a time at this ef."""
+    k = truth.shape[1]
+    kq = k + 1 if exclude is not None else k   # the held-out chunk finds itself first
+    graph.set_ef(max(ef, kq))
+    graph.knn_query(queries[:1], k=kq, num_threads=1)  # warm-up
+    times = np.empty(queries.shape[0])
+    found = 0
+    for i in range(queries.shape[0]):
+        t0 = time.perf_counter()
+        got, _ = graph.knn_query(queries[i:i + 1], k=kq, num_threads=1)
+        times[i] = time.perf_counter() - t0
+        got = got[0].astype(np.int64)
+        if exclude is not None:
+            got = got[got != exclude[i]][:k]
+        found += len(np.intersect1d(got, truth[i]))
+    return found / float(truth.size), float(np.percentile(times, 50) * 1e3), float(np.percentile(times, 99) * 1e3)
+
+
+def rebuild_graph(space: str, vectors: np.ndarray, labels: np.ndarray, M: int, ef_construction: int) -> hnswlib.Index:
+    graph = hnswlib.Index(space=space, dim=vectors.shape[1])
+    graph.init_index(max_elements=max(len(labels), 1), ef_construction=ef_construction, M=M)
+    graph.add_items(vectors, labels)
+    return graph
+
+
+def pick(rows: Sequence[TuneRow], target_recall: float) -> Optional[TuneRow]:
+    """Smallest ef meeting the target per M; across several M the fastest (p50) of those."""
+    best: Dict[int, TuneRow] = {}
+    for r in sorted(rows, key=lambda r: r.ef):
+        if r.recall >= target_recall and r.M not in best:
+            best[r.M] = r
+    return min(best.values(), key=lambda r: (r.p50_ms, r.ef)) if best else None
+
+
+def tune_index(
+    index_dir: str,
+    k: int = 10,
+    target_recall: float = 0.95,
+    efs: Sequence[int] = DEFAULT_EFS,
+    Ms: Optional[Sequence[int]] = None,
+    n_queries: int = 200,
+    queries: Optional[np.ndarray] = None,
+    write: bool = True,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Sweep ef (and M, by rebuilding the graph in memory from the stored vectors)
+    on `queries` (already embedded + projected) or, by default, on a sample of
+    held-out chunks. With `write`, the smallest ef that reaches `target_recall`
+    for the index's own M goes into manifest.json (params.ef), which HnswIndex
+    uses on load. Other M values need a rebuild and are only reported.
+    """
+    index = HnswIndex()
+    index.load(index_dir)
+    labels = np.asarray([l for l in index.row_labels if l != -1], dtype=np.int64)
+    assert len(labels) > k, f"index has {len(labels)} chunks, need more than k={k}"
+    vectors = np.asarray(index.index.get_items(labels), dtype=np.float32)
+
+    exclude = None
+    if queries is None:
+        rows = np.random.default_rng(seed).choice(len(labels), min(n_queries, len(labels)), replace=False)
+        queries, exclude = vectors[rows], rows
+        source = f"{len(rows)} held-out chunks"
+    else:
+        source = f"{len(queries)} queries"
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    truth = exact_topk(index.space, vectors, labels, queries, k, exclude)
+    excl_labels = labels[exclude] if exclude is not None else None
+
+    results: List[TuneRow] = []
+    for M in (Ms or [index.M]):
+        graph = index.index if M == index.M else rebuild_graph(index.space, vectors, labels, M, index.ef_construction)
+        for ef in sorted(set(efs)):
+            results.append(TuneRow(M, ef, *measure(graph, queries, truth, ef, excl_labels)))
+
+    chosen = pick(results, target_recall)
+    current = pick([r for r in results if r.M == index.M], target_recall)
+    summary: Dict[str, Any] = {
+        "queries": source,
+        "k": k,
+        "target_recall": target_recall,
+        "M": index.M,
+        "ef_before": index.ef,
+        "rows": results,
+        "chosen": chosen,
+        "ef": current.ef if current else None,
+    }
+    if write and current is not None:
+        update_params(index_dir, ef=current.ef)
+        summary["written"] = True
+    return summary
+
+
+def format_table(rows: Sequence[TuneRow], chosen: Optional[TuneRow] = None) -> str:
+    lines = [f"{'M':>4} {'ef':>5} {'recall':>8} {'p50_ms':>8} {'p99_ms':>8}"]
+    for r in rows:
+        mark = "  <-" if chosen is not None and (r.M, r.ef) == (chosen.M, chosen.ef) else ""
+        lines.append(f"{r.M:>4} {r.ef:>5} {r.recall:>8.3f} {r.p50_ms:>8.3f} {r.p99_ms:>8.3f}{mark}")
+    return "\n".join(lines)
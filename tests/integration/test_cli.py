@@ -84,8 +84,7 @@ def retriever_stack_mocks(monkeypatch):
             vec = self.embedder.embed_one(question)
             return self.index.query(vec, k=self.k)
 
-    # Verbrauchsort patchen
-    monkeypatch.setattr(cli, "SBertEmbeddings", DummyEmbed, raising=True)
+    # Verbrauchsort patchen (the CLI builds embedders via rag.embed.load_embedder)
     monkeypatch.setattr(cli, "HnswIndex", DummyIndex, raising=True)
     monkeypatch.setattr(cli, "Retriever", DummyRetriever, raising=True)
     # Ursprungsmodul patchen (falls intern referenziert)
@@ -117,7 +116,37 @@ def test_ingest_calls_builder_and_echo(monkeypatch, tmp_path):
     )
     assert res.exit_code == 0, res.output
     assert f"Index written to {out}" in res.output
-    assert called["args"] == (str(docs), str(out), "my-embedder", {'custom_chunker': True})
+    expected_kwargs = {
+        'custom_chunker': True,
+        'cache_dir': "data/embed_cache",
+        'batch_size': 64,
+        'workers': 1,
+        'threads_per_worker': None,
+        'reduce_dim': None,
+        'reduce_method': "pca",
+        'index_threads': -1,
+        'index_backend': 'auto',
+        'flat_max_chunks': 10_000,
+        'incremental': False,
+        'shards': 1,
+        'shard_by': 'source',
+        'publish': False,
+        'keep_versions': 3,
+        'sparse': True,
+    }
+    assert called["args"] == (str(docs), str(out), "my-embedder", expected_kwargs)
+
+
+def test_ingest_no_cache_disables_embedding_cache(monkeypatch, tmp_path):
+    called = {}
+
+    def fake_builder(*, docs_dir, out_dir, model_name, **kwargs):
+        called.update(kwargs)
+
+    monkeypatch.setattr(cli, "build_erc_index", fake_builder, raising=True)
+    res = runner.invoke(cli.app, ["ingest", "--docs", str(tmp_path), "--out", str(tmp_path / "i"), "--no-cache"])
+    assert res.exit_code == 0, res.output
+    assert called["cache_dir"] is None
 
 
 # -----------------------------
@@ -216,3 +245,19 @@ def test_llm_stream_no_retrieval_streams_tokens(monkeypatch):
     res = runner.invoke(cli.app, ["llm-stream-no-retrieval", "say hi"])
     assert res.exit_code == 0, res.output
     assert "xy" in res.output
+
+
+def test_tune_index_prints_table_and_dry_run_keeps_manifest(tmp_path):
+    import numpy as np
+    from rag.indexer import HnswIndex
+    from rag.manifest import read_manifest
+
+    idx = HnswIndex(M=8)
+    idx.build(dim=8, space="cosine")
+    idx.upsert_array(np.random.default_rng(0).normal(size=(200, 8)).astype(np.float32), [{"text": str(i)} for i in range(200)])
+    idx.save(str(tmp_path))
+
+    res = runner.invoke(cli.app, ["tune-index", "--index", str(tmp_path), "--efs", "20,200", "--k", "3", "--dry-run"])
+    assert res.exit_code == 0, res.output
+    assert "recall" in res.output and "not written (--dry-run)" in res.output
+    assert read_manifest(str(tmp_path)).params["ef"] == 128
@@ -0,0 +1,41 @@
+# tests/integration/test_cli_import_time.py
+import os
+import subprocess
+import sys
+
+# Budget for `import rag.cli` (cumulative, as reported by `python -X importtime`).
+# Override on slow CI machines with RAG_CLI_IMPORT_BUDGET_MS.
+BUDGET_MS = float(os.environ.get("RAG_CLI_IMPORT_BUDGET_MS", "1000"))
+
+# backends that must only be imported inside the commands that use them
+HEAVY_MODULES = {"torch", "sentence_transformers", "transformers", "llama_cpp", "onnxruntime", "fastapi"}
+
+
+def _importtime(module: str):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    rows = {}
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows[name.strip()] = int(cumulative)
+    return rows
+
+
+def test_import_rag_cli_stays_within_budget():
+    rows = _importtime("rag.cli")
+    assert "rag.cli" in rows
+    total_ms = rows["rag.cli"] / 1000.0
+    assert total_ms < BUDGET_MS, f"import rag.cli took {total_ms:.0f} ms (budget {BUDGET_MS:.0f} ms)"
+
+
+def test_import_rag_cli_does_not_load_heavy_backends():
+    rows = _importtime("rag.cli")
+    loaded = {name.split(".")[0] for name in rows}
+    assert not (loaded & HEAVY_MODULES), f"heavy modules imported eagerly: {sorted(loaded & HEAVY_MODULES)}"
@@ -0,0 +1,199 @@
+# tests/integration/test_incremental_ingest.py
+import os
+import zlib
+
+import numpy as np
+import pytest
+
+import scripts.build_index as bi
+from rag.indexer import open_index
+
+
+class HashEmbed:
+    """Deterministic bag-of-words vectors; counts how many texts it encoded."""
+    calls = 0
+
+    def __init__(self, model_name, **_):
+        self.model_name = model_name
+
+    def embed(self, texts):
+        HashEmbed.calls += len(texts)
+        out = np.zeros((len(texts), 16), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in t.lower().split():
+                out[i, zlib.crc32(w.encode()) % 16] += 1.0
+        out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out.tolist()
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    monkeypatch.setattr(bi, "load_embedder", HashEmbed)
+    HashEmbed.calls = 0
+    d = tmp_path / "docs"
+    d.mkdir()
+    (d / "cpr.md").write_text("Push hard and fast in the centre of the chest.")
+    (d / "bleeding.md").write_text("Apply direct pressure to the wound.")
+    (d / "aed.md").write_text("Switch on the AED and follow the voice prompts.")
+    return d
+
+
+def _build(docs, out, **kw):
+    return bi.build_erc_index(str(docs), str(out), model_name="hash", cache_dir=None, **kw)
+
+
+def _texts(out):
+    idx = open_index(str(out))
+    return sorted(idx.meta[r]["text"] for r in idx._live_rows())
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+def test_incremental_touches_only_changed_docs(docs, tmp_path, backend):
+    out = tmp_path / "index"
+    full = _build(docs, out, index_backend=backend)
+    assert full["chunks"] == 3
+
+    # nothing changed: no embedding, index untouched
+    HashEmbed.calls = 0
+    s = _build(docs, out, index_backend=backend, incremental=True)
+    assert (s["mode"], s["chunks_upserted"], s["chunks_deleted"], HashEmbed.calls) == ("incremental", 0, 0, 0)
+
+    # edit a doc, delete a doc, add a doc
+    (docs / "cpr.md").write_text("Push hard and fast: 30 compressions, then 2 breaths.")
+    os.utime(docs / "cpr.md", (1, 1))
+    (docs / "aed.md").unlink()
+    (docs / "recovery.md").write_text("Roll the person onto their side.")
+    HashEmbed.calls = 0
+    s = _build(docs, out, index_backend=backend, incremental=True)
+
+    assert s["documents_changed"] == 2 and s["documents_removed"] == 1
+    assert s["chunks_upserted"] == 2          # edited chunk (new id) + new doc
+    assert s["chunks_deleted"] == 2           # old chunk of the edited doc + removed doc
+    assert s["chunks_kept"] == 1
+    assert HashEmbed.calls == 2
+    assert _texts(out) == sorted([
+        "Push hard and fast: 30 compressions, then 2 breaths.",
+        "Apply direct pressure to the wound.",
+        "Roll the person onto their side.",
+    ])
+
+
+def test_incremental_falls_back_to_full_build_on_new_chunker_settings(docs, tmp_path):
+    out = tmp_path / "index"
+    _build(docs, out)
+    s = bi.build_erc_index(str(docs), str(out), model_name="hash", cache_dir=None, target_chars=800, incremental=True)
+    assert s["mode"] == "full"
+
+
+@pytest.mark.parametrize("change", [{"index_backend": "int8"}, {"shards": 2}, {"shards": 2, "shard_by": "hash"}])
+def test_incremental_falls_back_to_full_build_on_new_index_layout(docs, tmp_path, change):
+    from rag.manifest import read_manifest
+
+    out = tmp_path / "index"
+    _build(docs, out, index_backend="flat", **({"shards": 2} if change.get("shard_by") else {}))
+    s = _build(docs, out, incremental=True, **{"index_backend": "flat", **change})
+    assert s["mode"] == "full"
+    m = read_manifest(str(out))
+    assert (m.params.get("n_shards", 1), m.params.get("shard_backend", m.backend)) == (
+        change.get("shards", 1), change.get("index_backend", "flat"))
+
+    # same layout again (auto keeps whatever backend the full build chose): updated in place
+    assert _build(docs, out, incremental=True, **change)["mode"] == "incremental"
+
+
+def test_sharded_ingest_rewrites_only_the_changed_shard(docs, tmp_path):
+    out = tmp_path / "index"
+    full = _build(docs, out, index_backend="flat", shards=3)
+    assert (full["shards"], full["chunks"]) == (3, 3)
+    idx = open_index(str(out))
+    cpr = idx.shard_of(0, {"source": "cpr.md"})
+    vec_files = {s: os.path.join(idx.shard_dir(str(out), s), "vectors.npy") for s in range(3)}
+    before = {s: os.stat(p).st_mtime_ns for s, p in vec_files.items()}
+
+    (docs / "cpr.md").write_text("Push hard and fast: 30 compressions, then 2 breaths.")
+    os.utime(docs / "cpr.md", (1, 1))
+    s = _build(docs, out, index_backend="flat", shards=3, incremental=True)
+    assert (s["mode"], s["chunks_upserted"], s["chunks_deleted"]) == ("incremental", 1, 1)
+
+    after = {s: os.stat(p).st_mtime_ns for s, p in vec_files.items()}
+    assert [s for s in range(3) if after[s] != before[s]] == [cpr]
+    idx = open_index(str(out))
+    hit = idx.query(HashEmbed("hash").embed_one("Push hard and fast: 30 compressions, then 2 breaths."), k=1)[0]
+    assert hit["text"] == "Push hard and fast: 30 compressions, then 2 breaths."
+
+
+def test_publish_flips_current_and_leaves_old_version_intact(docs, tmp_path):
+    from rag.manifest import validate_manifest
+    from rag.publish import current_version, resolve_index_dir
+
+    out = tmp_path / "index"
+    s1 = _build(docs, out, index_backend="hnsw", publish=True)
+    v1 = resolve_index_dir(str(out))
+    assert current_version(str(out)) == s1["published"]
+
+    # unchanged docs: no new version
+    s = _build(docs, out, index_backend="hnsw", publish=True, incremental=True)
+    assert "published" not in s and resolve_index_dir(str(out)) == v1
+
+    (docs / "aed.md").unlink()
+    s2 = _build(docs, out, index_backend="hnsw", publish=True, incremental=True)
+    assert s2["mode"] == "incremental" and s2["published"] != s1["published"]
+    assert len(_texts(out)) == 2                        # open_index follows CURRENT
+    # the previous version was a hard-linked starting point; rewriting the new one did not touch it
+    validate_manifest(v1, checksums=True)
+    assert len(_texts(v1)) == 3
+
+
+def test_ingest_without_publish_refuses_a_published_root(docs, tmp_path):
+    out = tmp_path / "index"
+    _build(docs, out, index_backend="hnsw", publish=True)
+    for incremental in (True, False):
+        with pytest.raises(ValueError, match="--publish"):
+            _build(docs, out, index_backend="hnsw", incremental=incremental)
+    assert not (out / "manifest.json").exists()
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_ingest_builds_sparse_index_and_keeps_it_current(docs, tmp_path, shards):
+    from rag.manifest import validate_manifest
+
+    out = tmp_path / "index"
+    _build(docs, out, index_backend="hnsw", shards=shards)
+    idx = open_index(str(out))
+    assert idx.sparse is not None and len(idx.sparse) == 3
+    labels, _ = idx.sparse.search("voice prompts", k=3)
+    assert [h["meta"]["source"] for h in idx.hits_for(labels, [0.0] * len(labels))] == ["aed.md"]
+
+    (docs / "aed.md").unlink()
+    (docs / "choking.md").write_text("Give up to five back blows between the shoulder blades.")
+    _build(docs, out, index_backend="hnsw", shards=shards, incremental=True)
+    validate_manifest(str(out), checksums=True)   # sparse/ files are part of the index
+    idx = open_index(str(out))
+    assert len(idx.sparse) == 3 and idx.sparse.search("voice prompts", k=3)[0].size == 0
+    labels, _ = idx.sparse.search("back blows", k=1)
+    assert idx.hits_for(labels, [0.0])[0]["meta"]["source"] == "choking.md"
+
+    _build(docs, out, index_backend="hnsw", shards=shards, sparse=False)
+    assert open_index(str(out)).sparse is None
+
+
+def test_embedding_workers_are_closed_when_encoding_fails(docs, tmp_path, monkeypatch):
+    closed = []
+
+    class FailingPool(HashEmbed):
+        def __init__(self, model_name, **_):
+            super().__init__(model_name)
+
+        def embed_batches(self, batches):
+            raise RuntimeError("worker died")
+
+        def close(self):
+            closed.append(True)
+
+    monkeypatch.setattr(bi, "ProcessPoolEmbeddings", FailingPool)
+    with pytest.raises(RuntimeError, match="worker died"):
+        _build(docs, tmp_path / "index", index_backend="flat", workers=2)
+    assert closed == [True]
@@ -45,8 +45,10 @@ class _DummyIndex:
 class _DummyRetriever:
     def __init__(self, embedder, index, k: int = 5):
         self.k = k
+        self.filters = []
 
-    def search(self, q: str):
+    def search(self, q: str, filter=None):
+        self.filters.append(filter)
         return [{"text": "Doc A"}, {"text": "Doc B"}]
 
 
@@ -92,6 +94,21 @@ def test_rag_once_ok(client):
     assert r.json() == {"answer": "OK"}
 
 
+def test_rag_forwards_filter_to_retriever(client):
+    import rag.server as server
+
+    for path in ("/rag_ui", "/rag_po"):
+        assert client.post(path, json={"q": "What is this?", "filter": {"source": ["bls.md"]}}).status_code == 200
+        assert client.post(path, json={"q": "What is this?"}).status_code == 200
+    assert server.S.retriever.filters == [{"source": ["bls.md"]}, None] * 2
+
+
+def test_rag_rejects_non_scalar_filter_values(client):
+    for bad in ({"source": {"$in": ["bls.md"]}}, {"source": [["bls.md"]]}):
+        for path in ("/rag_ui", "/rag_po"):
+            assert client.post(path, json={"q": "What is this?", "filter": bad}).status_code == 422
+
+
 def test_rag_streaming_handles_errors(client, monkeypatch):
     import rag.server as server
 
@@ -103,3 +120,34 @@ def test_rag_streaming_handles_errors(client, monkeypatch):
     r = client.post("/rag", json={"q": "cause error"})
     assert r.status_code == 200
     assert "[stream-error] ValueError: kaboom" in r.text
+
+
+def test_admin_reload_swaps_to_published_version(client, tmp_path, monkeypatch):
+    import rag.server as server
+    from rag.publish import publish_version, stage_version
+
+    root = tmp_path / "index"
+    version = stage_version(str(root))
+    publish_version(str(root), version)
+    monkeypatch.setattr(server, "INDEX_DIR", str(root), raising=False)
+    monkeypatch.setenv(server.ADMIN_TOKEN_ENV, "s3cret")
+    old_retriever = server.S.retriever
+    admin = {"X-Admin-Token": "s3cret"}
+
+    r = client.post("/admin/reload", headers=admin)
+    assert r.status_code == 200
+    assert r.json() == {"reloaded": True, "index": version}
+    assert server.S.retriever is not old_retriever and server.S.index_path == version
+    assert client.post("/rag_once", json={"q": "still answering?"}).json() == {"answer": "OK"}
+
+    assert client.post("/admin/reload", headers=admin).json()["reloaded"] is False   # already serving it
+
+
+def test_admin_reload_is_off_without_a_token_and_checks_it(client, monkeypatch):
+    import rag.server as server
+
+    monkeypatch.delenv(server.ADMIN_TOKEN_ENV, raising=False)
+    assert client.post("/admin/reload").status_code == 404
+    monkeypatch.setenv(server.ADMIN_TOKEN_ENV, "s3cret")
+    assert client.post("/admin/reload").status_code == 401
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "guess"}).status_code == 401
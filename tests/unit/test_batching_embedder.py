@@ -0,0 +1,104 @@
+# tests/unit/test_batching_embedder.py
+import threading
+import numpy as np
+import pytest
+
+from rag.embed import BatchingEmbedder, load_embedder_config
+
+
+class SlowCountingEmbedder:
+    """Records the batch sizes it was called with."""
+    model_name = "fake-mini"
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def embed_array(self, texts):
+        with self.lock:
+            self.batches.append(len(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+    def embed(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+def test_concurrent_embed_one_calls_are_merged_and_routed_back():
+    inner = SlowCountingEmbedder()
+    emb = BatchingEmbedder(inner, max_batch_size=64, max_wait_ms=50)
+    texts = ["x" * i for i in range(1, 21)]
+    results = {}
+    barrier = threading.Barrier(len(texts))
+
+    def worker(t):
+        barrier.wait()
+        results[t] = emb.embed_one(t)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    emb.close()
+
+    # every caller got its own vector back
+    for t in texts:
+        assert results[t] == [float(len(t)), 1.0]
+    # and far fewer encode calls than callers
+    assert sum(inner.batches) == len(texts)
+    assert len(inner.batches) < len(texts)
+    assert emb.stats()["avg_batch_size"] > 1
+
+
+def test_batch_size_is_capped():
+    inner = SlowCountingEmbedder()
+    emb = BatchingEmbedder(inner, max_batch_size=3, max_wait_ms=20)
+    futs = [emb.submit(str(i)) for i in range(7)]
+    [f.result() for f in futs]
+    emb.close()
+    assert max(inner.batches) <= 3
+    assert sum(inner.batches) == 7
+
+
+def test_errors_reach_every_waiting_caller():
+    class Broken:
+        def embed(self, texts):
+            raise RuntimeError("boom")
+
+    emb = BatchingEmbedder(Broken(), max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        emb.embed_one("a")
+    emb.close()
+
+
+def test_close_fails_queued_callers_and_rejects_new_ones():
+    started, release = threading.Event(), threading.Event()
+
+    class Stuck(SlowCountingEmbedder):
+        def embed_array(self, texts):
+            started.set()
+            release.wait(5)
+            return super().embed_array(texts)
+
+    emb = BatchingEmbedder(Stuck(), max_batch_size=1, max_wait_ms=0)
+    first = emb.submit("a")
+    started.wait(5)
+    queued = emb.submit("b")
+    emb.close(timeout=0.05)               # worker is stuck in encode: "b" must not wait forever
+    with pytest.raises(RuntimeError, match="closed"):
+        queued.result(timeout=1)
+    with pytest.raises(RuntimeError, match="closed"):
+        emb.submit("c")
+    release.set()
+    assert first.result(timeout=5).tolist() == [1.0, 1.0]
+
+
+def test_embedder_config_defaults_when_section_missing(tmp_path):
+    p = tmp_path / "rag.yaml"
+    p.write_text("llm:\n  model_path: x\n", encoding="utf-8")
+    cfg = load_embedder_config(str(p))
+    assert cfg.model_name == "sentence-transformers/all-MiniLM-L6-v2"
+    assert cfg.batch_max_size == 32
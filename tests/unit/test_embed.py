@@ -0,0 +1,74 @@
+# tests/unit/test_embed.py
+import numpy as np
+
+from rag.embed import embed_bulk, token_lengths
+
+
+class RecordingEmbedder:
+    """Vector = [number of words, 1.0]; remembers every batch it encoded."""
+
+    def __init__(self):
+        self.batches = []
+
+    def token_lengths(self, texts):
+        return [len(t.split()) for t in texts]
+
+    def embed_array(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[float(len(t.split())), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_embed_bulk_sorts_by_length_and_restores_order():
+    texts = ["a b c d e", "a", "a b c", "a b", "a b c d", "a b c d e f"]
+    emb = RecordingEmbedder()
+    out = embed_bulk(emb, texts, batch_size=2)
+
+    # original order restored
+    assert out[:, 0].tolist() == [5.0, 1.0, 3.0, 2.0, 4.0, 6.0]
+    # fixed-size batches of neighbouring lengths
+    assert [len(b) for b in emb.batches] == [2, 2, 2]
+    assert [[len(t.split()) for t in b] for b in emb.batches] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_embed_bulk_fills_preallocated_matrix():
+    emb = RecordingEmbedder()
+    buf = np.zeros((3, 2), dtype=np.float32)
+    out = embed_bulk(emb, ["x y", "x", "x y z"], batch_size=8, out=buf)
+    assert out is buf
+    assert len(emb.batches) == 1
+    assert buf[:, 0].tolist() == [2.0, 1.0, 3.0]
+
+
+def test_token_lengths_falls_back_to_word_count():
+    class NoTokenizer:
+        pass
+    assert token_lengths(NoTokenizer(), ["one two", ""]) == [2, 0]
+
+
+class _WordCountEmbedder:
+    def embed_array(self, texts):
+        import os
+        return np.array([[float(len(t.split())), float(os.getpid())] for t in texts], dtype=np.float32)
+
+
+def _fake_loader(model_name, device):
+    # module-level so spawn workers can unpickle it
+    return _WordCountEmbedder()
+
+
+def test_process_pool_keeps_submission_order():
+    from rag.embed import ProcessPoolEmbeddings
+
+    texts = [" ".join(["w"] * n) for n in (5, 1, 4, 2, 6, 3, 7)]
+    pool = ProcessPoolEmbeddings("fake", workers=2, threads_per_worker=1, loader=_fake_loader)
+    try:
+        out = embed_bulk(pool, texts, batch_size=2)
+        direct = pool.embed_array(texts)
+    finally:
+        pool.close()
+
+    assert out[:, 0].tolist() == [5.0, 1.0, 4.0, 2.0, 6.0, 3.0, 7.0]
+    assert direct[:, 0].tolist() == out[:, 0].tolist()
+    # the work really ran outside this process
+    import os
+    assert os.getpid() not in set(out[:, 1].astype(int).tolist())
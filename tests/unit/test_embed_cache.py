@@ -0,0 +1,66 @@
+# tests/unit/test_embed_cache.py
+import numpy as np
+
+from rag.embed_cache import EmbeddingCache, embed_cached, content_key
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.seen = []
+
+    def embed(self, texts):
+        self.seen.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+def test_content_key_depends_on_model_and_text():
+    assert content_key("m1", "a") == content_key("m1", "a")
+    assert content_key("m1", "a") != content_key("m2", "a")
+    assert content_key("m1", "a") != content_key("m1", "b")
+
+
+def test_embed_cached_only_encodes_misses_and_persists(tmp_path):
+    path = str(tmp_path / "cache" / "emb.sqlite")
+    emb = CountingEmbedder()
+
+    cache = EmbeddingCache(path)
+    out = embed_cached(emb, ["aa", "bbb"], cache, "m")
+    assert out.dtype == np.float32
+    assert out.tolist() == [[2.0, 1.0], [3.0, 1.0]]
+    assert cache.stats()["cache_misses"] == 2
+    cache.close()
+
+    # reopen -> vectors come from disk, only the new text is encoded
+    emb.seen.clear()
+    cache = EmbeddingCache(path)
+    buf = np.zeros((3, 2), dtype=np.float32)
+    out = embed_cached(emb, ["aa", "c", "bbb"], cache, "m", out=buf)
+    assert out is buf
+    assert out.tolist() == [[2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    assert emb.seen == ["c"]
+    assert cache.stats()["cache_hits"] == 2
+    assert cache.stats()["cache_misses"] == 1
+
+    # other model -> no sharing
+    emb.seen.clear()
+    embed_cached(emb, ["aa"], cache, "other-model")
+    assert emb.seen == ["aa"]
+    cache.close()
+
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), max_entries=2)
+    cache.put_many("m", ["a"], [[1.0]])
+    cache.put_many("m", ["b"], [[2.0]])
+    cache.get_many("m", ["a"])           # touch "a" -> "b" is now the oldest
+    cache.put_many("m", ["c"], [[3.0]])
+
+    assert len(cache) == 2
+    got = cache.get_many("m", ["a", "b", "c"])
+    assert got[1] is None
+    np.testing.assert_allclose(got[0], [1.0])
+    np.testing.assert_allclose(got[2], [3.0])
+    assert cache.stats()["cache_evicted"] == 1
@@ -0,0 +1,70 @@
+# tests/unit/test_embed_onnx.py
+import json
+import numpy as np
+import pytest
+
+from rag.embed import OnnxEmbeddings, mean_pool, l2_normalize, is_onnx_spec
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 2.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    np.testing.assert_allclose(mean_pool(hidden, mask), [[2.0, 1.0]])
+
+
+def test_l2_normalize_rows():
+    out = l2_normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out[0], [0.6, 0.8])
+    np.testing.assert_allclose(out[1], [0.0, 0.0])
+
+
+def test_onnx_spec_detection():
+    assert is_onnx_spec("onnx:models/x")
+    assert is_onnx_spec("onnx-int8:models/x")
+    assert not is_onnx_spec("sentence-transformers/all-MiniLM-L6-v2")
+
+
+@pytest.fixture
+def tiny_onnx_dir(tmp_path):
+    """Embedding-lookup 'transformer' (Gather) + word-level tokenizer, as an export dir."""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    tokenizers = pytest.importorskip("tokenizers")
+    from onnx import helper, TensorProto, numpy_helper
+
+    vocab = {"[PAD]": 0, "[UNK]": 1, "call": 2, "112": 3, "bandage": 4}
+    table = np.random.RandomState(0).randn(len(vocab), 4).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "tiny",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["b", "s"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["b", "s"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["b", "s", 4])],
+        initializer=[numpy_helper.from_array(table, "table")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model.onnx"))
+
+    tok = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tok.save(str(tmp_path / "tokenizer.json"))
+    (tmp_path / "export.json").write_text(json.dumps({"source_model": "tiny", "max_length": 8}))
+    return tmp_path, vocab, table
+
+
+def test_onnx_embeddings_pool_and_normalize(tiny_onnx_dir):
+    path, vocab, table = tiny_onnx_dir
+    emb = OnnxEmbeddings.from_spec(f"onnx:{path}")
+    out = emb.embed_array(["call 112", "bandage"])
+
+    assert out.shape == (2, 4) and out.dtype == np.float32
+    expected0 = table[[vocab["call"], vocab["112"]]].mean(axis=0)
+    np.testing.assert_allclose(out[0], expected0 / np.linalg.norm(expected0), rtol=1e-5)
+    # padded row only pools its own token
+    np.testing.assert_allclose(out[1], table[vocab["bandage"]] / np.linalg.norm(table[vocab["bandage"]]), rtol=1e-5)
+    assert emb.embed_one("bandage") == pytest.approx(out[1].tolist())
+    assert emb.model_name == f"onnx:{path}"
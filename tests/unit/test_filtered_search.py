@@ -0,0 +1,84 @@
+# tests/unit/test_filtered_search.py
+import numpy as np
+import pytest
+
+from rag.indexer import FlatIndex, HnswIndex, Int8Index, chunk_label
+
+
+def _corpus(n=300, dim=16, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+SOURCES = ["bls.md", "als.md", "cpr.md"]
+
+
+def _build(idx, vecs):
+    metas = [{"text": f"t{i}", "id": str(i), "source": SOURCES[i % 3], "tags": ["odd" if i % 2 else "even"]}
+             for i in range(len(vecs))]
+    labels = [chunk_label(m["id"], m["source"]) for m in metas]
+    idx.build(dim=vecs.shape[1], space="cosine")
+    idx.upsert_array(vecs, metas, labels=labels)
+    return idx, labels
+
+
+def _exact(vecs, q, rows, k):
+    d = 1.0 - vecs[rows] @ q
+    return [f"t{rows[i]}" for i in np.argsort(d, kind="stable")[:k]]
+
+
+@pytest.mark.parametrize("make", [lambda: HnswIndex(ef=64), FlatIndex, lambda: Int8Index(rerank=8)])
+def test_filter_returns_only_matching_chunks_nearest_first(make):
+    vecs = _corpus()
+    idx, _ = _build(make(), vecs)
+    q = _corpus(3, seed=1)
+
+    for qi, res in enumerate(idx.query_batch(q, k=5, filter={"source": "bls.md"})):
+        assert [h["text"] for h in res] == _exact(vecs, q[qi], np.arange(0, 300, 3), 5)
+    # list value = any of; several keys = all of; list-valued metadata matches per item
+    res = idx.query(q[0].tolist(), k=300, filter={"source": ["bls.md", "cpr.md"], "tags": "odd"})
+    assert len(res) == 100
+    assert all(int(h["text"][1:]) % 2 == 1 and int(h["text"][1:]) % 3 != 1 for h in res)
+    assert idx.query_array(q[0], k=5, filter={"source": "missing.md"}) == []
+
+
+@pytest.mark.parametrize("make", [lambda: HnswIndex(ef=16), FlatIndex])
+def test_filter_follows_replace_and_delete(make):
+    vecs = _corpus(60)
+    idx, labels = _build(make(), vecs)
+    f = {"source": "als.md"}
+    assert len(idx.query_array(vecs[1], k=100, filter=f)) == 20
+
+    idx.mark_deleted([labels[1], labels[4]])
+    res = idx.query_array(vecs[1], k=100, filter=f)
+    assert len(res) == 18 and "t1" not in [h["text"] for h in res]
+
+    # re-upserting label 7 with another source moves it out of the filter
+    idx.upsert_array(vecs[7:8], [{"text": "t7b", "id": "7", "source": "bls.md"}], labels=[labels[7]])
+    assert "t7" not in [h["text"] for h in idx.query_array(vecs[7], k=100, filter=f)]
+    assert idx.query_array(vecs[7], k=1, filter={"source": "bls.md"})[0]["text"] == "t7b"
+
+
+def test_filter_survives_save_load(tmp_path):
+    vecs = _corpus(90)
+    idx, _ = _build(HnswIndex(), vecs)
+    idx.save(str(tmp_path))
+    loaded = HnswIndex()
+    loaded.load(str(tmp_path))
+    res = loaded.query_array(vecs[2], k=3, filter={"source": "cpr.md"})
+    assert res[0]["text"] == "t2" and all(h["meta"]["source"] == "cpr.md" for h in res)
+
+
+@pytest.mark.parametrize("make", [lambda: HnswIndex(ef=16), FlatIndex])
+def test_filter_rejects_non_scalar_values_and_bounds_its_cache(make, monkeypatch):
+    monkeypatch.setattr("rag.indexer.FILTER_CACHE_SIZE", 4)
+    vecs = _corpus(30)
+    idx, _ = _build(make(), vecs)
+    for bad in ({"source": {"$in": ["bls.md"]}}, {"source": [["bls.md"]]}, {1: "bls.md"}):
+        with pytest.raises(ValueError):
+            idx.query_array(vecs[0], k=3, filter=bad)
+
+    for i in range(10):
+        idx.query_array(vecs[0], k=3, filter={"source": f"s{i}.md"})
+    assert len(idx._filter_cache) == 4
+    assert len(idx.query_array(vecs[0], k=30, filter={"source": "bls.md"})) == 10
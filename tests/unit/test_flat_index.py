@@ -0,0 +1,75 @@
+# tests/unit/test_flat_index.py
+import numpy as np
+import pytest
+
+from rag.indexer import FlatIndex, HnswIndex, choose_backend, open_index
+
+
+def _corpus(n=200, dim=16, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_flat_matches_hnsw_results_and_scores():
+    vecs = _corpus()
+    metas = [{"text": f"t{i}", "id": str(i)} for i in range(len(vecs))]
+    flat, hnsw = FlatIndex(initial_capacity=8), HnswIndex(ef_construction=200, M=16, ef=200)
+    for idx in (flat, hnsw):
+        idx.build(dim=16, space="cosine")
+        idx.upsert_array(vecs[:50], metas[:50])   # two upserts: exercises buffer growth
+        idx.upsert_array(vecs[50:], metas[50:])
+
+    q = _corpus(5, seed=1)
+    for got, ref in zip(flat.query_batch(q, k=5), hnsw.query_batch(q, k=5)):
+        assert [h["text"] for h in got] == [h["text"] for h in ref]
+        assert [h["score"] for h in got] == pytest.approx([h["score"] for h in ref], abs=1e-5)
+    assert flat.query_array(q[0], k=3) == flat.query_batch(q, k=3)[0]
+
+
+def test_flat_k_larger_than_corpus_and_l2_space():
+    idx = FlatIndex()
+    idx.build(dim=2, space="l2")
+    idx.upsert([[0.0, 0.0], [3.0, 4.0]], [{"text": "origin"}, {"text": "far"}])
+
+    res = idx.query([0.0, 1.0], k=10)
+    assert [h["text"] for h in res] == ["origin", "far"]
+    assert [h["score"] for h in res] == pytest.approx([1.0, 18.0])
+
+
+def test_flat_save_load_is_memory_mapped_and_appendable(tmp_path):
+    idx = FlatIndex()
+    idx.build(dim=16)
+    idx.upsert_array(_corpus(20), [{"text": str(i)} for i in range(20)])
+    idx.save(str(tmp_path))
+
+    loaded = open_index(str(tmp_path))
+    assert isinstance(loaded, FlatIndex)
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.query_array(_corpus(20)[7], k=1)[0]["text"] == "7"
+
+    loaded.upsert_array(_corpus(1, seed=3), [{"text": "new"}])  # copies off the read-only map
+    assert loaded.count == 21
+    assert loaded.query_array(_corpus(1, seed=3)[0], k=1)[0]["text"] == "new"
+
+
+def test_choose_backend():
+    assert choose_backend(100) == "flat"
+    assert choose_backend(100, flat_max_chunks=50) == "hnsw"
+    assert choose_backend(10, backend="hnsw") == "hnsw"
+    with pytest.raises(AssertionError):
+        choose_backend(10, backend="faiss")
+
+
+def test_flat_replace_and_delete_by_label(tmp_path):
+    idx = FlatIndex()
+    idx.build(dim=2)
+    idx.upsert([[1.0, 0.0], [0.0, 1.0]], [{"text": "x"}, {"text": "y"}], labels=[10, 20])
+    idx.upsert([[1.0, 1.0]], [{"text": "x2"}], labels=[10])
+    idx.mark_deleted([20])
+
+    assert [h["text"] for h in idx.query([1.0, 0.0], k=5)] == ["x2"]
+
+    idx.save(str(tmp_path))
+    loaded = open_index(str(tmp_path))
+    assert loaded.count == 1 and loaded.has_label(10)
+    assert loaded.query([1.0, 0.0], k=5)[0]["text"] == "x2"
@@ -0,0 +1,23 @@
+# tests/unit/test_fsutil.py
+import os
+
+import pytest
+
+from rag.fsutil import atomic_write
+
+
+def test_atomic_write_replaces_the_inode_and_keeps_the_old_file_on_error(tmp_path):
+    p = tmp_path / "CURRENT"
+    atomic_write(str(p), lambda f: f.write("v1\n"), mode="w")
+    old = open(p, "rb")  # a reader holding the old file keeps seeing it
+    atomic_write(str(p), lambda f: f.write(b"v2\n"), fsync=True)
+    assert old.read() == b"v1\n" and p.read_text() == "v2\n"
+    old.close()
+
+    def boom(f):
+        f.write(b"partial")
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        atomic_write(str(p), boom)
+    assert p.read_text() == "v2\n" and os.listdir(tmp_path) == ["CURRENT"]
@@ -0,0 +1,100 @@
+# tests/unit/test_index_concurrency.py
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from rag.indexer import HnswIndex
+from rag.rwlock import RWLock
+
+
+def _vecs(n, dim=16, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_rwlock_readers_share_writers_exclude():
+    lock, inside, peak = RWLock(), [0], [0]
+    order = []
+
+    def reader():
+        with lock.read():
+            inside[0] += 1
+            peak[0] = max(peak[0], inside[0])
+            time.sleep(0.05)
+            inside[0] -= 1
+
+    def writer():
+        with lock.write():
+            order.append(("w", inside[0]))
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for t in readers:
+        t.start()
+    time.sleep(0.01)
+    w = threading.Thread(target=writer)
+    w.start()
+    for t in readers + [w]:
+        t.join()
+    assert peak[0] > 1                 # readers ran together
+    assert order == [("w", 0)]         # the writer waited for all of them
+
+
+def test_queries_during_live_upserts_and_deletes():
+    dim, base, batches, per_batch = 16, 200, 30, 20
+    all_vecs = _vecs(base + batches * per_batch, dim)
+    idx = HnswIndex(M=8, ef_construction=64, ef=32, initial_capacity=64, num_threads=2)   # forces resizes
+    idx.build(dim=dim, space="cosine")
+    idx.upsert_array(all_vecs[:base], [{"text": f"t{i}", "i": i, "source": f"s{i % 4}"} for i in range(base)],
+                     labels=list(range(base)))
+
+    stop, errors, n_queries = threading.Event(), [], [0]
+
+    def reader(seed):
+        rng = np.random.default_rng(seed)
+        try:
+            while not stop.is_set():
+                q = all_vecs[rng.integers(len(all_vecs), size=3)]
+                kw = {"filter": {"source": "s1"}} if rng.random() < 0.3 else {}
+                for r, hits in enumerate(idx.query_batch(q, k=5, **kw)):
+                    for h in hits:
+                        i = h["meta"]["i"]
+                        # metadata always belongs to the vector that was found
+                        assert h["text"] == f"t{i}"
+                        assert h["score"] == pytest.approx(1.0 - float(all_vecs[i] @ q[r]), abs=1e-4)
+                        if kw:
+                            assert h["meta"]["source"] == "s1"
+                idx.query_array(q[0], k=3)
+                n_queries[0] += 1
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+            stop.set()
+
+    def writer():
+        try:
+            for b in range(batches):
+                lo = base + b * per_batch
+                ids = list(range(lo, lo + per_batch))
+                idx.upsert_array(all_vecs[lo:lo + per_batch],
+                                 [{"text": f"t{i}", "i": i, "source": f"s{i % 4}"} for i in ids], labels=ids)
+                idx.mark_deleted([lo - 7])
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+        finally:
+            stop.set()
+
+    readers = [threading.Thread(target=reader, args=(s,)) for s in range(8)]
+    w = threading.Thread(target=writer)
+    for t in readers:
+        t.start()
+    w.start()
+    for t in [w] + readers:
+        t.join(timeout=60)
+
+    assert not errors, errors[0]
+    assert n_queries[0] > 0
+    last = base + batches * per_batch - 1
+    assert idx.query_array(all_vecs[last], k=1)[0]["text"] == f"t{last}"
+    assert len(idx.label_rows) == base + batches * per_batch - batches
+    assert idx.index.get_max_elements() >= len(idx.label_rows)
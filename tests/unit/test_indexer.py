@@ -5,12 +5,13 @@ import numpy as np
 import pytest
 
 from rag.indexer import HnswIndex
+from rag.meta_store import MetaStore
 
 
 def _with_header(idx: HnswIndex, dim: int, space: str = "cosine"):
     """
     NOTE:
-    HnswIndex.load() expects the first line in meta.jsonl to be a header:
+    HnswIndex.load() expects the first metadata row to be a header:
       {"_index_header": {"dim": <int>, "space": "<space>"}, "text": ""}
     We insert this BEFORE the first upsert() so that:
       - index IDs start at 1,
@@ -83,11 +84,11 @@ def test_save_and_load_roundtrip(tmp_path):
 
     # Files exist
     assert (save_dir / "hnsw.bin").exists()
-    assert (save_dir / "meta.jsonl").exists()
+    assert (save_dir / "meta" / "info.json").exists()
+    assert not (save_dir / "meta.jsonl").exists()
 
-    # First line in meta.jsonl is the header
-    with open(save_dir / "meta.jsonl", "r", encoding="utf-8") as f:
-        first = json.loads(f.readline())
+    # First metadata row is the header
+    first = MetaStore.open(str(save_dir))[0]
     assert "_index_header" in first
     assert first.get("text", "") == ""
 
@@ -100,3 +101,128 @@ def test_save_and_load_roundtrip(tmp_path):
     assert res[0]["text"] == "X"
     assert res[0]["score"] == pytest.approx(0.0, abs=1e-6)
     assert res[0]["meta"]["doc_id"] == "x1"
+
+
+def test_array_path_matches_list_path():
+    idx = HnswIndex(ef_construction=50, M=8, ef=64)
+    idx.build(dim=3, space="cosine")
+    _with_header(idx, dim=3)
+
+    mat = np.eye(3, dtype=np.float32)
+    idx.upsert_array(mat, [{"text": "A"}, {"text": "B"}, {"text": "C"}])
+
+    by_array = idx.query_array(np.array([0.0, 1.0, 0.0], dtype=np.float32), k=1)
+    by_list = idx.query([0.0, 1.0, 0.0], k=1)
+    assert by_array == by_list
+    assert by_array[0]["text"] == "B"
+
+
+def test_upsert_grows_capacity_beyond_initial():
+    idx = HnswIndex(ef_construction=50, M=8, ef=64, initial_capacity=4, num_threads=2)
+    idx.build(dim=8, space="cosine")
+
+    rng = np.random.default_rng(0)
+    for _ in range(3):  # 3 batches of 5 -> 15 items, far above the initial 4
+        idx.upsert_array(rng.normal(size=(5, 8)).astype(np.float32), [{"text": "t"}] * 5)
+
+    assert idx.index.get_current_count() == 15
+    assert idx.index.get_max_elements() >= 15
+    assert idx.last_insert["items"] == 5
+    assert idx.last_insert["items_per_s"] > 0
+    assert len(idx.query_array(rng.normal(size=8).astype(np.float32), k=10)) == 10
+
+
+def test_query_batch_matches_single_queries():
+    idx = HnswIndex(ef_construction=50, M=8, ef=64, num_threads=2)
+    idx.build(dim=3, space="cosine")
+    idx.upsert_array(np.eye(3, dtype=np.float32), [{"text": "A"}, {"text": "B"}, {"text": "C"}])
+
+    queries = np.array([[0, 0, 1], [1, 0, 0]], dtype=np.float32)
+    batched = idx.query_batch(queries, k=2)
+
+    assert len(batched) == 2
+    assert batched[0] == idx.query_array(queries[0], k=2)
+    assert batched[1][0]["text"] == "A"
+    assert idx.query_batch(np.empty((0, 3), dtype=np.float32), k=2) == []
+
+
+def test_load_converts_legacy_meta_jsonl(tmp_path):
+    idx = HnswIndex(ef_construction=50, M=8, ef=64)
+    idx.build(dim=2, space="cosine")
+    _with_header(idx, dim=2)
+    idx.upsert([[1.0, 0.0], [0.0, 1.0]], [{"text": "X", "id": "x1"}, {"text": "Y", "id": 7}])
+    idx.index.save_index(str(tmp_path / "hnsw.bin"))
+    # index written by the old save(): one JSON object per line
+    with open(tmp_path / "meta.jsonl", "w", encoding="utf-8") as f:
+        for m in idx.meta:
+            f.write(json.dumps(m) + "\n")
+
+    idx2 = HnswIndex()
+    idx2.load(str(tmp_path))
+
+    assert isinstance(idx2.meta, MetaStore)
+    assert (tmp_path / "meta" / "info.json").exists()
+    assert list(idx2.meta) == list(idx.meta)
+    assert idx2.query([0.0, 1.0], k=1)[0]["meta"] == {"id": 7}
+
+
+def test_stable_labels_replace_delete_and_survive_save(tmp_path):
+    from rag.indexer import chunk_label
+
+    idx = HnswIndex(ef_construction=50, M=8, ef=64)
+    idx.build(dim=3, space="cosine")
+    la, lb, lc = (chunk_label(c, "doc.md") for c in ("a", "b", "c"))
+    idx.upsert_array(np.eye(3, dtype=np.float32), [{"text": "A"}, {"text": "B"}, {"text": "C"}], labels=[la, lb, lc])
+
+    # replace B in place (same label, new vector + text), delete C
+    idx.upsert_array(np.array([[0, 0, 1]], dtype=np.float32), [{"text": "B2"}], labels=[lb])
+    assert idx.mark_deleted([lc, 12345]) == 1
+    assert idx.index.get_current_count() == 3  # replacement reused B's slot
+
+    res = idx.query([0.0, 0.0, 1.0], k=2)
+    assert [h["text"] for h in res] == ["B2", "A"]
+
+    idx.save(str(tmp_path))
+    idx2 = HnswIndex()
+    idx2.load(str(tmp_path))
+    assert len(idx2.meta) == 2  # tombstones (old B row, C) compacted away
+    assert idx2.has_label(lb) and not idx2.has_label(lc)
+    assert idx2.query([0.0, 0.0, 1.0], k=1)[0]["text"] == "B2"
+
+
+@pytest.mark.parametrize("backend", ["hnsw", "flat"])
+def test_unlabeled_upsert_after_delete_save_load_keeps_live_chunks(tmp_path, backend):
+    from rag.indexer import INDEX_BACKENDS, open_index
+
+    idx = INDEX_BACKENDS[backend]()
+    idx.build(dim=3, space="cosine")
+    idx.upsert_array(np.eye(3, dtype=np.float32), [{"text": "A"}, {"text": "B"}, {"text": "C"}])  # labels 0, 1, 2
+    idx.mark_deleted([0])
+    idx.save(str(tmp_path))
+
+    loaded = open_index(str(tmp_path))
+    assert len(loaded.meta) == 2  # compacted: row count is now C's label
+    loaded.upsert_array(np.array([[1.0, 1.0, 0.0]], dtype=np.float32), [{"text": "D"}])
+    texts = sorted(h["text"] for h in loaded.query([0.0, 0.0, 1.0], k=3))
+    assert texts == ["B", "C", "D"]
+    assert loaded.query([0.0, 0.0, 1.0], k=1)[0]["text"] == "C"
+
+
+@pytest.mark.parametrize("backend", ["hnsw", "flat", "int8", "sharded"])
+def test_get_vectors_returns_stored_vectors_by_label(tmp_path, backend):
+    from rag.indexer import INDEX_BACKENDS, open_index
+
+    x = np.random.default_rng(0).normal(size=(40, 8)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    kw = {"n_shards": 3, "partition": "hash", "shard_backend": "flat"} if backend == "sharded" else {}
+    idx = INDEX_BACKENDS[backend](**kw)
+    idx.build(dim=8, space="cosine")
+    labels = [1000 + 7 * i for i in range(40)]
+    idx.upsert_array(x, [{"text": f"t{i}"} for i in range(40)], labels=labels)
+    want = [labels[5], labels[0], labels[39]]
+    np.testing.assert_allclose(idx.get_vectors(want), x[[5, 0, 39]], atol=1e-6)
+
+    idx.save(str(tmp_path))
+    loaded = open_index(str(tmp_path))
+    np.testing.assert_allclose(loaded.get_vectors(want), x[[5, 0, 39]], atol=1e-6)
+    assert loaded.get_vectors([]).shape == (0, 8)
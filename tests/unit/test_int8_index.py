@@ -0,0 +1,53 @@
+# tests/unit/test_int8_index.py
+import numpy as np
+import pytest
+
+from rag.indexer import FlatIndex, Int8Index, open_index
+
+
+def _corpus(n=500, dim=32, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _top(idx, q, k):
+    return [[h["meta"]["i"] for h in hits] for hits in idx.query_batch(q, k=k)]
+
+
+@pytest.mark.parametrize("scale_mode", ["dimension", "vector"])
+def test_int8_recall_close_to_exact(scale_mode):
+    vecs, q = _corpus(), _corpus(50, seed=1)
+    metas = [{"i": i, "text": ""} for i in range(len(vecs))]
+    exact, approx, reranked = FlatIndex(), Int8Index(scale_mode, rerank=0, block_rows=64), Int8Index(scale_mode, rerank=4)
+    for idx in (exact, approx, reranked):
+        idx.build(dim=32)
+        idx.upsert_array(vecs, metas)
+
+    truth = _top(exact, q, 10)
+    recall = lambda got: np.mean([len(set(a) & set(b)) / 10 for a, b in zip(truth, got)])
+    assert recall(_top(approx, q, 10)) > 0.85
+    assert recall(_top(reranked, q, 10)) > 0.98
+    # re-ranked scores are the exact float32 distances
+    assert reranked.query_array(q[0], k=1)[0]["score"] == pytest.approx(exact.query_array(q[0], k=1)[0]["score"], abs=1e-5)
+    assert approx.memory_bytes() < exact.memory_bytes() / 3.5
+
+
+def test_int8_save_load_roundtrip_and_delete(tmp_path):
+    vecs = _corpus(40, dim=8)
+    idx = Int8Index("vector")
+    idx.build(dim=8)
+    idx.upsert_array(vecs, [{"text": str(i)} for i in range(40)], labels=list(range(100, 140)))
+    idx.mark_deleted([105])
+    idx.save(str(tmp_path))
+
+    loaded = open_index(str(tmp_path))
+    assert isinstance(loaded, Int8Index) and loaded.scale_mode == "vector"
+    assert loaded.count == 39
+    assert isinstance(loaded._fp32, np.memmap)  # full precision stays on disk
+    assert loaded.query_array(vecs[7], k=1)[0]["text"] == "7"
+    assert all(h["text"] != "5" for h in loaded.query_array(vecs[5], k=3))
+
+
+def test_int8_rejects_l2():
+    with pytest.raises(AssertionError):
+        Int8Index().build(dim=4, space="l2")
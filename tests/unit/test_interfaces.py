@@ -133,3 +133,37 @@ def test_vectorindex_minimal_lifecycle_and_query_shape():
     for r in res:
         assert set(r.keys()) == {"text", "meta", "score"}
         assert isinstance(r["score"], float)
+
+
+# ---- Hit ----
+
+def test_hit_reads_like_the_old_dict_and_resolves_lazily():
+    from rag.interfaces import Hit
+
+    class Rows(list):
+        reads = 0
+        def __getitem__(self, i):
+            Rows.reads += 1
+            return list.__getitem__(self, i)
+
+    rows = Rows([{"text": "a", "id": "x"}, {"text": "b", "id": "y", "source": "bls.md"}])
+    h = Hit(label=7, score=0.25, rows=rows, row=1)
+    assert Rows.reads == 0 and h.label == 7          # nothing decoded until asked
+
+    assert h["text"] == "b" and h.get("meta") == {"id": "y", "source": "bls.md"}
+    assert h == {"text": "b", "meta": {"id": "y", "source": "bls.md"}, "score": 0.25}
+    assert dict(h) == {"text": "b", "meta": {"id": "y", "source": "bls.md"}, "score": 0.25}
+    assert h.get("missing", 1) == 1 and "score" in h
+    reads = Rows.reads
+    h.text, h.meta                                     # cached after first access
+    assert Rows.reads == reads
+
+
+def test_hit_uses_meta_store_columns(tmp_path):
+    from rag.interfaces import Hit
+    from rag.meta_store import MetaStore
+
+    MetaStore.write(str(tmp_path), [{"text": "t0", "id": "a"}, {"text": "t1", "id": "b", "page": 3}])
+    store = MetaStore.open(str(tmp_path))
+    h = Hit(1, 0.5, store, 1)
+    assert (h.text, h.meta) == ("t1", {"id": "b", "page": 3})
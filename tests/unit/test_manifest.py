@@ -0,0 +1,98 @@
+# tests/unit/test_manifest.py
+import json
+
+import numpy as np
+import pytest
+
+from rag.indexer import HnswIndex
+from rag.manifest import MANIFEST_FILE, read_manifest, validate_manifest
+
+
+def _saved_index(tmp_path, embedder="model-a"):
+    idx = HnswIndex(ef_construction=50, M=8, ef=64)
+    idx.build(dim=3, space="cosine")
+    idx.embedder_name = embedder
+    idx.chunker = {"type": "paragraph", "target_chars": 400}
+    idx.upsert_array(np.eye(3, dtype=np.float32), [{"text": "A"}, {"text": "B"}, {"text": "C"}])
+    idx.save(str(tmp_path))
+    return idx
+
+
+def test_save_writes_manifest_with_params_and_checksums(tmp_path):
+    _saved_index(tmp_path)
+    m = read_manifest(str(tmp_path))
+
+    assert (m.dim, m.space, m.M, m.ef_construction, m.count) == (3, "cosine", 8, 50, 3)
+    assert m.embedder == "model-a"
+    assert m.chunker == {"type": "paragraph", "target_chars": 400}
+    assert "hnsw.bin" in m.files and "meta/text.bin" in m.files
+    assert all(len(f["sha256"]) == 64 for f in m.files.values())
+
+
+def test_hnsw_manifest_counts_live_rows_and_keeps_graph_elements(tmp_path):
+    idx = _saved_index(tmp_path)
+    idx.mark_deleted([1])
+    idx.save(str(tmp_path))
+    m = read_manifest(str(tmp_path))
+    assert m.count == 2 and m.params["elements"] == 3
+
+    loaded = HnswIndex()
+    loaded.load(str(tmp_path))  # checks the graph against params["elements"]
+    assert len(loaded.meta) == m.count
+    assert "B" not in [h["text"] for h in loaded.query([0.0, 1.0, 0.0], k=3)]
+
+
+def test_load_uses_manifest_without_header_row(tmp_path):
+    _saved_index(tmp_path)  # no _index_header anywhere in the metadata
+    idx = HnswIndex()
+    idx.load(str(tmp_path), embedder="model-a")
+
+    assert idx.dim == 3 and idx.M == 8
+    assert idx.query([0.0, 1.0, 0.0], k=1)[0]["text"] == "B"
+
+
+def test_load_refuses_other_embedder(tmp_path):
+    _saved_index(tmp_path)
+    with pytest.raises(ValueError, match="model-a"):
+        HnswIndex().load(str(tmp_path), embedder="model-b")
+
+
+def test_validate_detects_truncated_and_corrupted_files(tmp_path):
+    _saved_index(tmp_path)
+    text = tmp_path / "meta" / "text.bin"
+
+    text.write_bytes(text.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="size"):
+        validate_manifest(str(tmp_path))
+
+    text.write_bytes(b"X" + text.read_bytes())  # original size, different bytes
+    assert validate_manifest(str(tmp_path)) is not None  # cheap check passes
+    with pytest.raises(ValueError, match="checksum"):
+        validate_manifest(str(tmp_path), checksums=True)
+
+
+def test_no_manifest_is_not_an_error(tmp_path):
+    assert validate_manifest(str(tmp_path), embedder="x") is None
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps({"version": 99}))
+    with pytest.raises(ValueError, match="version"):
+        read_manifest(str(tmp_path))
+
+
+def test_write_manifest_rehashes_only_changed_files(tmp_path, monkeypatch):
+    import os
+    import rag.manifest as manifest_mod
+
+    _saved_index(tmp_path)
+    for rel in read_manifest(str(tmp_path)).files:  # written well before the next manifest
+        os.utime(tmp_path / rel, ns=(10**18, 10**18))
+    m = manifest_mod.write_manifest(str(tmp_path), read_manifest(str(tmp_path)))
+    before = dict(m.files)
+
+    hashed = []
+    real = manifest_mod.file_sha256
+    monkeypatch.setattr(manifest_mod, "file_sha256", lambda p, **kw: hashed.append(p) or real(p, **kw))
+    (tmp_path / "meta" / "text.bin").write_bytes(b"changed")
+    m = manifest_mod.write_manifest(str(tmp_path), m)
+    assert [os.path.relpath(p, tmp_path) for p in hashed] == [os.path.join("meta", "text.bin")]
+    assert validate_manifest(str(tmp_path), checksums=True) is not None
+    assert m.files["hnsw.bin"] == before["hnsw.bin"] and m.files["meta/text.bin"] != before["meta/text.bin"]
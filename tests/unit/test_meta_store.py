@@ -0,0 +1,44 @@
+# tests/unit/test_meta_store.py
+import numpy as np
+
+from rag.meta_store import MetaStore
+
+
+ROWS = [
+    {"_index_header": {"dim": 3, "space": "cosine"}, "text": ""},
+    {"id": "a1", "source": "docs/ü.md", "text": "Erste Hilfe: Notruf 112 wählen."},
+    {"id": 42, "text": "int id stays an int", "page": 3},
+    {"text": ""},
+]
+
+
+def test_roundtrip_preserves_rows_and_types(tmp_path):
+    MetaStore.write(str(tmp_path), ROWS)
+    store = MetaStore.open(str(tmp_path))
+
+    assert len(store) == len(ROWS)
+    assert list(store) == ROWS
+    assert store.text(1) == ROWS[1]["text"]
+    assert store[-1] == {"text": ""}
+
+
+def test_columns_are_memory_mapped(tmp_path):
+    MetaStore.write(str(tmp_path), ROWS)
+    store = MetaStore.open(str(tmp_path))
+
+    assert isinstance(store._text, np.memmap)
+    assert isinstance(store._text_off, np.memmap)
+    assert store._fixed["id"].dtype.kind == "S"
+
+
+def test_extend_after_open_and_rewrite(tmp_path):
+    MetaStore.write(str(tmp_path), ROWS[:2])
+    store = MetaStore.open(str(tmp_path))
+    store.extend([{"id": "b", "text": "new"}])
+
+    assert len(store) == 3
+    assert store[2]["text"] == "new"
+
+    MetaStore.write(str(tmp_path), store)  # overwrite while the old files are still mapped
+    again = MetaStore.open(str(tmp_path))
+    assert list(again) == ROWS[:2] + [{"id": "b", "text": "new"}]
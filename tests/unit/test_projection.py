@@ -0,0 +1,63 @@
+# tests/unit/test_projection.py
+import numpy as np
+import pytest
+
+from rag.projection import Projection, recall_at_k
+from rag.indexer import HnswIndex
+from rag.retriever import Retriever
+
+
+def _corpus(n=200, dim=32, rank=4, seed=0):
+    # vectors living (mostly) in a low-rank subspace -> PCA should keep neighbours
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, dim))
+    x = rng.normal(size=(n, rank)) @ basis + 0.01 * rng.normal(size=(n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_pca_projection_shapes_and_normalization():
+    x = _corpus()
+    p = Projection.fit_pca(x, out_dim=8)
+    y = p.apply(x)
+    assert y.shape == (200, 8) and y.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(y, axis=1), 1.0, rtol=1e-5)
+    # single vectors keep rank 1
+    assert p.apply(x[0]).shape == (8,)
+    assert recall_at_k(x, y, k=5) > 0.8
+
+
+def test_truncate_keeps_leading_dims():
+    p = Projection.truncate(4, 2)
+    np.testing.assert_allclose(p.apply(np.array([3.0, 4.0, 9.0, 9.0])), [0.6, 0.8])
+
+
+def test_recall_is_one_for_identical_vectors():
+    x = _corpus(n=50)
+    assert recall_at_k(x, x.copy(), k=5) == pytest.approx(1.0)
+
+
+def test_index_persists_projection_and_retriever_applies_it(tmp_path):
+    x = _corpus(n=60, dim=16)
+    p = Projection.fit_pca(x, out_dim=4)
+    idx = HnswIndex(ef_construction=50, M=8, ef=64)
+    idx.build(dim=4)
+    idx.projection = p
+    metas = [{"text": f"t{i}"} for i in range(len(x))]
+    metas[0]["_index_header"] = {"dim": 4, "space": "cosine", "projection": p.header()}
+    idx.upsert_array(p.apply(x), metas)
+    idx.save(str(tmp_path))
+    assert (tmp_path / "projection.npz").exists()
+
+    loaded = HnswIndex()
+    loaded.load(str(tmp_path))
+    assert loaded.projection is not None and loaded.projection.out_dim == 4
+    np.testing.assert_allclose(loaded.projection.apply(x[3]), p.apply(x[3]), rtol=1e-5)
+
+    class FullDimEmbedder:
+        def embed_one(self, text):
+            return x[int(text)].tolist()
+
+    r = Retriever(FullDimEmbedder(), loaded, k=1)
+    qv = r.embed_query("7")
+    assert len(qv) == 4
+    assert loaded.query(qv, k=1)[0]["text"] == "t7"
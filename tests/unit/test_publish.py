@@ -0,0 +1,38 @@
+# tests/unit/test_publish.py
+import os
+
+from rag.publish import (
+    CURRENT_FILE, VERSIONS_DIR, current_version, prune_versions, publish_version, resolve_index_dir, stage_version,
+)
+
+
+def test_unversioned_root_resolves_to_itself(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    assert resolve_index_dir(str(tmp_path)) == str(tmp_path)
+
+
+def test_stage_publish_and_resolve(tmp_path):
+    root = str(tmp_path)
+    v1 = stage_version(root)
+    (tmp_path / "x.bin").write_bytes(b"legacy")          # plain index files at the root
+    assert os.listdir(v1) == [] and current_version(root) is None   # staged, not visible yet
+
+    publish_version(root, v1)
+    assert resolve_index_dir(root) == os.path.join(root, VERSIONS_DIR, os.path.basename(v1))
+    assert not os.path.exists(os.path.join(root, CURRENT_FILE + ".tmp"))
+
+    # a staged copy of a plain root skips versions/ and CURRENT; files are shared, not copied
+    v2 = stage_version(root, base=root)
+    assert sorted(os.listdir(v2)) == ["x.bin"]
+    assert os.path.samefile(os.path.join(v2, "x.bin"), tmp_path / "x.bin")
+    assert v2 != v1 and resolve_index_dir(root).endswith(os.path.basename(v1))
+
+
+def test_prune_keeps_newest_and_current(tmp_path):
+    root = str(tmp_path)
+    versions = [stage_version(root) for _ in range(5)]
+    publish_version(root, versions[0])
+    removed = prune_versions(root, keep=2)
+    assert sorted(removed) == sorted(os.path.basename(v) for v in versions[1:3])
+    left = sorted(os.listdir(os.path.join(root, VERSIONS_DIR)))
+    assert left == sorted(os.path.basename(v) for v in (versions[0], versions[3], versions[4]))
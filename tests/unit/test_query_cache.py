@@ -0,0 +1,44 @@
+# tests/unit/test_query_cache.py
+from rag.query_cache import QueryVectorCache, normalize_query, embedder_id
+
+
+def test_normalize_query():
+    assert normalize_query("  What  do I\tdo NEXT? ") == "What do I do NEXT?"
+    assert normalize_query("CPR steps") != normalize_query("cpr steps")  # cased models differ
+
+
+def test_lru_eviction_order():
+    c = QueryVectorCache(max_size=2)
+    c.put("m", "a", [1.0])
+    c.put("m", "b", [2.0])
+    assert c.get("m", "a") == [1.0]   # "a" becomes most recent
+    c.put("m", "c", [3.0])            # evicts "b"
+    assert c.get("m", "b") is None
+    assert c.get("m", "c") == [3.0]
+    assert len(c) == 2
+
+
+def test_ttl_expiry(monkeypatch):
+    import rag.query_cache as qc
+    now = [100.0]
+    monkeypatch.setattr(qc.time, "monotonic", lambda: now[0])
+    c = QueryVectorCache(max_size=4, ttl=10.0)
+    c.put("m", "q", [1.0])
+    now[0] = 105.0
+    assert c.get("m", "q") == [1.0]
+    now[0] = 111.0
+    assert c.get("m", "q") is None
+
+
+def test_keys_are_per_model():
+    c = QueryVectorCache()
+    c.put("m1", "q", [1.0])
+    assert c.get("m2", "q") is None
+    assert c.stats()["misses"] == 1
+
+
+def test_embedder_id_prefers_model_name():
+    class E:
+        model_name = "mini"
+    assert embedder_id(E()) == "mini"
+    assert embedder_id(object()).startswith("object@")
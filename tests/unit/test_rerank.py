@@ -0,0 +1,70 @@
+# tests/unit/test_rerank.py
+import time
+
+import numpy as np
+import pytest
+
+from rag.interfaces import Hit
+from rag.rerank import CrossEncoderReranker, PairScoreCache
+
+
+class OverlapModel:
+    """Fake cross-encoder: score = shared words; records every predict() batch."""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.batches.append(list(pairs))
+        time.sleep(self.delay)
+        return np.asarray([len(set(q.lower().split()) & set(t.lower().split())) for q, t in pairs], dtype=np.float32)
+
+
+TEXTS = ["call 112 now", "place aed pads on the chest", "aed pads for a child go front and back", "stop the bleeding"]
+
+
+def _hits():
+    rows = [{"text": t} for t in TEXTS]
+    return [Hit(100 + i, 0.1 * i, rows, i) for i in range(len(TEXTS))]
+
+
+def test_rerank_scores_pairs_in_one_batch_and_caches_them():
+    model = OverlapModel()
+    r = CrossEncoderReranker(model=model)
+    out = r.rerank("AED pads child", _hits(), k=2)
+    assert [h.label for h in out] == [102, 101]
+    assert out[0].score == -3.0 and out[0].text == TEXTS[2]
+    assert len(model.batches) == 1 and len(model.batches[0]) == 4
+
+    # same question (normalized) again: all pairs from the cache, no model call
+    assert [h.label for h in r.rerank("  AED  pads child ", _hits(), k=2)] == [102, 101]
+    assert len(model.batches) == 1
+    # a new candidate costs one pair, not four
+    more = _hits() + [Hit(200, 0.5, [{"text": "aed pads child"}], 0)]
+    assert [h.label for h in r.rerank("AED pads child", more, k=2)] == [102, 200]  # ties: first-stage order
+    assert [len(b) for b in model.batches] == [4, 1]
+    assert r.stats()["cache_hits"] == 8
+
+
+def test_rerank_is_skipped_when_it_would_miss_the_deadline():
+    model = OverlapModel(delay=0.02)
+    r = CrossEncoderReranker(model=model, cache_size=0)
+    r.warm_up(n_pairs=2)                       # ~10 ms per pair
+    assert r.ms_per_pair >= 5.0
+    hits = _hits()
+    out = r.rerank("AED pads child", hits, k=2, deadline=time.monotonic() + 0.005)
+    assert [h.label for h in out] == [100, 101]   # first-stage order kept
+    assert len(model.batches) == 1 and r.stats()["skipped"] == 1
+    out = r.rerank("AED pads child", hits, k=2, deadline=time.monotonic() + 5.0)
+    assert [h.label for h in out] == [102, 101] and r.stats()["reranked"] == 1
+
+
+def test_pair_cache_evicts_least_recently_used():
+    c = PairScoreCache(max_size=2)
+    c.put_many([(("q", 1), 1.0), (("q", 2), 2.0)])
+    assert c.get_many([("q", 1)]) == [1.0]
+    c.put_many([(("q", 3), 3.0)])
+    assert c.get_many([("q", 1), ("q", 2), ("q", 3)]) == [1.0, None, 3.0]
+    with pytest.raises(AssertionError):
+        PairScoreCache(0)
@@ -1,4 +1,6 @@
 # tests/unit/test_retriever.py
+import time
+
 import pytest
 from rag.retriever import Retriever
 
@@ -76,3 +78,167 @@ def test_search_handles_empty_query_string():
     assert emb.calls == [""]
     assert idx.last_vector == [0.0, 1.0]
     assert out == [{"text": "docA", "meta": {"id": 1}, "score": 0.0}]
+
+
+def test_repeated_queries_hit_the_query_cache():
+    emb = DummyEmbedder()
+    idx = SpyIndex()
+    r = Retriever(embedder=emb, index=idx, k=1)
+
+    r.search("How deep are compressions?")
+    r.search("  How deep   are compressions? ")  # same question after normalization
+
+    assert emb.calls == ["How deep are compressions?"]
+    stats = r.query_cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_query_cache_is_invalidated_when_embedder_changes():
+    r = Retriever(embedder=DummyEmbedder(), index=SpyIndex(), k=1)
+    r.search("what next?")
+    assert len(r.query_cache) == 1
+
+    new_emb = DummyEmbedder()
+    r.embedder = new_emb
+    assert len(r.query_cache) == 0
+    r.search("what next?")
+    assert new_emb.calls == ["what next?"]
+
+
+def test_query_cache_can_be_disabled():
+    emb = DummyEmbedder()
+    r = Retriever(embedder=emb, index=SpyIndex(), k=1, query_cache_size=0)
+    r.search("a")
+    r.search("a")
+    assert emb.calls == ["a", "a"]
+    assert r.query_cache is None
+
+
+def test_search_many_embeds_once_and_returns_one_list_per_query():
+    class BatchEmbedder(DummyEmbedder):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def embed(self, texts):
+            self.batches.append(list(texts))
+            return super().embed(texts)
+
+    class BatchIndex(SpyIndex):
+        def query_batch(self, vectors, k=5):
+            self.last_batch = vectors
+            return [[{"text": f"hit-{int(v[0])}", "meta": {}, "score": 0.0}] for v in vectors]
+
+    emb = BatchEmbedder()
+    idx = BatchIndex()
+    r = Retriever(embedder=emb, index=idx)
+    r.search("ab")  # warms the query cache
+
+    out = r.search_many(["ab", "abc", "abcd", "abc"])
+
+    assert emb.batches == [["abc", "abcd"]]      # cached + duplicate queries not re-encoded
+    assert [hits[0]["text"] for hits in out] == ["hit-2", "hit-3", "hit-4", "hit-3"]
+    assert idx.last_batch.shape == (4, 2)
+
+
+def test_search_forwards_metadata_filter():
+    class FilterIndex(SpyIndex):
+        def query(self, vector, k=5, filter=None):
+            self.last_filter = filter
+            return super().query(vector, k)
+
+    idx = FilterIndex()
+    r = Retriever(embedder=DummyEmbedder(), index=idx)
+
+    r.search("hello", filter={"source": "bls.md"})
+    assert idx.last_filter == {"source": "bls.md"}
+    r.search_many(["a", "b"], filter={"source": "als.md"})   # no query_batch: per-query fallback
+    assert idx.last_filter == {"source": "als.md"}
+
+
+def test_hybrid_mode_fuses_bm25_with_dense_hits(tmp_path, monkeypatch):
+    import numpy as np
+    import rag.retriever as retriever_mod
+    from rag.indexer import FlatIndex
+    from rag.sparse import SparseIndex
+
+    texts = ["Place the AED pads on the chest.", "For a child, put one AED pad on the back.", "Call 112."]
+    idx = FlatIndex()
+    idx.build(dim=2)
+    idx.upsert_array(np.asarray([[1.0, 0.0], [0.0, 1.0], [1.0, 0.1]], dtype=np.float32),
+                     [{"text": t, "source": s} for t, s in zip(texts, ["a.md", "b.md", "a.md"])], labels=[7, 8, 9])
+    idx.sparse = SparseIndex.build(*idx.chunk_texts())
+    cfg = tmp_path / "rag.yaml"
+    monkeypatch.setattr(retriever_mod, "yaml_path", str(cfg))
+    r = Retriever(embedder=DummyEmbedder(), index=idx)   # query vectors ~ [len, 1]: chunk 7 is the dense top hit
+
+    cfg.write_text("retriever:\n  k: 2\n  mode: dense\n")
+    assert [h.label for h in r.search("AED pad placement child")] == [7, 9]
+    cfg.write_text("retriever:\n  k: 2\n  mode: hybrid\n  dense_weight: 0.5\n")
+    hits = r.search("AED pad placement child")
+    assert [h.label for h in hits] == [8, 7] and hits[0].text == texts[1]
+    assert hits[0].score < hits[1].score   # fused scores, lower is better like distances
+    assert [[h.label for h in hs] for hs in r.search_many(["AED pad placement child", "call"])] == [[8, 7], [9, 7]]
+    # BM25-only hits obey the filter and skip chunks deleted since the sparse index was built
+    assert [h.label for h in r.search("child", filter={"source": "a.md"})] == [9, 7]
+    idx.mark_deleted([8])
+    assert 8 not in [h.label for h in r.search("AED pad placement child")]
+
+
+def test_rerank_over_fetches_candidates_and_keeps_k(tmp_path, monkeypatch):
+    import rag.retriever as retriever_mod
+    from rag.rerank import CrossEncoderReranker
+
+    class Model:
+        def predict(self, pairs, batch_size=32, show_progress_bar=False):
+            return [float(t.startswith("best")) for _, t in pairs]
+
+    class ManyIndex(SpyIndex):
+        def query(self, vector, k=5):
+            super().query(vector, k)
+            return [{"text": ("best " if i == k - 1 else "") + f"doc{i}", "meta": {}, "score": float(i)} for i in range(k)]
+
+    cfg = tmp_path / "rag.yaml"
+    cfg.write_text("retriever:\n  k: 2\n  rerank: true\n  rerank_candidates: 8\n  rerank_model: fake\n")
+    monkeypatch.setattr(retriever_mod, "yaml_path", str(cfg))
+    idx = ManyIndex()
+    r = Retriever(embedder=DummyEmbedder(), index=idx, reranker=CrossEncoderReranker("fake", model=Model()))
+
+    out = r.search("which doc?")
+    assert idx.last_k == 8
+    assert [h["text"] for h in out] == ["best doc7", "doc0"] and out[0]["score"] == -1.0
+    # an expired deadline keeps the first-stage top-k
+    assert [h["text"] for h in r.search("other doc?", deadline=time.monotonic() - 1)] == ["doc0", "doc1"]
+
+
+def test_mmr_select_skips_near_duplicates():
+    import numpy as np
+    from rag.retriever import mmr_select
+
+    v = np.asarray([[1.0, 0.0, 0.0], [0.999, 0.045, 0.0], [0.99, 0.0, 0.1], [0.8, 0.0, 0.6], [0.0, 1.0, 0.0]])
+    q = np.asarray([1.0, 0.0, 0.3])
+    assert mmr_select(q, v, 2, lambda_=1.0) == [2, 0]      # relevance only: plain top-k by cosine
+    assert mmr_select(q, v, 3, lambda_=0.5) == [2, 3, 4]
+    assert sorted(mmr_select(q, v, 10)) == [0, 1, 2, 3, 4]
+
+
+def test_mmr_mode_returns_distinct_task_texts(tmp_path, monkeypatch):
+    import numpy as np
+    import rag.retriever as retriever_mod
+    from rag.indexer import FlatIndex
+
+    # CustomChunker-like data: three questions with the same task text, their vectors nearly equal
+    idx = FlatIndex()
+    idx.build(dim=2)
+    vecs = np.asarray([[1.0, 0.0], [1.0, 0.01], [1.0, 0.02], [0.7, 0.7], [0.0, 1.0]], dtype=np.float32)
+    texts = ["recovery position"] * 3 + ["check breathing", "call 112"]
+    idx.upsert_array(vecs, [{"text": t} for t in texts])
+    cfg = tmp_path / "rag.yaml"
+    monkeypatch.setattr(retriever_mod, "yaml_path", str(cfg))
+    r = Retriever(embedder=DummyEmbedder(), index=idx)   # "abc" -> [3, 1]
+
+    cfg.write_text("retriever:\n  k: 2\n")
+    assert [h["text"] for h in r.search("abc")] == ["recovery position"] * 2
+    cfg.write_text("retriever:\n  k: 2\n  mmr: true\n  mmr_lambda: 0.7\n  mmr_fetch: 3\n")
+    assert [h["text"] for h in r.search("abc")] == ["recovery position", "check breathing"]
+    assert [[h["text"] for h in hs] for hs in r.search_many(["abc"])] == [["recovery position", "check breathing"]]
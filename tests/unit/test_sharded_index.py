@@ -0,0 +1,109 @@
+# tests/unit/test_sharded_index.py
+import os
+
+import numpy as np
+import pytest
+
+from rag.indexer import FlatIndex, ShardedIndex, chunk_label, open_index
+
+
+def _corpus(n=240, dim=16, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _metas(n):
+    return [{"text": f"t{i}", "id": str(i), "source": f"doc{i % 8}.md"} for i in range(n)]
+
+
+def _labels(metas):
+    return [chunk_label(m["id"], m["source"]) for m in metas]
+
+
+@pytest.mark.parametrize("partition", ["hash", "source"])
+def test_sharded_flat_matches_single_flat_index(partition):
+    vecs, metas = _corpus(), _metas(240)
+    single, sharded = FlatIndex(), ShardedIndex(n_shards=3, partition=partition, shard_backend="flat")
+    for idx in (single, sharded):
+        idx.build(dim=16, space="cosine")
+        idx.upsert_array(vecs, metas, labels=_labels(metas))
+    if partition == "hash":
+        assert all(len(s.label_rows) for s in sharded.shards)   # every shard got rows
+
+    q = _corpus(4, seed=1)
+    for got, ref in zip(sharded.query_batch(q, k=7), single.query_batch(q, k=7)):
+        assert [h["text"] for h in got] == [h["text"] for h in ref]
+    f = {"source": ["doc1.md", "doc5.md"]}
+    assert sharded.query_array(q[0], k=5, filter=f) == single.query_array(q[0], k=5, filter=f)
+    sharded.close()
+
+
+def test_sharded_hnsw_small_shards_and_k_larger_than_corpus():
+    idx = ShardedIndex(n_shards=4, partition="hash", shard_backend="hnsw")
+    idx.build(dim=16, space="cosine")
+    vecs = _corpus(3)
+    idx.upsert_array(vecs, _metas(3))          # at least one shard stays empty
+    res = idx.query_array(vecs[1], k=10)
+    assert len(res) == 3 and res[0]["text"] == "t1"
+
+
+def test_sharded_replace_moves_label_and_delete():
+    idx = ShardedIndex(n_shards=4, partition="source", shard_backend="flat")
+    idx.build(dim=16, space="cosine")
+    vecs, metas = _corpus(40), _metas(40)
+    labels = _labels(metas)
+    idx.upsert_array(vecs, metas, labels=labels)
+
+    # same label, different source: must not stay behind in its old shard
+    idx.upsert_array(vecs[:1], [{"text": "t0b", "id": "0", "source": "doc3.md"}], labels=labels[:1])
+    assert [h["text"] for h in idx.query_array(vecs[0], k=2)][:1] == ["t0b"]
+    assert "t0" not in [h["text"] for h in idx.query_array(vecs[0], k=40)]
+    assert sum(s.has_label(labels[0]) for s in idx.shards) == 1
+
+    assert idx.mark_deleted([labels[0], labels[1], 12345]) == 2
+    assert not idx.has_label(labels[1])
+    assert len(idx.query_array(vecs[0], k=100)) == 38
+
+
+def test_sharded_save_load_and_independent_shards(tmp_path):
+    idx = ShardedIndex(n_shards=3, partition="source", shard_backend="hnsw")
+    idx.build(dim=16, space="cosine")
+    idx.embedder_name = "model-a"
+    vecs, metas = _corpus(90), _metas(90)
+    labels = _labels(metas)
+    idx.upsert_array(vecs, metas, labels=labels)
+    idx.save(str(tmp_path))
+
+    loaded = open_index(str(tmp_path), embedder="model-a")
+    assert isinstance(loaded, ShardedIndex) and loaded.partition == "source"
+    assert loaded.query_array(vecs[5], k=1)[0]["text"] == "t5"
+
+    # only the shard holding doc2.md is rewritten
+    s = loaded.shard_of(0, {"source": "doc2.md"})
+    files = {i: os.path.join(loaded.shard_dir(str(tmp_path), i), "hnsw.bin") for i in range(3)}
+    before = {i: os.stat(p).st_mtime_ns for i, p in files.items()}
+    loaded.mark_deleted([labels[2]])
+    loaded.save(str(tmp_path))
+    assert [i for i in range(3) if os.stat(files[i]).st_mtime_ns != before[i]] == [s]
+
+    # a shard is a complete index on its own and can be reloaded in place
+    shard = open_index(loaded.shard_dir(str(tmp_path), s))
+    assert not shard.has_label(labels[2]) and shard.embedder_name == "model-a"
+    loaded.load_shard(str(tmp_path), s)
+    assert "t2" not in [h["text"] for h in loaded.query_array(vecs[2], k=10)]
+
+
+def test_sharded_unlabeled_upsert_after_load_appends(tmp_path):
+    vecs = _corpus(30)
+    idx = ShardedIndex(n_shards=3, partition="hash", shard_backend="flat")
+    idx.build(dim=16, space="cosine")
+    idx.upsert_array(vecs[:20], [{"text": f"t{i}"} for i in range(20)])   # labels 0..19
+    idx.save(str(tmp_path))
+
+    loaded = open_index(str(tmp_path))
+    loaded.upsert_array(vecs[20:], [{"text": f"t{i}"} for i in range(20, 30)])
+    assert sum(len(s.label_rows) for s in loaded.shards) == 30
+    assert loaded.query_array(vecs[0], k=1)[0]["text"] == "t0"
+    assert loaded.query_array(vecs[25], k=1)[0]["text"] == "t25"
+    loaded.close()
+    idx.close()
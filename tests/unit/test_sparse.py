@@ -0,0 +1,70 @@
+# tests/unit/test_sparse.py
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from rag.sparse import SparseIndex, fuse, tokenize
+
+TEXTS = [
+    "Place one AED pad on the upper right chest and one below the left armpit.",
+    "For a child, place the AED pads front and back of the chest.",
+    "Give 30 chest compressions, then 2 rescue breaths.",
+    "Apply direct pressure to a bleeding wound.",
+    "Call 112 and ask for an AED.",
+]
+LABELS = [101, 102, 103, 104, 105]
+
+
+def _bm25(query, texts, k1=1.2, b=0.75):
+    docs = [Counter(tokenize(t)) for t in texts]
+    avg = sum(sum(d.values()) for d in docs) / len(docs)
+    out = []
+    for d in docs:
+        s = 0.0
+        for t in set(tokenize(query)):
+            df = sum(1 for x in docs if t in x)
+            if t in d:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                tf = d[t]
+                s += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * sum(d.values()) / avg))
+        out.append(s)
+    return out
+
+
+def test_search_matches_reference_bm25():
+    idx = SparseIndex.build(LABELS, TEXTS)
+    for q in ["AED pad placement child", "chest", "bleeding wound pressure", "the and of"]:
+        ref = _bm25(q, TEXTS)
+        want = sorted((i for i in range(len(TEXTS)) if ref[i] > 0), key=lambda i: (-ref[i], i))
+        labels, scores = idx.search(q, k=10)
+        assert labels.tolist() == [LABELS[i] for i in want]
+        np.testing.assert_allclose(scores, [ref[i] for i in want], rtol=1e-5)
+
+    labels, _ = idx.search("AED pad placement child", k=1)
+    assert labels.tolist() == [102]
+    assert idx.search("defibrillator", k=3)[0].size == 0
+
+
+def test_save_load_roundtrip_is_memory_mapped(tmp_path):
+    SparseIndex.build(LABELS, TEXTS).save(str(tmp_path))
+    assert SparseIndex.exists(str(tmp_path))
+    idx = SparseIndex.load(str(tmp_path))
+    assert isinstance(idx.weights, np.memmap) and len(idx) == 5
+    assert idx.search("rescue breaths", k=2)[0].tolist() == [103]
+    SparseIndex.remove(str(tmp_path))
+    assert not SparseIndex.exists(str(tmp_path))
+
+
+def test_fuse_rrf_and_weighted():
+    dense = [(1, 0.1), (2, 0.2), (3, 0.9)]   # distances
+    sparse = [(3, 9.0), (4, 5.0)]             # BM25
+    rrf = fuse(dense, sparse, "rrf", rrf_k=60)
+    assert [l for l, _ in rrf] == [3, 1, 2, 4]  # found by both sides wins; ties keep dense order
+    assert rrf[0][1] == pytest.approx(1 / 63 + 1 / 61)
+
+    only_dense = fuse(dense, sparse, "weighted", sparse_weight=0.0)
+    assert [l for l, _ in only_dense] == [1, 2, 3]
+    w = dict(fuse(dense, sparse, "weighted", dense_weight=1.0, sparse_weight=2.0))
+    assert w[3] == pytest.approx(0.0 + 2.0) and w[1] == pytest.approx(1.0) and w[4] == pytest.approx(0.0)
@@ -0,0 +1,61 @@
+# tests/unit/test_tuning.py
+import numpy as np
+import pytest
+
+from rag import tuning
+from rag.indexer import HnswIndex
+from rag.manifest import read_manifest, validate_manifest
+
+
+def _saved_index(tmp_path, n=600, dim=16, M=8):
+    x = np.random.default_rng(0).normal(size=(n, dim)).astype(np.float32)
+    idx = HnswIndex(M=M, ef_construction=100)
+    idx.build(dim=dim, space="cosine")
+    idx.upsert_array(x, [{"text": f"t{i}"} for i in range(n)])
+    idx.save(str(tmp_path))
+    return x
+
+
+def test_exact_topk_excludes_the_held_out_row():
+    v = np.eye(4, dtype=np.float32)
+    v[1] = [0.9, 0.1, 0.0, 0.0]
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+    labels = np.array([10, 11, 12, 13])
+    top = tuning.exact_topk("cosine", v, labels, v[[0]], k=2, exclude=np.array([0]))
+    assert top[0, 0] == 11 and 10 not in top[0]
+
+
+def test_pick_smallest_ef_meeting_target_then_fastest_M():
+    rows = [
+        tuning.TuneRow(8, 16, 0.90, 0.01, 0.02), tuning.TuneRow(8, 32, 0.96, 0.03, 0.05),
+        tuning.TuneRow(8, 64, 0.99, 0.05, 0.08), tuning.TuneRow(16, 16, 0.97, 0.02, 0.03),
+    ]
+    assert (tuning.pick(rows, 0.95).M, tuning.pick(rows, 0.95).ef) == (16, 16)
+    assert tuning.pick(rows[:3], 0.95).ef == 32
+    assert tuning.pick(rows, 0.999) is None
+
+
+def test_tune_index_writes_ef_used_on_load(tmp_path):
+    _saved_index(tmp_path)
+    s = tuning.tune_index(str(tmp_path), k=5, target_recall=0.9, efs=[8, 400], n_queries=50)
+
+    assert [(r.M, r.ef) for r in s["rows"]] == [(8, 8), (8, 400)]
+    assert s["rows"][1].recall == pytest.approx(1.0)
+    assert s["ef"] in (8, 400) and s["written"]
+    assert read_manifest(str(tmp_path)).params["ef"] == s["ef"]
+    validate_manifest(str(tmp_path), checksums=True)   # index files untouched
+
+    loaded = HnswIndex()
+    loaded.load(str(tmp_path))
+    assert loaded.ef == s["ef"]
+    pinned = HnswIndex(ef=77)                           # an explicit ef wins over the manifest
+    pinned.load(str(tmp_path))
+    assert pinned.ef == 77
+
+
+def test_tune_index_dry_run_and_question_queries(tmp_path):
+    x = _saved_index(tmp_path)
+    s = tuning.tune_index(str(tmp_path), k=3, efs=[200], Ms=[8, 12], queries=x[:20] + 0.01, write=False)
+    assert [r.M for r in s["rows"]] == [8, 12]
+    assert s["queries"] == "20 queries" and "written" not in s
+    assert read_manifest(str(tmp_path)).params["ef"] == 128